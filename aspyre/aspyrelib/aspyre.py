@@ -7,28 +7,167 @@ author: Alix Chagué
 date: 19/03/2021
 """
 
+import json
 import os
+import shutil
 import time
+from contextlib import contextmanager
 
-from tqdm import tqdm
-
-from .utils import utils
-from .manage import (manage_tkbtoes, manage_pdfaltotoes, manage_limbtoes, zip)
+from .utils import (utils, metrics, profiling, isolation, logger, progress, distributed, scratch, scheduler, shm,
+                    storage)
+from .manage import (manage_tkbtoes, manage_pdfaltotoes, manage_limbtoes, zip, check, stream, sidecar, validation)
 
 SUPPORTED_SCENARIOS = ["tkb", "pdfalto", "limb"]  # + ["finereader"]
+SUPPORTED_ENGINES = ["soup", "model"]
 ARCHIVE_EXTENSIONS = ["zip"]
+DISTRIBUTED_ROLES = ["coordinate", "work", "merge"]
 
 
 class AspyreArgs():
     def add_log(self, msg):
-        """Append a timed execution message to self.log"""
-        self.log.append(f"{time.ctime()}: {msg}")
+        """Record a timed execution message (see self.log)"""
+        self.logger.log(msg, channel="run", console=False)
+
+    @property
+    def log(self):
+        """Timed execution messages (the most recent ones, the history is bounded)"""
+        return [f"{time.ctime(record['time'])}: {record['message']}" for record in self.logger.entries("run")]
 
     def proceed(self):
         """return True if self.execution_status is 'Running'"""
         return self.execution_status == "Running"
 
-    def __init__(self, scenario=None, source=None, destination=None, talkative=False, test_type=False, vpadding=0):
+    @contextmanager
+    def stage(self, name):
+        """Context manager timing (and profiling, if activated) a stage of the transformation scenario
+
+        :param name: name of the stage
+        :type name: str
+        """
+        with self.metrics.stage(name):
+            if self.profiler is None:
+                yield
+            else:
+                with self.profiler.stage(name):
+                    yield
+
+    @contextmanager
+    def page(self, file):
+        """Context manager wrapping the conversion of a file ("page" stage)
+
+        :param file: path to the file being converted
+        :type file: str
+        """
+        with self.stage("page"):
+            if self.profiler is None:
+                yield
+            else:
+                with self.profiler.page(file):
+                    yield
+
+    def scratch_space(self):
+        """Return the job's scratch space, created on first use (see scratch.ScratchSpace)"""
+        if self.scratch is None:
+            self.scratch = scratch.ScratchSpace(self.scratch_root)
+            self.add_log(f"Scratch space created: {self.scratch.path}")
+        return self.scratch
+
+    def isolate_output(self):
+        """Write the transformed files in the job's scratch space (self.destination points there) until
+        publish_output(), so jobs sharing a destination never read nor pack each other's files"""
+        if self.output_destination is not None:
+            return
+        try:
+            staging = self.scratch_space().join("output")
+        except Exception as e:
+            self.execution_status = "Failed"
+            self.add_log(f"Couldn't create the scratch space: {e}")
+            utils.report(f"Couldn't create the scratch space, Apsyre can't proceed: {e}\n---", "E")
+            return
+        self.output_destination, self.destination = self.destination, staging
+
+    def publish_output(self):
+        """Move the transformed files from the job's scratch space to the destination (one atomic rename per file)"""
+        if self.output_destination is None:
+            return
+        staging, self.destination, self.output_destination = self.destination, self.output_destination, None
+        if os.path.isdir(staging):
+            try:
+                if storage.is_remote(self.destination):
+                    moved = storage.put_files(staging, self.destination)
+                else:
+                    moved = scratch.publish_files(staging, self.destination)
+            except Exception as e:
+                self.execution_status = "Failed"
+                self.add_log(f"Failed to move the transformed files to {self.destination}: {e}")
+                utils.report(f"Failed to move the transformed files to {self.destination}: {e}\n---", "E")
+            else:
+                self.add_log(f"Moved {moved} transformed file(s) to {self.destination}.")
+
+    def release_scratch(self):
+        """Publish the transformed files, then remove the job's scratch space and the intermediate files in it"""
+        self.publish_output()
+        if self.scratch is not None and self.scratch.alive:
+            self.scratch.cleanup()
+            self.add_log(f"Scratch space removed: {self.scratch.path}")
+
+    def conclude(self):
+        """Release the scratch space and write the reports, also when the scenario was interrupted by an error
+
+        The reports are written even if releasing the scratch space fails;
+        an interrupted run is recorded as failed.
+        """
+        if self.proceed():
+            self.execution_status = "Failed"
+            self.add_log("The transformation scenario was interrupted.")
+        try:
+            self.release_scratch()
+        finally:
+            self.write_reports()
+
+    def write_reports(self):
+        """Stop the metrics and write the run report, Prometheus textfile and profiling reports if requested"""
+        self.metrics.stop()
+        self.logger.flush()
+        info = {}
+        used = storage.usage(since=self.storage_usage)
+        if used["requests"]:
+            info["storage"] = used
+            self.add_log(f"Object store: {info['storage']['requests']} request(s), "
+                         f"{info['storage']['bytes_read']} byte(s) read, {info['storage']['bytes_written']} written.")
+        if self.report:
+            try:
+                self.metrics.write_json(self.report, scenario=self.scenario, source=self.source,
+                                        destination=self.destination, status=self.execution_status, **info)
+            except Exception as e:
+                utils.report(f"Failed to write run report to {self.report}: {e}", "W")
+            else:
+                self.add_log(f"Run report written to {self.report}.")
+        if self.prometheus:
+            try:
+                self.metrics.write_prometheus(self.prometheus, scenario=self.scenario,
+                                              success=self.execution_status == "Finished")
+            except Exception as e:
+                utils.report(f"Failed to write Prometheus textfile to {self.prometheus}: {e}", "W")
+            else:
+                self.add_log(f"Prometheus textfile written to {self.prometheus}.")
+        if self.profiler is not None:
+            try:
+                self.profiler.dump(self.profile)
+                summary = profiling.write_summary(self.profile)
+            except Exception as e:
+                utils.report(f"Failed to write profiling reports to {self.profile}: {e}", "W")
+            else:
+                self.add_log(f"Profiling reports written to {self.profile}.")
+                if self.talkative:
+                    utils.report(f"Profiling summary: {summary}", "I")
+
+    def __init__(self, scenario=None, source=None, destination=None, talkative=False, test_type=False, vpadding=0,
+                 report=None, prometheus=None, profile=None, profile_memory=False, engine="soup",
+                 shard_pages=None, shard_bytes=None, check=False, workers=None, timeout=None, max_memory=None,
+                 log_file=None, log_level="info", progress_callback=None, include_images=False,
+                 distributed_role=None, shared=None, unit_pages=500, lease=300, scratch=None, job_name=None,
+                 sidecars=None, update_archive=False, store_root=None, validate=False, schema=None):
         """Process essentiel information to run Aspyre
 
         :param scenario: keyword describing the scenario
@@ -43,17 +182,136 @@ class AspyreArgs():
         :type test_type: bool
         :param vpadding: value to add to VPOS attributes in String nodes (PDFALTO scenario)
         :type vpadding: int
+        :param report: path to a JSON file where the run report will be written
+        :type report: str or None
+        :param prometheus: path to a Prometheus textfile (.prom) where the run metrics will be written
+        :type prometheus: str or None
+        :param profile: path to a directory where per-stage profiling reports will be written
+        :type profile: str or None
+        :param profile_memory: also record peak allocation per page and per stage (with profile only)
+        :type profile_memory: bool
+        :param engine: representation of the pages during the transformation, "soup" (BeautifulSoup tree) or
+                       "model" (compact page model, only keeps the elements eScriptorium needs)
+        :type engine: str
+        :param shard_pages: split the output archive in several archives of at most shard_pages pages
+        :type shard_pages: int or None
+        :param shard_bytes: split the output archive in several archives of at most shard_bytes bytes of XML
+        :type shard_bytes: int or None
+        :param check: only check that the source archive is ready to be converted (nothing is unpacked nor written
+                      apart from a readiness report)
+        :type check: bool
+        :param workers: convert the pages in this many isolated worker processes, "auto" to choose it from the
+                        available cores and memory (default with timeout or max_memory)
+        :type workers: int or str or None
+        :param timeout: maximum time spent on a page (s), the page is recorded as failed past this limit
+                        (pages run in isolated workers)
+        :type timeout: float or None
+        :param max_memory: maximum memory a worker can add, above what it uses once started, to convert a page (MiB) (pages run in isolated workers)
+        :type max_memory: int or None
+        :param log_file: path to a file where every message is written (JSON lines)
+        :type log_file: str or None
+        :param log_level: minimum level of the messages displayed in the console ("debug|info|warning|error")
+        :type log_level: str
+        :param progress_callback: function called with a snapshot of the progress of the run (dict: pages and
+                                  bytes done and to do, throughput, ETA...), at most every 0.5s
+        :type progress_callback: function or None
+        :param include_images: also put the images paired with the transformed files in the output archive
+                               (copied from a zip source without being recompressed)
+        :type include_images: bool
+        :param distributed_role: run one step of a distributed job ("coordinate|work|merge"), see Coordinator,
+                                 DistributedWorker and Merger; source and scenario default to the job's
+                                 for "work" and "merge"
+        :type distributed_role: str or None
+        :param shared: path to the directory shared by the coordinator, the workers and the merge step
+        :type shared: str or None
+        :param unit_pages: number of pages per work unit (coordinator)
+        :type unit_pages: int
+        :param lease: duration of a worker's lease on a work unit, renewed while it converts (s)
+        :type lease: float
+        :param scratch: directory where the job's intermediate files (unpacked source) are written, in a
+                        private directory removed at the end of the job (default: the system's temporary
+                        directory), ex: /dev/shm or a local SSD
+        :type scratch: str or None
+        :param job_name: name added to the outputs (default destination alto_escriptorium_<job_name>, archive
+                         aspyre_<source>_<job_name>.zip), so conversions of the same source can run side by side
+        :type job_name: str or None
+        :param sidecars: also write line-level data next to each transformed file, extracted from the page in
+                         memory: "text" (<page>.lines.jsonl) and/or "geometry" (<page>.geometry.npz)
+        :type sidecars: list or None
+        :param update_archive: if the output archive already exists, only add the files which are new or changed
+                               instead of writing it again (see zip.update_zip())
+        :type update_archive: bool
+        :param store_root: directory holding the buckets of the (emulated) object store, for sources and
+                           destinations given as store://<bucket>/<key> (default: $ASPYRE_STORE_ROOT)
+        :type store_root: str or None
+        :param validate: validate each transformed file against the ALTO schema right after it is converted, the
+                         invalid pages are recorded in the run report (see validation.validate_file())
+        :type validate: bool
+        :param schema: path to the XSD file used to validate (default: the bundled ALTO 4 schema)
+        :type schema: str or None
         """
         if test_type == True:
             self.execution_status = "Debug"
         else:
-            self.log = []
+            self.logger = logger.get_logger()
+            if isinstance(log_level, str) and log_level.lower() in logger.LEVELS:
+                self.logger.configure(level=log_level, file=log_file)
+            else:
+                self.logger.configure(file=log_file)
+                utils.report(f"{log_level} is not a valid log level, using 'info'.", "W")
             self.add_log("Creation")
+            self.check = check
+            self.include_images = include_images
+            self.update_archive = update_archive
+            self.store_root = store_root
+            if store_root:
+                storage.configure(store_root)
+            # the object store counters are process-wide, the run reports what it used since now
+            self.storage_usage = storage.usage()
+            self.scratch_root = scratch
+            self.scratch = None
+            self.output_destination = None
+            self.progress = progress.Progress()
+            if progress_callback is not None:
+                self.progress.subscribe(progress_callback)
+            self.metrics = metrics.RunMetrics()
+            self.report = report
+            self.prometheus = prometheus
+            self.profile = profile
+            if self.profile:
+                profiling.prepare_folder(self.profile)
+                self.profiler = profiling.StageProfiler(allocations=profile_memory)
+            else:
+                self.profiler = None
 
             # parsing talkative
             self.talkative = talkative
             if self.talkative:
                 utils.report("Talkative mode activated.\n---", "H")
+                self.progress.subscribe(progress.ConsoleDisplay())
+
+            # parsing distributed options
+            self.distributed_role = distributed_role
+            self.shared = shared
+            self.unit_pages = unit_pages
+            self.lease = lease
+            self.manifest = None
+            if distributed_role is not None:
+                if distributed_role not in DISTRIBUTED_ROLES or not shared:
+                    self.add_log(f"{distributed_role} is not a valid distributed role or no shared directory given.")
+                    source = None
+                elif not all(isinstance(v, (int, float)) and v > 0 for v in (unit_pages, lease)):
+                    self.add_log(f"unit_pages ({unit_pages}) and lease ({lease}) must be positive numbers.")
+                    source = None
+                elif distributed_role != "coordinate":
+                    try:
+                        self.manifest = distributed.read_manifest(shared)
+                    except Exception as e:
+                        self.add_log(f"Couldn't read the manifest in {shared}: {e}")
+                        source = None
+                    else:
+                        source = source or self.manifest["source"]
+                        scenario = scenario or self.manifest["scenario"]
 
             # parsing source
             self.source = source
@@ -63,15 +321,31 @@ class AspyreArgs():
             else:
                 self.execution_status = 'Running'
 
+            # parsing job name
+            self.job_name = job_name
+            if job_name is not None and not (isinstance(job_name, str) and job_name
+                                             and all(c.isalnum() or c in "._-" for c in job_name)):
+                self.add_log(f"{job_name} is not a valid job name (letters, digits, '.', '_' and '-' only).")
+                self.execution_status = "Failed"
+            output_folder = 'alto_escriptorium' if job_name is None else f'alto_escriptorium_{job_name}'
+
             if self.proceed():
                 # parsing destination
+                if stream.is_stream_archive(source):
+                    source_base = stream.strip_extension(source)
+                else:
+                    source_base = '.'.join(source.split(".")[:-1])
                 if not destination:
-                    self.destination = os.path.join('.'.join(source.split(".")[:-1]), 'alto_escriptorium')
+                    self.destination = os.path.join(source_base, output_folder)
                     self.add_log(f"Destination set to {self.destination}.")
                 else:
                     self.destination = destination
-                    if not utils.path_is_valid(self.destination):
-                        destination = os.path.join('.'.join(source.split(".")[:-1]), 'alto_escriptorium')
+                    if storage.is_remote(self.destination):
+                        if not storage.is_dir(self.destination):
+                            self.add_log(f"{destination} is not in a bucket of the object store.")
+                            self.execution_status = "Failed"
+                    elif not utils.path_is_valid(self.destination):
+                        destination = os.path.join(source_base, output_folder)
                         self.add_log(f"{destination} is not valid. Output is sent to default location.")
                         self.add_log(f"Output destination is now {self.destination}")
                         if talkative:
@@ -91,6 +365,81 @@ class AspyreArgs():
             else:
                 self.scenario = None
 
+            if self.proceed():
+                # parsing engine
+                if isinstance(engine, type(str())) and engine.lower() in SUPPORTED_ENGINES:
+                    self.engine = engine.lower()
+                else:
+                    self.engine = None
+                    self.add_log(f"{engine} is not a valid engine.")
+                    self.execution_status = "Failed"
+            else:
+                self.engine = None
+
+            if self.proceed():
+                # parsing sidecars
+                self.sidecars = [kind.lower() for kind in sidecars or []]
+                unknown = [kind for kind in self.sidecars if kind not in sidecar.SIDECAR_KINDS]
+                if unknown:
+                    self.add_log(f"{', '.join(unknown)}: not valid sidecar(s) (expected {sidecar.SIDECAR_KINDS}).")
+                    self.execution_status = "Failed"
+            else:
+                self.sidecars = []
+
+            if self.proceed():
+                # parsing validation: the schema is compiled before workers are forked, they inherit it
+                self.validate = validate
+                self.schema = schema or validation.BUNDLED_SCHEMA
+                if validate:
+                    try:
+                        with self.stage("compile_schema"):
+                            validation.get_schema(self.schema)
+                    except Exception as e:
+                        self.add_log(f"Couldn't compile the ALTO schema {self.schema}: {e}")
+                        self.execution_status = "Failed"
+                    else:
+                        self.add_log(f"Transformed files will be validated against {self.schema}.")
+            else:
+                self.validate, self.schema = False, None
+
+            if self.proceed():
+                # parsing shard limits
+                self.shard_pages = shard_pages
+                self.shard_bytes = shard_bytes
+                for option, value in (("shard_pages", shard_pages), ("shard_bytes", shard_bytes)):
+                    if value is not None and (not isinstance(value, int) or value <= 0):
+                        self.add_log(f"{value} is not a valid value for {option} (expected a positive integer).")
+                        self.execution_status = "Failed"
+            else:
+                self.shard_pages = None
+                self.shard_bytes = None
+
+            # parsing isolation options
+            self.workers = None
+            self.timeout = timeout
+            self.max_memory = max_memory
+            if self.proceed():
+                for option, value in (("workers", workers), ("timeout", timeout), ("max_memory", max_memory)):
+                    if option == "workers" and value == "auto":
+                        continue
+                    if value is not None and (not isinstance(value, (int, float)) or value <= 0):
+                        self.add_log(f"{value} is not a valid value for {option} (expected a positive number).")
+                        self.execution_status = "Failed"
+            if self.proceed() and (workers or timeout or max_memory):
+                if isolation.isolation_available():
+                    if workers in (None, "auto"):
+                        # chosen once the size of the pages is known (see scheduler.choose_workers())
+                        self.workers = "auto"
+                        self.add_log("Pages will be converted in isolated workers, as many as the cores and "
+                                     "memory available allow.")
+                    else:
+                        self.workers = int(workers)
+                        self.add_log(f"Pages will be converted in {self.workers} isolated worker(s).")
+                else:
+                    self.add_log("Isolated workers are not available on this platform, pages run in-process.")
+                    utils.report("Isolated workers are not available on this platform: timeout and memory limit "
+                                 "are ignored.\n---", "W")
+
             if self.proceed():
                 # parsing vpadding
                 # only valid with PDFALTO scenario
@@ -112,6 +461,618 @@ class AspyreArgs():
                         utils.report(f"No modification made to y-axis coords in string nodes\n---", "H")
 
 
+def convert_page(scenario_obj, handle_a_file, file):
+    """Run a scenario's handle_a_file() on one file and describe the outcome
+
+    :param scenario_obj: object running a transformation scenario (with an args attribute)
+    :type scenario_obj: TkbToEs or PdfaltoToEs or LimbToEs
+    :param handle_a_file: function transforming one file, returning the path to the output (None if skipped)
+    :type handle_a_file: function
+    :param file: path to the file to transform
+    :type file: str
+    :return: outcome of the conversion
+    :rtype: isolation.PageResult
+    """
+    args = scenario_obj.args
+    start = time.perf_counter()
+    try:
+        with args.page(file):
+            output = handle_a_file(file, scenario_obj)
+    except Exception as e:
+        if args.talkative:
+            utils.report(f"===[!]===\nError while processing {file} :\n{e}", "E")
+        reason = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+        return isolation.PageResult(file, "failed", reason=reason, duration=time.perf_counter() - start)
+    status = "skipped" if output is None else "processed"
+    result = isolation.PageResult(file, status, output=output, duration=time.perf_counter() - start)
+    if output is not None and args.validate:
+        validate_output(args, result)
+    return result
+
+
+def validate_output(args, result):
+    """Validate the transformed file of a page against the ALTO schema (in the process which converted it)
+    and record the outcome in the metrics
+
+    :param args: essential information to run transformation scenario
+    :type args: AspyreArgs
+    :param result: outcome of the conversion of the page
+    :type result: isolation.PageResult
+    :return: None
+    """
+    try:
+        with args.stage("validate"):
+            errors = validation.validate_file(result.output, args.schema)
+    except Exception as e:
+        errors = [f"Couldn't validate the file: {e}"]
+    args.metrics.pages_validated += 1
+    if errors:
+        # the output directory of the run is a scratch space until the end: the path is relative to it
+        output = os.path.relpath(result.output, args.destination)
+        args.metrics.invalid.append({"page": result.file, "output": output, "errors": errors})
+        utils.report(f"{os.path.basename(result.output)} is not valid ALTO ({errors[0]})", "W")
+
+
+def record_page(args, result):
+    """Update the execution log and the metrics with the outcome of a page
+
+    :param args: essential information to run transformation scenario
+    :type args: AspyreArgs
+    :param result: outcome of the conversion of a page
+    :type result: isolation.PageResult
+    :return: None
+    """
+    if result.metrics is not None:
+        # counters and messages collected in a worker process
+        args.metrics.merge(result.metrics)
+    if result.log:
+        args.logger.absorb(result.log)
+    if result.status == "failed":
+        args.add_log(f"Failed to process {result.file} ({result.reason}).")
+        args.metrics.pages_failed += 1
+        args.metrics.failures.append({"page": result.file, "reason": result.reason})
+    elif result.status == "skipped":
+        args.add_log(f"Skipped {result.file}.")
+        args.metrics.pages_skipped += 1
+    else:
+        args.metrics.pages_processed += 1
+
+
+def page_warnings(records):
+    """Return the warning and error messages among log records"""
+    return [record["message"] for record in records if record["level"] >= logger.LEVELS["warning"]]
+
+
+def isolated_conversion(scenario_obj, handle_a_file):
+    """Return the functions run in isolated workers to convert the pages of a scenario (see isolation.iter_isolated())
+
+    convert(file, page=None) returns the outcome of a page with the metrics and the log records collected while
+    it was converted. page is given for a page read from a stream: (handle, images), the page is read from shared
+    memory (see shm.serve_page(), handle is None for a page unpacked in the scratch space) and the images it is
+    paired with, read after the worker started, are added to the worker's image files.
+
+    :param scenario_obj: object running a transformation scenario (with an args attribute)
+    :type scenario_obj: TkbToEs or PdfaltoToEs or LimbToEs
+    :param handle_a_file: function transforming one file, returning the path to the output (None if skipped)
+    :type handle_a_file: function
+    :return: convert, initializer, finalizer
+    :rtype: tuple
+    """
+    args = scenario_obj.args
+    allocations = args.profiler.allocations if args.profiler is not None else False
+
+    def initializer():
+        # a fresh profiler per worker, dumped in the profiling folder when the worker exits
+        if args.profiler is not None:
+            args.profiler = profiling.StageProfiler(allocations=allocations)
+
+    def finalizer():
+        if args.profiler is not None:
+            args.profiler.dump(args.profile)
+        # workers exit without running atexit handlers
+        args.logger.close()
+
+    known_images = set()
+
+    def convert(file, page=None):
+        if page is not None:
+            handle, images = page
+            if not known_images:
+                known_images.update(scenario_obj.image_files)
+            for image in images:
+                if image not in known_images:
+                    known_images.add(image)
+                    scenario_obj.image_files.append(image)
+            if handle is None:
+                return convert(file)
+            with shm.serve_page(file, handle):
+                return convert(file)
+        args.metrics = metrics.RunMetrics()
+        mark = args.logger.mark()
+        result = convert_page(scenario_obj, handle_a_file, file)
+        args.logger.flush()
+        result.metrics = args.metrics
+        result.log = args.logger.records_since(mark)
+        return result
+
+    return convert, initializer, finalizer
+
+
+def isolated_workers(args, sizes=None):
+    """Return the number of isolated workers to start and the memory limit of each of them
+
+    :param args: essential information to run transformation scenario
+    :type args: AspyreArgs
+    :param sizes: sizes of the pages (bytes), None if they aren't known yet (see scheduler.choose_workers())
+    :type sizes: list or None
+    :return: number of workers, memory limit (bytes, None if there is none)
+    :rtype: tuple
+    """
+    max_memory = int(args.max_memory * 1024 * 1024) if args.max_memory else None
+    workers = args.workers
+    if workers == "auto":
+        workers, per_worker = scheduler.choose_workers(sizes, args.engine, max_memory)
+        args.add_log(f"{workers} isolated worker(s) chosen for {scheduler.available_cores()} core(s) "
+                     f"and ~{per_worker / 1048576:.0f} MiB per worker.")
+    return workers, max_memory
+
+
+def iter_files(scenario_obj, handle_a_file, warnings=False, units=None):
+    """Run a scenario's handle_a_file() on each ALTO XML file and yield the outcome of each page
+
+    With args.workers set, each file is converted in an isolated worker process, under args.timeout
+    and args.max_memory: a page which hangs or crashes its worker is recorded as failed and the
+    worker is replaced. The largest pages are started first and the small ones are sent to the
+    workers in batches (see scheduler.plan_tasks()). The metrics and the progress are updated
+    before each page is yielded.
+
+    Independent units (ex: the documents of a Transkribus export, each with its own image files and
+    destination) can be converted together: with workers, their pages share the pool, so the units
+    are converted concurrently.
+
+    :param scenario_obj: object running a transformation scenario (with args and alto_files attributes)
+    :type scenario_obj: TkbToEs or PdfaltoToEs or LimbToEs
+    :param handle_a_file: function transforming one file, returning the path to the output (None if skipped)
+    :type handle_a_file: function
+    :param warnings: collect the warning and error messages of each page (result.warnings)
+    :type warnings: bool
+    :param units: objects whose ALTO XML files are converted (default: [scenario_obj])
+    :type units: list or None
+    :return: generator of isolation.PageResult, in completion order
+    :rtype: generator
+    """
+    args = scenario_obj.args
+    units = units or [scenario_obj]
+    unit_of, sizes = {}, {}
+    for unit in units:
+        for file in unit.alto_files:
+            unit_of[file] = unit
+            try:
+                sizes[file] = os.path.getsize(file)
+            except OSError:
+                sizes[file] = 0
+    args.logger.flush()
+    args.progress.start(len(unit_of), sum(sizes.values()), description="Processing ALTO XML files")
+
+    if args.workers:
+        conversions = {id(unit): isolated_conversion(unit, handle_a_file) for unit in units}
+        _, initializer, finalizer = conversions[id(units[0])]
+
+        def convert(file):
+            return conversions[id(unit_of[file])][0](file)
+
+        workers, max_memory = isolated_workers(args, list(sizes.values()))
+        tasks = scheduler.plan_tasks(list(unit_of), sizes, workers)
+        for result in isolation.iter_isolated(tasks, convert, workers=workers,
+                                              timeout=args.timeout, max_memory=max_memory,
+                                              initializer=initializer, finalizer=finalizer):
+            if warnings:
+                result.warnings = page_warnings(result.log or [])
+            finish_page(args, result, sizes.get(result.file, 0))
+            yield result
+    else:
+        for file, unit in unit_of.items():
+            mark = args.logger.mark()
+            result = convert_page(unit, handle_a_file, file)
+            if warnings:
+                result.warnings = page_warnings(args.logger.records_since(mark))
+            finish_page(args, result, sizes.get(file, 0))
+            yield result
+
+
+def convert_files(scenario_obj, handle_a_file, units=None):
+    """Run a scenario's handle_a_file() on each ALTO XML file and update the execution status accordingly
+    (see iter_files())
+
+    :param scenario_obj: object running a transformation scenario (with args and alto_files attributes)
+    :type scenario_obj: TkbToEs or PdfaltoToEs or LimbToEs
+    :param handle_a_file: function transforming one file, returning the path to the output (None if skipped)
+    :type handle_a_file: function
+    :param units: objects whose ALTO XML files are converted (default: [scenario_obj])
+    :type units: list or None
+    :return: None
+    """
+    args = scenario_obj.args
+    processed_before = args.metrics.pages_processed
+    for _ in iter_files(scenario_obj, handle_a_file, units=units):
+        pass
+    total = sum(len(unit.alto_files) for unit in units) if units else len(scenario_obj.alto_files)
+    conclude_conversion(args, args.metrics.pages_processed - processed_before, total)
+
+
+def finish_page(args, result, size=0):
+    """Record the outcome of a page and advance the progress of the run
+
+    :param args: essential information to run transformation scenario
+    :type args: AspyreArgs
+    :param result: outcome of the conversion of a page
+    :type result: isolation.PageResult
+    :param size: size of the page (bytes)
+    :type size: int
+    :return: None
+    """
+    if result.status == "failed" and args.talkative and result.metrics is None:
+        utils.report(f"===[!]===\nFailed to process {result.file}: {result.reason}", "E")
+    record_page(args, result)
+    args.logger.flush()
+    args.progress.advance(result.file, size, result.status)
+
+
+def conclude_conversion(args, processed, total):
+    """Update the execution status once every page was handled
+
+    :param args: essential information to run transformation scenario
+    :type args: AspyreArgs
+    :param processed: number of pages successfully transformed
+    :type processed: int
+    :param total: number of pages
+    :type total: int
+    :return: None
+    """
+    if processed == 0:
+        args.execution_status = "Failed"
+    elif processed < total:
+        args.add_log(f"Successfully transformed {processed} out of {total}")
+    else:
+        args.add_log(f"Successfully processed sources files!")
+
+
+def unpack_source(args):
+    """Unzip the source archive in the job's scratch space, once controlled there is room enough for it
+
+    :param args: essential information to run transformation scenario
+    :type args: AspyreArgs
+    :return: False if failed, else path to the unzipped source
+    :rtype: bool or str
+    """
+    try:
+        workspace = args.scratch_space()
+        workspace.ensure_space(scratch.required_space(args.source, args.scenario))
+    except Exception as e:
+        utils.report(f"Can't unpack the source in the scratch space: {e}\n---", "E")
+        return False
+    return zip.unzip_scenario(args.source, args.scenario,
+                              unpack_dest=workspace.join(os.path.basename(zip.unpack_destination(args.source))))
+
+
+def iter_stream(scenario_obj, handle_a_file, warnings=False):
+    """Read a tar archive as a stream, convert each ALTO XML file as soon as the files it is paired with
+    have been read (tkb: mets.xml, pdfalto and limb: the image) and yield the outcome of each page
+
+    Sets scenario_obj's unzipped_source, alto_files and image_files. Pages still waiting for their pair
+    at the end of the archive are converted last. A Transkribus archive must hold a single document (at its
+    root or in a directory): with several, the run fails. Pages are converted in-process or, with args.workers,
+    in isolated workers (see iter_files()) reading the pages in shared memory: ALTO XML files aren't
+    written in the scratch space, the reader puts them in segments recycled from one page to the next
+    (see shm.SegmentPool) and the archive is read as workers become idle. If the archive can't be read,
+    args.execution_status is set to "Failed" and the generator stops.
+
+    :param scenario_obj: object running a transformation scenario (with an args attribute)
+    :type scenario_obj: TkbToEs or PdfaltoToEs or LimbToEs
+    :param handle_a_file: function transforming one file, returning the path to the output (None if skipped)
+    :type handle_a_file: function
+    :param warnings: collect the warning and error messages of each page (result.warnings)
+    :type warnings: bool
+    :return: generator of isolation.PageResult, in conversion order
+    :rtype: generator
+    """
+    args = scenario_obj.args
+    scenario_obj.alto_files, scenario_obj.image_files = [], []
+    try:
+        workspace = args.scratch_space()
+        workspace.ensure_space(scratch.required_space(args.source, args.scenario))
+    except Exception as e:
+        args.execution_status = "Failed"
+        args.add_log(f"Can't unpack the source in the scratch space: {e}")
+        utils.report(f"Can't unpack the source in the scratch space, Apsyre can't proceed: {e}\n---", "E")
+        return
+    scenario_obj.unzipped_source = workspace.join(os.path.basename(zip.unpack_destination(args.source)))
+    os.makedirs(scenario_obj.unzipped_source, exist_ok=True)
+    args.logger.flush()
+    args.progress.start(0, 0, description="Processing ALTO XML files", open_ended=True)
+    sizes = {}
+    segments = shm.SegmentPool() if args.workers else None
+    handles = {}
+
+    def load(name, path, fh, size):
+        # with workers, ALTO XML files go to shared memory rather than to the scratch space
+        if segments is None or stream.classify(name, args.scenario) != "alto":
+            return False
+        try:
+            handles[path] = segments.load(fh, size)
+        except OSError as e:
+            # no room left in shared memory: the page goes to the scratch space instead
+            args.add_log(f"Couldn't hand {name} over in shared memory, unpacking it: {e}")
+            return False
+        return True
+
+    def ready_pages():
+        pending, mets_found, document = [], False, None
+        members = stream.iter_unpack(args.source, scenario_obj.unzipped_source, args.scenario, load=load)
+        try:
+            while True:
+                with args.stage("unzip"):
+                    member = next(members, None)
+                if member is None:
+                    break
+                name, path, size = member
+                kind = stream.classify(name, args.scenario)
+                if args.scenario == "tkb" and kind is not None:
+                    # pages are converted as they are read, to a single destination
+                    if document is None:
+                        document = stream.document_of(name)
+                    elif stream.document_of(name) != document:
+                        raise ValueError(f"it holds several Transkribus documents ('{document}' and "
+                                         f"'{stream.document_of(name)}'), convert them from a zip archive")
+                if kind == "mets":
+                    mets_found = True
+                    scenario_obj.image_files += manage_tkbtoes.get_list_of_source_images([path])
+                elif kind == "image":
+                    scenario_obj.image_files.append(path)
+                elif kind == "alto":
+                    scenario_obj.alto_files.append(path)
+                    sizes[path] = size
+                    pending.append(path)
+                    args.progress.expect(1, size)
+                if kind is not None and pending:
+                    ready = [f for f in pending if stream.page_is_ready(f, scenario_obj.image_files, args.scenario)]
+                    for file in ready:
+                        pending.remove(file)
+                        yield file
+        except Exception as e:
+            args.progress.finish()
+            args.execution_status = "Failed"
+            args.add_log(f"Something went wrong while reading the source archive: {e}")
+            utils.report(f"Failing at reading the archive, Apsyre can't proceed: {e}\n---", "E")
+            return
+        if args.scenario == "tkb" and not mets_found:
+            pending = []
+            utils.report("This is not a valid Transkribus Archive (not mets.xml file)", "E")
+        elif len(scenario_obj.alto_files) == 0:
+            utils.report("Found no eligible XML file.\n---", "E")
+        # the pairing functions report the pages which are still missing their pair
+        for file in pending:
+            yield file
+
+    if args.workers:
+        convert, initializer, finalizer = isolated_conversion(scenario_obj, handle_a_file)
+        workers, max_memory = isolated_workers(args)
+        try:
+            # workers are forked as pages are ready: each page comes with the images read since then
+            pages = ((file, (handles.pop(file, None),
+                             stream.paired_files(file, scenario_obj.image_files, args.scenario)))
+                     for file in ready_pages())
+            for result in isolation.iter_isolated(pages, convert, workers=workers, timeout=args.timeout,
+                                                  max_memory=max_memory, initializer=initializer,
+                                                  finalizer=finalizer, release=lambda page: segments.release(page[0])):
+                if warnings:
+                    result.warnings = page_warnings(result.log or [])
+                finish_page(args, result, sizes.get(result.file, 0))
+                yield result
+        finally:
+            args.add_log(f"Pages handed over to the workers in {segments.created} shared memory segment(s), "
+                         f"reused {segments.reused} time(s).")
+            segments.close()
+    else:
+        for file in ready_pages():
+            mark = args.logger.mark()
+            result = convert_page(scenario_obj, handle_a_file, file)
+            if warnings:
+                result.warnings = page_warnings(args.logger.records_since(mark))
+            finish_page(args, result, sizes[file])
+            yield result
+    if args.execution_status == "Failed":
+        return
+    args.progress.finish()
+    args.add_log(f"Read source archive as a stream, unpacked here: '{scenario_obj.unzipped_source}'")
+
+
+def convert_stream(scenario_obj, handle_a_file):
+    """Read a tar archive as a stream, convert its ALTO XML files as they are read and update the execution
+    status accordingly (see iter_stream())
+
+    :param scenario_obj: object running a transformation scenario (with an args attribute)
+    :type scenario_obj: TkbToEs or PdfaltoToEs or LimbToEs
+    :param handle_a_file: function transforming one file, returning the path to the output (None if skipped)
+    :type handle_a_file: function
+    :return: None
+    """
+    args = scenario_obj.args
+    processed_before = args.metrics.pages_processed
+    for _ in iter_stream(scenario_obj, handle_a_file):
+        pass
+    if args.proceed():
+        conclude_conversion(args, args.metrics.pages_processed - processed_before, len(scenario_obj.alto_files))
+
+
+def page_image(scenario, file, image_files):
+    """Return the image an ALTO XML file is paired with, as each scenario pairs them
+
+    :param scenario: keyword describing the scenario
+    :param file: path to the ALTO XML file
+    :param image_files: image files (tkb: image file names listed in mets.xml)
+    :type scenario: str
+    :type file: str
+    :type image_files: list
+    :return: (image file name (tkb) or path, image name written in the transformed file), (None, None) if unpaired
+    :rtype: tuple
+    """
+    try:
+        if scenario == "tkb":
+            image = arcname = manage_tkbtoes.get_image_filename(file, image_files)
+        elif scenario == "pdfalto":
+            image, arcname = manage_pdfaltotoes.get_image_filename(file, image_files).split("||")
+        else:
+            image, arcname = manage_limbtoes.get_image_filename(file, image_files).split("||")
+    except Exception:
+        return None, None
+    if image in (None, "None") or not arcname:
+        return None, None
+    return image, arcname
+
+
+def collect_images(scenario_obj, unit=None):
+    """Pair each transformed ALTO XML file with its image, to put them in the output archive
+
+    With a zip source, the images are referenced by their member name in the source archive so they can be
+    copied without being recompressed. Otherwise they are referenced by their path on disk (not available
+    for tkb: images are not unpacked in this scenario).
+
+    :param scenario_obj: object running a transformation scenario (with args, alto_files and image_files attributes)
+    :type scenario_obj: TkbToEs or PdfaltoToEs or LimbToEs
+    :param unit: document of a multi-document export whose images are collected (default: scenario_obj's)
+    :type unit: WorkUnit or None
+    :return: XML file name -> (image member name or path, image name in the archive), path to the source zip file
+             (None if the images are paths)
+    :rtype: tuple
+    """
+    args = scenario_obj.args
+    unit = unit or scenario_obj
+    destination = getattr(unit, "destination", None) or args.destination
+    # path of the document in the source archive, to tell apart images of the same name in several documents
+    prefix = ""
+    if unit is not scenario_obj:
+        prefix = os.path.relpath(unit.unzipped_source, scenario_obj.unzipped_source).replace(os.sep, "/") + "/"
+    from_zip = args.source.split(".")[-1] in ARCHIVE_EXTENSIONS
+    if args.scenario == "tkb" and not from_zip:
+        utils.report("Images can only be added to the output archive from a zip source in Transkribus scenario.", "W")
+        return {}, None
+    if from_zip:
+        with zip.open_zip(args.source) as zph:
+            members = zph.namelist()
+        by_basename = {}
+        for member in members:
+            by_basename.setdefault(member.split("/")[-1], member)
+        members = set(members)
+    images = {}
+    for file in unit.alto_files:
+        xml_name = os.path.basename(file)
+        if not os.path.isfile(os.path.join(destination, xml_name)):
+            continue  # failed or skipped page
+        image, arcname = page_image(args.scenario, file, unit.image_files)
+        if from_zip and image is not None:
+            if args.scenario == "tkb":
+                image = prefix + image if prefix + image in members else by_basename.get(image)
+            else:
+                image = os.path.relpath(image, scenario_obj.unzipped_source).replace(os.sep, "/")
+                image = image if image in members else None
+        if image is None:
+            utils.report(f"No image to add to the output archive for {xml_name}", "W")
+            continue
+        images[xml_name] = (image, arcname)
+    return images, args.source if from_zip else None
+
+
+def zip_output(scenario_obj, units=None):
+    """Pack the transformed files (and their images if args.include_images is set) in one or several zip files
+
+    :param scenario_obj: object running a transformation scenario
+    :type scenario_obj: TkbToEs or PdfaltoToEs or LimbToEs
+    :param units: documents of a multi-document export, packed in an archive each (aspyre_<source>_<document>.zip)
+    :type units: list or None
+    :return: path to the created zip file (to the shard index if the output was split), list of them with units
+    :rtype: str or list
+    """
+    args = scenario_obj.args
+    final_destination = args.output_destination or args.destination
+    update, remote_dir = args.update_archive, None
+    if storage.is_remote(final_destination):
+        # the archive is written in the scratch space, then uploaded next to the destination
+        remote_dir = storage.parent(final_destination)
+        output_dir = args.scratch_space().join("archives")
+        if update:
+            utils.report("Archives in the object store can't be updated in place, writing them again.\n---", "W")
+            update = False
+    else:
+        # the archive goes next to the (final) destination, even while the files are in the scratch space
+        output_dir = os.path.dirname(os.path.normpath(final_destination))
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    base = os.path.basename(scenario_obj.unzipped_source).replace('_unpacking', '')
+    if args.job_name:
+        base = f"{base}_{args.job_name}"
+    if units:
+        archives = []
+        for unit in units:
+            if not os.path.isdir(unit.destination):
+                utils.report(f"No transformed file in document {unit.name}, no archive for it.\n---", "W")
+                continue
+            images, image_source = None, None
+            if args.include_images:
+                images, image_source = collect_images(scenario_obj, unit)
+            archives.append(zip.zip_dir(unit.destination, scenario_obj.unzipped_source, shard_pages=args.shard_pages,
+                                        shard_bytes=args.shard_bytes, images=images, image_source=image_source,
+                                        output_dir=output_dir, name=f"{base}_{unit.name}", update=update))
+    else:
+        images, image_source = None, None
+        if args.include_images:
+            images, image_source = collect_images(scenario_obj)
+        archives = zip.zip_dir(args.destination, scenario_obj.unzipped_source, shard_pages=args.shard_pages,
+                               shard_bytes=args.shard_bytes, images=images, image_source=image_source,
+                               output_dir=output_dir, name=base if args.job_name else None, update=update)
+    if remote_dir is not None:
+        uploaded = storage.put_files(output_dir, remote_dir)
+        utils.report(f"Uploaded {uploaded} file(s) to: {remote_dir}\n---", "I")
+        args.add_log(f"Uploaded the output archive(s) to {remote_dir}.")
+
+        def remote(path):
+            return path and storage.join(remote_dir, *os.path.relpath(path, output_dir).split(os.sep))
+
+        archives = [remote(path) for path in archives] if units else remote(archives)
+    return archives
+
+
+def tkb_documents(scenario_obj, documents):
+    """Collect the pages of each document of a multi-document Transkribus export in a work unit of its own
+
+    The transformed files of a document go to a subdirectory of the destination named after it (see
+    manage_tkbtoes.document_names()). Documents without image references or ALTO XML files are skipped.
+
+    :param scenario_obj: object running the Transkribus scenario (with args and unzipped_source attributes)
+    :type scenario_obj: TkbToEs
+    :param documents: absolute paths to the documents' directories (see manage_tkbtoes.find_documents())
+    :type documents: list
+    :return: documents to convert
+    :rtype: list of WorkUnit
+    """
+    args = scenario_obj.args
+    units = []
+    names = manage_tkbtoes.document_names(documents, scenario_obj.unzipped_source)
+    for index, document in enumerate(documents):
+        name = names[index]
+        package = utils.list_directory(document)
+        image_files = manage_tkbtoes.extract_mets(package, document)
+        alto_files = manage_tkbtoes.locate_alto_files(package, document)
+        if not image_files or not alto_files:
+            utils.report(f"Skipping document {name}: no image referenced in its mets.xml or no ALTO XML file.\n---",
+                         "W")
+            args.add_log(f"Skipped document {name} (no image reference or no ALTO XML file).")
+            continue
+        units.append(WorkUnit(args, alto_files, image_files, document,
+                              destination=os.path.join(args.destination, name), name=name))
+    return units
+
+
 class TkbToEs():
     def show_warning(self):
         """Display a message."""
@@ -129,79 +1090,79 @@ class TkbToEs():
         if isinstance(args, type(AspyreArgs(test_type=True))):
             self.args = args
             self.args.add_log("Starting Transkribus transformation scenario.")
+            try:
+                self.args.isolate_output()
 
-            # 1. handling zip
-            self.unzipped_source = None
-            if self.args.source.split(".")[-1] in ARCHIVE_EXTENSIONS:
-                if self.args.talkative:
-                    utils.report("Source is an archive, running unzipping scenario.\n---", "H")
-                self.unzipped_source = zip.unzip_scenario(self.args.source, self.args.scenario)
-                if self.unzipped_source is False:
-                    self.args.execution_status = "Failed"
-                    self.add_log("Something went wrong while unpacking the source.")
-                    utils.report("Failing at unpacking the archive, Apsyre can't proceed.\n---", "E")
-                else:
-                    self.args.add_log("Successfully unzipped source.")
-            else:
-                if self.args.talkative:
-                    utils.report("Source is not an archive.\n---", "H")
-
-            if self.args.proceed():
-                # 2. collecting data
-                package = utils.list_directory(self.unzipped_source)
-                self.image_files = manage_tkbtoes.extract_mets(package, self.unzipped_source)
-                self.alto_files = manage_tkbtoes.locate_alto_files(package, self.args.source)
-
-                if len(self.image_files) == 0:
-                    self.add_log("There is no reference to images in the METS XML file you provided.")
-                    self.add_log("Make sure to check the \"Export Image\" option in Transkribus.")
-                    self.args.execution_status = 'Failed'
+                # 1. handling zip
+                self.unzipped_source = None
+                streamed = stream.is_stream_archive(self.args.source)
+                if streamed:
                     if self.args.talkative:
-                        utils.report("Aspyre can't pair unreferenced images with the ALTO XML files", "E")
-                        utils.report("Interrupting execution!", "E")
-                elif self.alto_files is False:
-                    self.args.add_log("Couldn't find any ALTO XML file.")
-                    utils.report("Aspyre can't run Transkribus scenario without ALTO XML files.\n---", "E")
-                    self.args.execution_status = "Failed"
+                        utils.report("Source is a tar archive, converting its files as they are read.\n---", "H")
+                    convert_stream(self, manage_tkbtoes.handle_a_file)
+                elif self.args.source.split(".")[-1] in ARCHIVE_EXTENSIONS:
+                    if self.args.talkative:
+                        utils.report("Source is an archive, running unzipping scenario.\n---", "H")
+                    with self.args.stage("unzip"):
+                        self.unzipped_source = unpack_source(self.args)
+                    if self.unzipped_source is False:
+                        self.args.execution_status = "Failed"
+                        self.args.add_log("Something went wrong while unpacking the source.")
+                        utils.report("Failing at unpacking the archive, Apsyre can't proceed.\n---", "E")
+                    else:
+                        self.args.add_log("Successfully unzipped source.")
                 else:
-                    self.args.add_log("Successfully collected data.\n---")
+                    if self.args.talkative:
+                        utils.report("Source is not an archive.\n---", "H")
 
-            if self.args.proceed():
-                # 3. transforming files
-                if self.args.talkative:
-                    iterator = tqdm(self.alto_files, desc="Processing ALTO XML files", unit=' file')
-                else:
-                    iterator = self.alto_files
-                for file in iterator:
-                    processed = 0
-                    try:
-                        manage_tkbtoes.handle_a_file(file, self)
-                    except Exception as e:
+                self.units = None
+                if self.args.proceed() and not streamed:
+                    # 2. collecting data
+                    documents = manage_tkbtoes.find_documents(self.unzipped_source)
+                    if len(documents) > 1:
+                        self.units = tkb_documents(self, documents)
+                        self.image_files = [image for unit in self.units for image in unit.image_files]
+                        self.alto_files = [file for unit in self.units for file in unit.alto_files] or False
+                        self.args.add_log(f"Found {len(documents)} documents in the export, "
+                                          f"{len(self.units)} to convert.")
+                    else:
+                        package = utils.list_directory(documents[0] if documents else self.unzipped_source)
+                        self.image_files = manage_tkbtoes.extract_mets(package, self.unzipped_source)
+                        self.alto_files = manage_tkbtoes.locate_alto_files(package, self.args.source)
+
+                    if not self.image_files:
+                        self.args.add_log("There is no reference to images in the METS XML file you provided.")
+                        self.args.add_log("Make sure to check the \"Export Image\" option in Transkribus.")
+                        self.args.execution_status = 'Failed'
                         if self.args.talkative:
-                            utils.report(f"===[!]===\nError while processing {file} :", "E")
-                            print(e)
-                        self.args.add_log(f"Failed to process {file}.")
+                            utils.report("Aspyre can't pair unreferenced images with the ALTO XML files", "E")
+                            utils.report("Interrupting execution!", "E")
+                    elif self.alto_files is False:
+                        self.args.add_log("Couldn't find any ALTO XML file.")
+                        utils.report("Aspyre can't run Transkribus scenario without ALTO XML files.\n---", "E")
+                        self.args.execution_status = "Failed"
                     else:
-                        processed += 1
-                if processed == 0:
-                    self.args.execution_status = "Failed"
-                elif processed < len(self.alto_files):
-                    self.args.add_log(f"Successfully transformed {processed} out of {len(self.alto_files)}")
-                else:
-                    self.args.add_log(f"Successfully processed sources files!")
+                        self.args.add_log("Successfully collected data.\n---")
+
+                if self.args.proceed() and not streamed:
+                    # 3. transforming files
+                    convert_files(self, manage_tkbtoes.handle_a_file, units=self.units)
 
                 if self.args.proceed():
                     # 4. serve a zip file
                     try:
-                        zip.zip_dir(self.args.destination, self.unzipped_source)
+                        with self.args.stage("zip"):
+                            zip_output(self, units=self.units)
                     except Exception as e:
                         if self.args.talkative:
-                            print(e)
+                            utils.report(f"Failed to zip output: {e}", "E")
                         self.args.execution_status = "Failed"
                         self.args.add_log('Failed to zip output.')
                     else:
                         self.args.execution_status = 'Finished'
                         self.args.add_log('Aspyre ran Transkribus scenario successufully!')
+            finally:
+                self.args.conclude()
         else:
             self.args = None
             utils.report("===[!]===\nFailed to run TkbToEs: args must be an AspyreArgs object!", "E")
@@ -217,88 +1178,62 @@ class PdfaltoToEs():
         if isinstance(args, type(AspyreArgs(test_type=True))):
             self.args = args
             self.args.add_log("Starting PDFALTO transformation scenario.")
+            try:
+                self.args.isolate_output()
 
-            # TODO gérer les tar.gz?
-            """
-            https://stackoverflow.com/questions/30887979/i-want-to-create-a-script-for-unzip-tar-gz-file-via-python
-
-            import tarfile
-
-            if fname.endswith("tar.gz"):
-                tar = tarfile.open(fname, "r:gz")
-                tar.extractall()
-                tar.close()
-            elif fname.endswith("tar"):
-                tar = tarfile.open(fname, "r:")
-                tar.extractall()
-                tar.close()
-            """
-
-            # 1. handling zip
-            self.unzipped_source = None
-            if self.args.source.split(".")[-1] in ARCHIVE_EXTENSIONS:
-                if self.args.talkative:
-                    utils.report("Source is an archive, running unzipping scenario.\n---", "H")
-                self.unzipped_source = zip.unzip_scenario(self.args.source, self.args.scenario)
-                if self.unzipped_source is False:
-                    self.args.execution_status = "Failed"
-                    self.add_log("Something went wrong while unpacking the source.")
-                    utils.report("Failing at unpacking the archive, Apsyre can't proceed.\n---", "E")
+                # 1. handling zip
+                self.unzipped_source = None
+                streamed = stream.is_stream_archive(self.args.source)
+                if streamed:
+                    if self.args.talkative:
+                        utils.report("Source is a tar archive, converting its files as they are read.\n---", "H")
+                    convert_stream(self, manage_pdfaltotoes.handle_a_file)
+                elif self.args.source.split(".")[-1] in ARCHIVE_EXTENSIONS:
+                    if self.args.talkative:
+                        utils.report("Source is an archive, running unzipping scenario.\n---", "H")
+                    with self.args.stage("unzip"):
+                        self.unzipped_source = unpack_source(self.args)
+                    if self.unzipped_source is False:
+                        self.args.execution_status = "Failed"
+                        self.args.add_log("Something went wrong while unpacking the source.")
+                        utils.report("Failing at unpacking the archive, Apsyre can't proceed.\n---", "E")
+                    else:
+                        self.args.add_log("Successfully unzipped source.\n---")
                 else:
-                    self.args.add_log("Successfully unzipped source.\n---")
-            else:
-                if self.args.talkative:
-                    utils.report("Source is not an archive.\n---", "H")
+                    if self.args.talkative:
+                        utils.report("Source is not an archive.\n---", "H")
 
-            if self.args.proceed():
-                # 2. collecting data
-                package = utils.list_directory(self.unzipped_source)
-                self.alto_files, self.image_files = manage_pdfaltotoes.locate_alto_and_image_files(package)
-                if self.alto_files is False:
-                    self.args.add_log("Couldn't find any XML file or any image file.")
-                    utils.report("Aspyre can't run without either of these.\n---", "E")
-                    self.args.execution_status = "Failed"
-                else:
-                    self.args.add_log("Successfully collected data.")
+                if self.args.proceed() and not streamed:
+                    # 2. collecting data
+                    package = utils.list_directory(self.unzipped_source)
+                    self.alto_files, self.image_files = manage_pdfaltotoes.locate_alto_and_image_files(package)
+                    if self.alto_files is False:
+                        self.args.add_log("Couldn't find any XML file or any image file.")
+                        utils.report("Aspyre can't run without either of these.\n---", "E")
+                        self.args.execution_status = "Failed"
+                    else:
+                        self.args.add_log("Successfully collected data.")
 
-            if self.args.proceed():
-                # 3. transforming files
-                if self.args.talkative:
-                    iterator = tqdm(self.alto_files, desc="Processing ALTO XML files", unit=' file')
-                else:
-                    iterator = self.alto_files
-                for file in iterator:
-                    processed = 0
+                if self.args.proceed() and not streamed:
+                    # 3. transforming files
+                    convert_files(self, manage_pdfaltotoes.handle_a_file)
+
+                if self.args.proceed():
+                    # 4. serve a zip file
                     try:
-                        manage_pdfaltotoes.handle_a_file(file, self)
+                        with self.args.stage("zip"):
+                            zip_output(self)
                     except Exception as e:
                         if self.args.talkative:
-                            utils.report(f"Error while processing {file} :", "E")
-                            print(e)
-                        self.args.add_log(f"Failed to process {file}.")
+                            utils.report(f"Failed to zip output: {e}", "E")
+                        self.args.execution_status = "Failed"
+                        self.args.add_log('Failed to zip output.')
                     else:
-                        processed += 1
-                if processed == 0:
-                    self.args.execution_status = "Failed"
-                elif processed < len(self.alto_files):
-                    self.args.add_log(f"Successfully transformed {processed} out of {len(self.alto_files)}")
-                else:
-                    self.args.add_log(f"Successfully processed sources files!")
-
-            if self.args.proceed():
-                # 4. serve a zip file
-                try:
-                    zip.zip_dir(self.args.destination, self.unzipped_source)
-                except Exception as e:
-                    if self.args.talkative:
-                        print(e)
-                    self.args.execution_status = "Failed"
-                    self.args.add_log('Failed to zip output.')
-                else:
-                    utils.report("Task completed ✓", "S")
-                    self.args.execution_status = 'Finished'
-                    self.args.add_log('Aspyre ran PDFALTO scenario successufully!')
-
+                        utils.report("Task completed ✓", "S")
+                        self.args.execution_status = 'Finished'
+                        self.args.add_log('Aspyre ran PDFALTO scenario successufully!')
+            finally:
+                self.args.conclude()
         else:
             self.args = None
             utils.report("Failed to run PdfaltoToEs: args must be an AspyreArgs object!\n===[!]===", "E")
@@ -314,73 +1249,564 @@ class LimbToEs():
         if isinstance(args, type(AspyreArgs(test_type=True))):
             self.args = args
             self.args.add_log("Starting LIMB transformation scenario.")
+            try:
+                self.args.isolate_output()
 
-            # 1. handling zip
-            self.unzipped_source = None
-            if self.args.source.split(".")[-1] in ARCHIVE_EXTENSIONS:
-                if self.args.talkative:
-                    utils.report("Source is an archive, running unzipping scenario.\n---", "H")
-                self.unzipped_source = zip.unzip_scenario(self.args.source, self.args.scenario)
-                if self.unzipped_source is False:
-                    self.args.execution_status = "Failed"
-                    self.add_log("Something went wrong while unpacking the source.")
-                    utils.report("Failing at unpacking the archive, Apsyre can't proceed.\n---", "E")
+                # 1. handling zip
+                self.unzipped_source = None
+                streamed = stream.is_stream_archive(self.args.source)
+                if streamed:
+                    if self.args.talkative:
+                        utils.report("Source is a tar archive, converting its files as they are read.\n---", "H")
+                    convert_stream(self, manage_limbtoes.handle_a_file)
+                elif self.args.source.split(".")[-1] in ARCHIVE_EXTENSIONS:
+                    if self.args.talkative:
+                        utils.report("Source is an archive, running unzipping scenario.\n---", "H")
+                    with self.args.stage("unzip"):
+                        self.unzipped_source = unpack_source(self.args)
+                    if self.unzipped_source is False:
+                        self.args.execution_status = "Failed"
+                        self.args.add_log("Something went wrong while unpacking the source.")
+                        utils.report("Failing at unpacking the archive, Apsyre can't proceed.\n---", "E")
+                    else:
+                        self.args.add_log("Successfully unzipped source.\n---")
                 else:
-                    self.args.add_log("Successfully unzipped source.\n---")
+                    if self.args.talkative:
+                        utils.report("Source is not an archive.\n---", "H")
+
+                if self.args.proceed() and not streamed:
+                    # 2. collecting data
+                    package = utils.list_directory(self.unzipped_source)
+                    self.alto_files, self.image_files = manage_limbtoes.locate_alto_and_image_files(package)
+
+                    if self.alto_files is False:
+                        self.args.add_log("Couldn't find any XML file or any image file.")
+                        utils.report("Aspyre can't run without either of these.\n---", "E")
+                        self.args.execution_status = "Failed"
+                    else:
+                        self.args.add_log("Successfully collected data.")
+
+                if self.args.proceed() and not streamed:
+                    # 3. transforming files
+                    convert_files(self, manage_limbtoes.handle_a_file)
+
+                if self.args.proceed():
+                    # 4. serve a zip file
+                    try:
+                        with self.args.stage("zip"):
+                            zip_output(self)
+                    except Exception as e:
+                        if self.args.talkative:
+                            utils.report(f"Failed to zip output: {e}", "E")
+                        self.args.execution_status = "Failed"
+                        self.args.add_log('Failed to zip output.')
+                    else:
+                        utils.report("Task completed ✓", "S")
+                        self.args.execution_status = 'Finished'
+                        self.args.add_log('Aspyre ran Limb scenario successufully!')
+            finally:
+                self.args.conclude()
+        else:
+            self.args = None
+            utils.report("Failed to run LimbToEs: args must be an AspyreArgs object!\n===[!]===", "E")
+
+
+class CheckArchive():
+    def __init__(self, args):
+        """Check that a source archive is ready to be converted, without unpacking it nor converting any file
+
+        The readiness report (one record per page) is written as aspyre_<name>_check.json,
+        where the output archive would be created.
+
+        :param args: essential information to run transformation scenario
+        :type args: AspyreArgs object
+        """
+        if isinstance(args, type(AspyreArgs(test_type=True))):
+            self.args = args
+            self.args.add_log(f"Checking source archive for {self.args.scenario} scenario.")
+            self.report = None
+            self.report_path = None
+            if self.args.source.split(".")[-1] not in ARCHIVE_EXTENSIONS:
+                self.args.execution_status = "Failed"
+                self.args.add_log("Only archives can be checked.")
+                utils.report("Check mode only works on archives.\n---", "E")
             else:
+                try:
+                    self.report = check.check_archive(self.args.source, self.args.scenario, args=self.args)
+                except Exception as e:
+                    self.args.execution_status = "Failed"
+                    self.args.add_log(f"Failed to check the source archive: {e}")
+                    utils.report(f"Failed to check the source archive: {e}\n---", "E")
+
+            if self.report is not None:
+                summary = self.report["summary"]
+                self.args.metrics.pages_processed += summary["ready"]
+                self.args.metrics.pages_failed += summary["not_ready"]
+                name = os.path.basename(self.args.source).split('.')[0]
+                folder = os.sep.join(self.args.destination.split(os.sep)[:-1])
+                self.report_path = os.path.abspath(os.path.join(folder, f"aspyre_{name}_check.json"))
+                os.makedirs(folder, exist_ok=True)
+                with open(self.report_path, "w", encoding="utf-8") as fh:
+                    json.dump(self.report, fh, indent=2)
+                for problem in self.report["archive"]["problems"]:
+                    utils.report(problem, "E")
                 if self.args.talkative:
-                    utils.report("Source is not an archive.\n---", "H")
+                    for record in self.report["pages"]:
+                        if not record["ready"]:
+                            utils.report(f"{record['file']}: {'; '.join(record['problems'])}", "W")
+                utils.report(f"{summary['ready']} out of {summary['pages']} page(s) ready to be converted.", "I")
+                utils.report(f"Readiness report written to: {self.report_path}\n---", "I")
+                if summary["pages"] > 0 and summary["not_ready"] == 0:
+                    self.args.execution_status = "Finished"
+                    self.args.add_log("Source archive is ready to be converted.")
+                else:
+                    self.args.execution_status = "Failed"
+                    self.args.add_log(f"{summary['not_ready']} page(s) are not ready to be converted.")
+            self.args.write_reports()
+        else:
+            self.args = None
+            utils.report("Failed to run CheckArchive: args must be an AspyreArgs object!\n===[!]===", "E")
+
+
+HANDLERS = {"tkb": manage_tkbtoes.handle_a_file, "pdfalto": manage_pdfaltotoes.handle_a_file,
+            "limb": manage_limbtoes.handle_a_file}
+
+
+def locate_pages(scenario, unzipped_source, source):
+    """Collect the ALTO XML and image files of an unpacked source, as each scenario does in its step 2
+
+    :param scenario: keyword describing the scenario
+    :param unzipped_source: path to the unpacked source
+    :param source: path to the source (for the messages)
+    :type scenario: str
+    :type unzipped_source: str
+    :type source: str
+    :return: ALTO XML files, image files (tkb: image file names listed in mets.xml), False if one is missing
+    :rtype: tuple
+    """
+    package = utils.list_directory(unzipped_source)
+    if scenario == "tkb":
+        # a single document, at the root of the export or in a directory (several: see tkb_documents())
+        documents = manage_tkbtoes.find_documents(unzipped_source)
+        if documents:
+            package = utils.list_directory(documents[0])
+        image_files = manage_tkbtoes.extract_mets(package, unzipped_source)
+        alto_files = manage_tkbtoes.locate_alto_files(package, source)
+        if not image_files or not alto_files:
+            return False, False
+        return alto_files, image_files
+    if scenario == "pdfalto":
+        return manage_pdfaltotoes.locate_alto_and_image_files(package)
+    return manage_limbtoes.locate_alto_and_image_files(package)
+
+
+class WorkUnit():
+    def __init__(self, args, alto_files, image_files, unzipped_source, destination=None, name=None):
+        """Pages of a work unit, in the shape the scenarios' handle_a_file() and convert_files() expect
+
+        destination and name are set for the documents of a multi-document Transkribus export: their
+        transformed files go to a directory of their own (default: args.destination).
+        """
+        self.args = args
+        self.alto_files = alto_files
+        self.image_files = image_files
+        self.unzipped_source = unzipped_source
+        self.destination = destination
+        self.name = name
+
+
+class Coordinator():
+    def __init__(self, args):
+        """Prepare a distributed job: unpack the source in the shared directory, collect the pages
+        and write the manifest splitting them in work units (args.unit_pages pages each)
+
+        Workers are then started on any host seeing the shared directory (see DistributedWorker),
+        and Merger assembles the output once every unit is done.
+
+        :param args: essential information to run transformation scenario
+        :type args: AspyreArgs object
+        """
+        if isinstance(args, type(AspyreArgs(test_type=True))):
+            self.args = args
+            self.manifest_path = None
+            self.args.add_log(f"Coordinating a distributed {self.args.scenario} job in {self.args.shared}.")
+            if distributed.manifest_exists(self.args.shared):
+                self.args.execution_status = "Failed"
+                self.args.add_log("A manifest already exists in the shared directory.")
+                utils.report(f"There is already a job in {self.args.shared}, use another directory.\n---", "E")
 
             if self.args.proceed():
-                # 2. collecting data
-                package = utils.list_directory(self.unzipped_source)
-                self.alto_files, self.image_files = manage_limbtoes.locate_alto_and_image_files(package)
+                # 1. unpacking the source in the shared directory
+                distributed.prepare_shared(self.args.shared)
+                self.unzipped_source = os.path.abspath(self.args.source)
+                if self.args.source.split(".")[-1] in ARCHIVE_EXTENSIONS:
+                    with self.args.stage("unzip"):
+                        self.unzipped_source = zip.unzip_scenario(
+                            self.args.source, self.args.scenario,
+                            unpack_dest=os.path.join(os.path.abspath(self.args.shared),
+                                                     os.path.basename(zip.unpack_destination(self.args.source))))
+                    if self.unzipped_source is False:
+                        self.args.execution_status = "Failed"
+                        self.args.add_log("Something went wrong while unpacking the source.")
+                        utils.report("Failing at unpacking the archive, Apsyre can't proceed.\n---", "E")
+
+            if self.args.proceed() and self.args.scenario == "tkb" \
+                    and len(manage_tkbtoes.find_documents(self.unzipped_source)) > 1:
+                # work units and their outputs aren't grouped by document
+                self.args.execution_status = "Failed"
+                self.args.add_log("Distributed jobs can't convert multi-document Transkribus exports.")
+                utils.report("The export holds several Transkribus documents, which a distributed job can't "
+                             "convert: run the Transkribus scenario without --distributed.\n---", "E")
 
+            if self.args.proceed():
+                # 2. collecting data
+                self.alto_files, self.image_files = locate_pages(self.args.scenario, self.unzipped_source,
+                                                                 self.args.source)
                 if self.alto_files is False:
-                    self.args.add_log("Couldn't find any XML file or any image file.")
-                    utils.report("Aspyre can't run without either of these.\n---", "E")
                     self.args.execution_status = "Failed"
-                else:
-                    self.args.add_log("Successfully collected data.")
+                    self.args.add_log("Couldn't find the files to convert.")
+                    utils.report("Aspyre can't distribute a job without ALTO XML and image files.\n---", "E")
 
             if self.args.proceed():
-                # 3. transforming files
-                if self.args.talkative:
-                    iterator = tqdm(self.alto_files, desc="Processing ALTO XML files", unit=' file')
-                else:
-                    iterator = self.alto_files
-                for file in iterator:
-                    processed = 0
-                    try:
-                        manage_limbtoes.handle_a_file(file, self)
-                    except Exception as e:
-                        if self.args.talkative:
-                            utils.report(f"Error while processing {file} :", "E")
-                            print(e)
-                        self.args.add_log(f"Failed to process {file}.")
-                    else:
-                        processed += 1
-                if processed == 0:
+                # 3. writing the manifest
+                units = distributed.plan_units(sorted(self.alto_files), self.args.unit_pages)
+                self.manifest_path = distributed.write_manifest(self.args.shared, {
+                    "source": self.args.source if storage.is_remote(self.args.source)
+                    else os.path.abspath(self.args.source), "scenario": self.args.scenario,
+                    "engine": self.args.engine, "vpadding": self.args.vpadding,
+                    "unzipped_source": self.unzipped_source, "image_files": self.image_files,
+                    "unit_pages": self.args.unit_pages, "created": time.time(), "units": units})
+                utils.report(f"Split {len(self.alto_files)} page(s) in {len(units)} work unit(s): "
+                             f"{self.manifest_path}\n---", "I")
+                self.args.execution_status = "Finished"
+                self.args.add_log("Manifest written, workers can start.")
+            self.args.write_reports()
+        else:
+            self.args = None
+            utils.report("Failed to run Coordinator: args must be an AspyreArgs object!\n===[!]===", "E")
+
+
+class DistributedWorker():
+    def __init__(self, args, poll_interval=5.0):
+        """Claim the work units of a distributed job one after the other and convert their pages,
+        until every unit is done
+
+        A unit is claimed with a lease (args.lease seconds) renewed on a timer while its pages are converted; the
+        converted files are written aside and moved to the shared directory once the whole unit is done.
+        If the lease is lost (the worker was too slow and another one took the unit), the work is discarded.
+
+        :param args: essential information to run transformation scenario
+        :type args: AspyreArgs object
+        :param poll_interval: time to wait before looking again for a unit when the remaining ones are claimed (s)
+        :type poll_interval: float
+        """
+        if isinstance(args, type(AspyreArgs(test_type=True))):
+            self.args = args
+            self.units_done = []
+            manifest = self.args.manifest
+            self.args.add_log(f"Working on the distributed job in {self.args.shared} as {distributed.owner_id()}.")
+            # the job definition wins over the local options
+            self.args.engine = manifest["engine"]
+            self.args.vpadding = manifest["vpadding"]
+            self.args.padding = self.args.vpadding != 0
+            handle_a_file = HANDLERS[manifest["scenario"]]
+            while self.args.execution_status == "Running":
+                unit = self.claim_next(manifest)
+                if unit is None:
+                    if all(distributed.is_done(self.args.shared, u["id"]) for u in manifest["units"]):
+                        break
+                    # the remaining units are being converted by other workers: their lease may expire
+                    time.sleep(poll_interval)
+                    continue
+                self.run_unit(unit, manifest, handle_a_file)
+            if self.args.proceed():
+                self.args.execution_status = "Finished"
+                self.args.add_log(f"No more work units, converted {len(self.units_done)} unit(s).")
+            self.args.write_reports()
+        else:
+            self.args = None
+            utils.report("Failed to run DistributedWorker: args must be an AspyreArgs object!\n===[!]===", "E")
+
+    def claim_next(self, manifest):
+        """Claim the first unit which is neither done nor leased, None if there is none"""
+        for unit in manifest["units"]:
+            if not distributed.is_done(self.args.shared, unit["id"]) \
+                    and distributed.claim(self.args.shared, unit["id"], self.args.lease):
+                if distributed.is_done(self.args.shared, unit["id"]):
+                    # finished between the two controls
+                    distributed.release(self.args.shared, unit["id"])
+                    continue
+                return unit
+        return None
+
+    def run_unit(self, unit, manifest, handle_a_file):
+        """Convert the pages of a unit and publish the result"""
+        args = self.args
+        unit_id = unit["id"]
+        final_output = distributed.unit_output(args.shared, unit_id)
+        tmp_output = f"{final_output}.{distributed.owner_id().replace(':', '_')}.tmp"
+        shutil.rmtree(tmp_output, ignore_errors=True)
+        os.makedirs(tmp_output)
+        args.destination = tmp_output
+        utils.report(f"Claimed {unit_id} ({len(unit['pages'])} page(s))", "I")
+        processed, failed = args.metrics.pages_processed, args.metrics.pages_failed
+        failures = len(args.metrics.failures)
+        # renewed on a timer: a single page taking longer than the lease doesn't lose it
+        with distributed.LeaseKeeper(args.shared, unit_id, args.lease) as lease:
+            convert_files(WorkUnit(args, unit["pages"], manifest["image_files"], manifest["unzipped_source"]),
+                          handle_a_file)
+        # a unit where every page failed is still done: the pages are recorded as failed
+        args.execution_status = "Running"
+        if lease.lost or not distributed.renew(args.shared, unit_id, args.lease):
+            shutil.rmtree(tmp_output, ignore_errors=True)
+            args.add_log(f"Lost the lease on {unit_id}, its result was discarded.")
+            utils.report(f"Lost the lease on {unit_id}, another worker took it over.", "W")
+            return
+        try:
+            os.rename(tmp_output, final_output)
+        except OSError:
+            # another worker finished it first (after our lease expired once)
+            shutil.rmtree(tmp_output, ignore_errors=True)
+        else:
+            distributed.mark_done(args.shared, unit_id, {
+                "pages": len(unit["pages"]), "pages_processed": args.metrics.pages_processed - processed,
+                "pages_failed": args.metrics.pages_failed - failed,
+                "failures": args.metrics.failures[failures:]})
+            self.units_done.append(unit_id)
+            args.add_log(f"Converted {unit_id}.")
+        distributed.release(args.shared, unit_id)
+
+
+class Merger():
+    def __init__(self, args):
+        """Assemble the output of a distributed job once every work unit is done
+
+        The converted files of every unit are gathered in args.destination and packed as usual
+        (one archive, or shards); the outcome of the units is added to the run metrics.
+
+        :param args: essential information to run transformation scenario
+        :type args: AspyreArgs object
+        """
+        if isinstance(args, type(AspyreArgs(test_type=True))):
+            self.args = args
+            manifest = self.args.manifest
+            self.unzipped_source = manifest["unzipped_source"]
+            self.alto_files = [page for unit in manifest["units"] for page in unit["pages"]]
+            self.image_files = manifest["image_files"]
+            results, missing = distributed.read_results(self.args.shared, manifest)
+            if missing:
+                self.args.execution_status = "Failed"
+                self.args.add_log(f"{len(missing)} work unit(s) are not done: {', '.join(missing[:10])}")
+                utils.report(f"{len(missing)} out of {len(manifest['units'])} work unit(s) are not done yet, "
+                             f"can't merge.\n---", "E")
+
+            if self.args.proceed():
+                # 1. gathering the converted files
+                os.makedirs(self.args.destination, exist_ok=True)
+                with self.args.stage("merge"):
+                    for unit in manifest["units"]:
+                        output = distributed.unit_output(self.args.shared, unit["id"])
+                        for name in os.listdir(output):
+                            shutil.copyfile(os.path.join(output, name), os.path.join(self.args.destination, name))
+                for result in results:
+                    self.args.metrics.pages_processed += result["pages_processed"]
+                    self.args.metrics.pages_failed += result["pages_failed"]
+                    self.args.metrics.failures.extend(result["failures"])
+                self.args.add_log(f"Gathered the output of {len(results)} work unit(s).")
+                if self.args.metrics.pages_processed == 0:
                     self.args.execution_status = "Failed"
-                elif processed < len(self.alto_files):
-                    self.args.add_log(f"Successfully transformed {processed} out of {len(self.alto_files)}")
-                else:
-                    self.args.add_log(f"Successfully processed sources files!")
 
             if self.args.proceed():
-                # 4. serve a zip file
+                # 2. serve a zip file
                 try:
-                    zip.zip_dir(self.args.destination, self.unzipped_source)
+                    with self.args.stage("zip"):
+                        zip_output(self)
                 except Exception as e:
                     if self.args.talkative:
-                        print(e)
+                        utils.report(f"Failed to zip output: {e}", "E")
                     self.args.execution_status = "Failed"
                     self.args.add_log('Failed to zip output.')
                 else:
                     utils.report("Task completed ✓", "S")
                     self.args.execution_status = 'Finished'
-                    self.args.add_log('Aspyre ran Limb scenario successufully!')
-
+                    self.args.add_log('Aspyre merged the distributed job successfully!')
+            self.args.write_reports()
         else:
             self.args = None
-            utils.report("Failed to run LimbToEs: args must be an AspyreArgs object!\n===[!]===", "E")
\ No newline at end of file
+            utils.report("Failed to run Merger: args must be an AspyreArgs object!\n===[!]===", "E")
+
+
+class ConvertedPage():
+    def __init__(self, result, index, output=None, image=None, data=None):
+        """A page converted by iter_convert()
+
+        :param result: outcome of the conversion of the page
+        :type result: isolation.PageResult
+        :param index: position of the page among the ALTO XML files of the source
+        :type index: int
+        :param output: path to the transformed file in the destination (processed pages only)
+        :type output: str or None
+        :param image: name of the image the page is paired with, as written in the transformed file
+        :type image: str or None
+        :param data: content of the transformed file (with read_output only)
+        :type data: bytes or None
+        """
+        self.file = result.file
+        self.index = index
+        self.status = result.status
+        self.reason = result.reason
+        self.duration = result.duration
+        self.warnings = result.warnings or []
+        self.output = output
+        self.image = image
+        self.data = data
+
+
+def publish_page(job, result, index, read_output=False):
+    """Put the transformed file of a page in the destination (a copy stays in the scratch space for the archive)
+
+    :param job: pages being converted (with a multi-document export: the document of the page)
+    :type job: WorkUnit
+    :param result: outcome of the conversion of the page
+    :type result: isolation.PageResult
+    :param index: position of the page among the ALTO XML files of the source
+    :type index: int
+    :param read_output: also read the content of the transformed file
+    :type read_output: bool
+    :return: the converted page
+    :rtype: ConvertedPage
+    """
+    args = job.args
+    output, data = None, None
+    if result.status == "processed" and result.output:
+        destination = args.output_destination or args.destination
+        remote = storage.is_remote(destination)
+        # the documents of a multi-document export have a directory of their own (see tkb_documents())
+        document = os.path.relpath(os.path.dirname(result.output), args.destination)
+        if document != "." and not document.startswith(".."):
+            destination = storage.join(destination, *document.split(os.sep))
+        if not remote:
+            os.makedirs(destination, exist_ok=True)
+        paths = [result.output] + [path for path in sidecar.sidecar_paths(result.output).values()
+                                   if os.path.isfile(path)]
+        for path in paths:
+            # uploads are copies: the file stays in the scratch space for the archive
+            published = storage.put_file(path, destination) if remote else \
+                scratch.publish_file(path, destination, keep=args.output_destination is not None)
+            output = output or published
+        if read_output:
+            with open(result.output if remote else output, "rb") as fh:
+                data = fh.read()
+    image = page_image(args.scenario, result.file, job.image_files)[1]
+    return ConvertedPage(result, index, output=output, image=image, data=data)
+
+
+def iter_convert(args, ordered=True, read_output=False, pack=True):
+    """Convert the pages of args.source and yield each of them as soon as it is ready
+
+    Runs the steps of TkbToEs, PdfaltoToEs and LimbToEs lazily: pages are yielded as they are converted
+    (in isolated workers with args.workers, or while a tar archive is read) and each transformed file is
+    in args.destination when its page is yielded. Once every page was yielded, the output archive is
+    created (pack), the scratch space is removed and the reports are written; this also happens if the
+    caller stops iterating early, the run being then recorded as failed.
+
+    ex: for page in iter_convert(args, ordered=False): upload(page.output, page.image)
+
+    :param args: essential information to run transformation scenario
+    :type args: AspyreArgs
+    :param ordered: yield the pages in the order of the source, otherwise as soon as each one is converted
+    :type ordered: bool
+    :param read_output: also yield the content of the transformed files (page.data)
+    :type read_output: bool
+    :param pack: create the output archive(s) once every page was converted
+    :type pack: bool
+    :return: generator of ConvertedPage
+    :rtype: generator
+    """
+    if not args.proceed():
+        utils.report("Aspyre can't convert pages with these arguments, see the execution log.\n---", "E")
+        return
+    job = WorkUnit(args, [], [], None)
+    handle_a_file = HANDLERS[args.scenario]
+    results = iter(())
+    units = None
+    completed = False
+    args.add_log(f"Starting {args.scenario} transformation scenario (iter_convert).")
+    try:
+        args.isolate_output()
+        if not args.proceed():
+            pass
+        elif stream.is_stream_archive(args.source):
+            results = iter_stream(job, handle_a_file, warnings=True)
+        else:
+            if args.source.split(".")[-1] in ARCHIVE_EXTENSIONS:
+                with args.stage("unzip"):
+                    job.unzipped_source = unpack_source(args)
+            else:
+                job.unzipped_source = os.path.abspath(args.source)
+            if job.unzipped_source is False:
+                args.execution_status = "Failed"
+                args.add_log("Something went wrong while unpacking the source.")
+            else:
+                documents = manage_tkbtoes.find_documents(job.unzipped_source) if args.scenario == "tkb" else []
+                if len(documents) > 1:
+                    units = tkb_documents(job, documents)
+                    job.alto_files = [file for unit in units for file in unit.alto_files] or False
+                    job.image_files = [image for unit in units for image in unit.image_files]
+                    args.add_log(f"Found {len(documents)} documents in the export, {len(units)} to convert.")
+                else:
+                    job.alto_files, job.image_files = locate_pages(args.scenario, job.unzipped_source, args.source)
+                if job.alto_files is False:
+                    args.execution_status = "Failed"
+                    args.add_log("Couldn't find the ALTO XML files or the images to pair them with.")
+                    utils.report("Aspyre can't run without either of these.\n---", "E")
+                else:
+                    results = iter_files(job, handle_a_file, warnings=True, units=units)
+
+        processed_before = args.metrics.pages_processed
+        unit_of = {file: unit for unit in units or [] for file in unit.alto_files}
+        positions, waiting, next_index = {}, {}, 0
+        for result in results:
+            if result.file not in positions:
+                # tar archives: files are known as they are read
+                for file in job.alto_files[len(positions):]:
+                    positions[file] = len(positions)
+            page = publish_page(unit_of.get(result.file, job), result, positions[result.file],
+                                read_output=read_output)
+            if not ordered:
+                yield page
+                continue
+            waiting[page.index] = page
+            while next_index in waiting:
+                yield waiting.pop(next_index)
+                next_index += 1
+        for index in sorted(waiting):
+            yield waiting[index]
+
+        if args.proceed():
+            conclude_conversion(args, args.metrics.pages_processed - processed_before, len(job.alto_files))
+        if args.proceed() and pack:
+            try:
+                with args.stage("zip"):
+                    zip_output(job, units=units)
+            except Exception as e:
+                args.execution_status = "Failed"
+                args.add_log(f"Failed to zip output: {e}")
+        if args.proceed():
+            args.execution_status = "Finished"
+            args.add_log(f"Aspyre ran {args.scenario} scenario successfully!")
+        completed = True
+    except GeneratorExit:
+        # the caller stopped iterating (or the generator was garbage collected) before the last page
+        args.add_log("The caller stopped iterating before every page was yielded.")
+        raise
+    finally:
+        try:
+            if not completed:
+                args.progress.finish()
+                args.execution_status = "Failed"
+                args.add_log("The conversion was interrupted before every page was yielded.")
+            if hasattr(results, "close"):
+                results.close()
+        finally:
+            args.conclude()
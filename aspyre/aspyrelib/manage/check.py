@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT manage check package"""
+
+import os
+import posixpath
+from contextlib import nullcontext
+
+from lxml import etree
+from PIL import Image
+
+from . import manage_tkbtoes, manage_pdfaltotoes, manage_limbtoes, zip
+from ..utils import utils
+
+# ALTO versions each scenario knows how to convert (see handle_a_file())
+ACCEPTED_VERSIONS = {"tkb": [2, 4], "pdfalto": [3, 4], "limb": [2, 3, 4]}
+XSI_SCHEMA_LOCATION = "{http://www.w3.org/2001/XMLSchema-instance}schemaLocation"
+
+
+def _children(names, directory):
+    """List the members directly inside a directory of the archive ("" for the root)"""
+    prefix = f"{directory}/" if directory else ""
+    return sorted(n for n in names if n.startswith(prefix) and "/" not in n[len(prefix):])
+
+
+def _inside(path, directory):
+    """Control that a path of the archive is inside a directory ("" for the root)"""
+    return not directory or path.startswith(f"{directory}/")
+
+
+def _top_directories(names):
+    """List the directories at the root of the archive"""
+    return sorted({n.split("/")[0] for n in names if "/" in n})
+
+
+def sniff_root(fh):
+    """Read the root element of an XML file without parsing the rest of the document
+
+    :param fh: XML file opened in binary mode
+    :type fh: file object
+    :return: local name of the root element, its namespace and its xsi:schemaLocation
+    :rtype: tuple
+    """
+    for event, element in etree.iterparse(fh, events=("start",)):
+        qname = etree.QName(element)
+        return qname.localname, qname.namespace, element.get(XSI_SCHEMA_LOCATION)
+    return None, None, None
+
+
+def probe_image(fh):
+    """Read the header of an image file (the pixels are not decoded)
+
+    :param fh: image file opened in binary mode
+    :type fh: file object
+    :return: format and size (width, height) of the image
+    :rtype: tuple
+    """
+    with Image.open(fh) as im:
+        return im.format, im.size
+
+
+def locate_pages(names, scenario):
+    """Mirror the scenarios' locate_* functions on the members of an archive
+
+    :param names: names of the eligible members of the archive
+    :param scenario: keyword describing the scenario
+    :type names: list
+    :type scenario: str
+    :return: ALTO XML members, image members (tkb: METS members, one per document), archive level problems
+    :rtype: tuple
+    """
+    problems = []
+    alto_files, image_files = [], []
+    if scenario == "tkb":
+        # one document per directory holding a 'mets.xml' file (see manage_tkbtoes.find_documents())
+        mets_files = sorted((n for n in names if posixpath.basename(n) == "mets.xml"), key=lambda n: (n.count("/"), n))
+        for name in mets_files:
+            # directories inside a document are not searched for other documents
+            if not any(_inside(posixpath.dirname(name), posixpath.dirname(mets)) for mets in image_files):
+                image_files.append(name)
+        for mets in image_files:
+            alto_files += [n for n in _children(names, posixpath.join(posixpath.dirname(mets), "alto"))
+                           if n.endswith(".xml")]
+        if len(image_files) == 0:
+            problems.append("There is no 'mets.xml' file in the archive")
+        if len(alto_files) == 0:
+            problems.append("There is no ALTO XML file in the 'alto' directory")
+    elif scenario == "pdfalto":
+        top = _top_directories(names)
+        if not top or not any(n.startswith(f"{top[0]}/out/") for n in names):
+            problems.append("There is no 'out' directory in the archive")
+        else:
+            out = f"{top[0]}/out"
+            alto_files = [n for n in _children(names, out) if n.endswith(".xml") and not n.endswith("_metadata.xml")]
+            image_files = [n for n in names if n.startswith(f"{out}/") and n.endswith(".png")
+                           and posixpath.dirname(n).endswith("xml_data")]
+    elif scenario == "limb":
+        top = _top_directories(names)
+        directory = top[0] if len(top) == 1 and not _children(names, "") else ""
+        for name in _children(names, directory):
+            if name.endswith(".xml"):
+                alto_files.append(name)
+            else:
+                image_files.append(name)
+        if len(alto_files) == 0:
+            problems.append("Found no eligible XML file")
+        if len(image_files) == 0:
+            problems.append("Found no eligible image file")
+    return alto_files, image_files, problems
+
+
+def check_page(zph, name, scenario, image_files, members):
+    """Run the cheap checks on one ALTO XML member of an archive
+
+    :param zph: open archive
+    :param name: name of the ALTO XML member
+    :param scenario: keyword describing the scenario
+    :param image_files: image file names (tkb: image file names listed in the METS file)
+    :param members: names of the eligible members of the archive
+    :type zph: ZipFile
+    :type name: str
+    :type scenario: str
+    :type image_files: list
+    :type members: set
+    :return: readiness record of the page
+    :rtype: dict
+    """
+    record = {"file": name, "ready": False, "alto_version": None, "image": None, "image_format": None,
+              "image_size": None, "problems": []}
+    # root sniffing
+    try:
+        with zph.open(name) as fh:
+            root, namespace, schema_location = sniff_root(fh)
+    except etree.XMLSyntaxError as e:
+        record["problems"].append(f"Not well-formed XML: {e}")
+        return record
+    if root != "alto":
+        record["problems"].append(f"Root element is <{root}>, not <alto>")
+        return record
+    if scenario == "tkb":
+        if not schema_location:
+            record["problems"].append("No xsi:schemaLocation on <alto>")
+            return record
+        version = manage_tkbtoes.control_schema_version(schema_location.split())
+    elif scenario == "pdfalto":
+        version = manage_pdfaltotoes.control_schema_version(utils.schema_declarations(namespace, schema_location))
+    else:
+        version = manage_limbtoes.control_schema_version(utils.schema_declarations(namespace, schema_location))
+    record["alto_version"] = version
+    if version not in ACCEPTED_VERSIONS[scenario]:
+        record["problems"].append(f"Unsupported ALTO version ({version}, namespace: {namespace})")
+
+    # pairing
+    image = None
+    try:
+        if scenario == "tkb":
+            record["image"] = manage_tkbtoes.get_image_filename(name, image_files)
+        elif scenario == "pdfalto":
+            image = manage_pdfaltotoes.get_image_filename(name, image_files).split("||")[0]
+        else:
+            image = manage_limbtoes.get_image_filename(name, image_files).split("||")[0]
+    except Exception:
+        # the scenarios' pairing functions fail when nothing matches
+        image = None
+    if scenario == "tkb":
+        if record["image"] is None:
+            record["problems"].append("No matching image file name in 'mets.xml'")
+    elif image in (None, "None") or image not in members:
+        record["problems"].append("No matching image file in the archive")
+    else:
+        # image header probe
+        record["image"] = image
+        try:
+            with zph.open(image) as fh:
+                record["image_format"], record["image_size"] = probe_image(fh)
+        except Exception as e:
+            record["problems"].append(f"Unreadable image header: {e}")
+    record["ready"] = len(record["problems"]) == 0
+    return record
+
+
+def check_archive(source, scenario, args=None):
+    """Check whether the files of an archive are ready to be converted, without unpacking it
+
+    :param source: path to the archive
+    :param scenario: keyword describing the scenario
+    :param args: if provided, used to time the stages and count the pages
+    :type source: str
+    :type scenario: str
+    :type args: AspyreArgs
+    :return: readiness report
+    :rtype: dict
+    """
+    report = {"source": source, "scenario": scenario, "archive": {}, "pages": [],
+              "summary": {"pages": 0, "ready": 0, "not_ready": 0}}
+    if not zip.allowed_archive_file(os.path.basename(source)):
+        report["archive"]["problems"] = ["This file extension is not allowed"]
+        return report
+    with zip.open_zip(source) as zph:
+        with _stage(args, "archive_index"):
+            members = zph.infolist()
+            eligible, ignored = zip.select_members(members, scenario)
+            names = [m.filename for m in eligible]
+            alto_files, image_files, problems = locate_pages(names, scenario)
+        report["archive"] = {"members": len(members), "eligible": len(names), "ignored": len(ignored),
+                             "problems": problems}
+        documents = {}
+        if scenario == "tkb" and image_files:
+            report["archive"]["documents"] = len(image_files)
+            with _stage(args, "mets"):
+                # the pages of a document are paired with the images listed in its own 'mets.xml'
+                for mets in image_files:
+                    with zph.open(mets) as fh:
+                        documents[posixpath.dirname(mets)] = manage_tkbtoes.get_list_of_source_images([fh])
+            if not any(documents.values()):
+                problems.append("There is no reference to images in 'mets.xml' (\"Export Image\" option)")
+        members_set = set(names)
+        for name in alto_files:
+            if scenario == "tkb":
+                image_files = documents.get(posixpath.dirname(posixpath.dirname(name)), [])
+            if args is None:
+                record = check_page(zph, name, scenario, image_files, members_set)
+            else:
+                with args.page(name):
+                    record = check_page(zph, name, scenario, image_files, members_set)
+            if problems:
+                # archive level problems prevent the conversion of every page
+                record["problems"] = problems + record["problems"]
+                record["ready"] = False
+            report["pages"].append(record)
+    ready = len([r for r in report["pages"] if r["ready"]])
+    report["summary"] = {"pages": len(report["pages"]), "ready": ready, "not_ready": len(report["pages"]) - ready}
+    return report
+
+
+def _stage(args, name):
+    """Use args.stage() if args are provided, otherwise do nothing"""
+    if args is None:
+        return nullcontext()
+    return args.stage(name)
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT manage geometry package"""
+
+from array import array
+
+import numpy as np
+
+from . import model
+
+
+BOX_ATTRIBUTES = ("HPOS", "VPOS", "WIDTH", "HEIGHT")
+MODEL_BOX_ATTRIBUTES = ("hpos", "vpos", "width", "height")
+BASELINE = "BASELINE"
+POINTS = "POINTS"
+
+
+class PageGeometry():
+    def __init__(self, engine):
+        """Coordinates of a page, in flat arrays (use from_soup() or from_model() to build one)
+
+        :param engine: type of the elements holding the coordinates, "soup" or "model"
+        :type engine: str
+        """
+        self.engine = engine
+        # positions: one row per element, NaN when an attribute is missing
+        self.box_owners = []
+        self.box_names = []
+        self.boxes = np.empty((0, 4))
+        self.dirty_boxes = np.zeros(0, dtype=bool)
+        # baselines and polygons: coords[offsets[i]:offsets[i + 1]] are the coordinates of shape i
+        self.shape_owners = []
+        self.shape_kinds = []
+        self.shape_boxes = np.empty(0, dtype=np.int64)  # row in boxes of the TextLine owning a baseline
+        self.shape_commas = []  # True when the declaration used "x1,y1 x2,y2"
+        self.coords = np.empty(0)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.dirty_shapes = np.zeros(0, dtype=bool)
+
+    # ---- building
+    def _finish(self, boxes, shape_boxes, tokens, lengths):
+        self.boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4)
+        self.dirty_boxes = np.zeros(len(self.box_owners), dtype=bool)
+        self.shape_boxes = np.array(shape_boxes, dtype=np.int64)
+        self.coords = np.array(tokens, dtype=np.float64)
+        self.offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        self.dirty_shapes = np.zeros(len(self.shape_owners), dtype=bool)
+        return self
+
+    def lengths(self):
+        """Return the number of coordinates of each shape"""
+        return np.diff(self.offsets)
+
+    def kind_mask(self, kind):
+        """Return a boolean mask selecting the shapes of a kind ("BASELINE" or "POINTS")"""
+        return np.array([k == kind for k in self.shape_kinds], dtype=bool)
+
+    def shape(self, index):
+        """Return the coordinates of a shape"""
+        return self.coords[self.offsets[index]:self.offsets[index + 1]]
+
+    # ---- operations
+    def extrapolate_baselines(self):
+        """Turn single-value baselines into complete coordinates using their line's HPOS and WIDTH
+
+        ex: <TextLine BASELINE="1097" HPOS="487" WIDTH="2404"> -> BASELINE="487 1097 2891 1097"
+
+        :return: number of extrapolated baselines
+        :rtype: int
+        """
+        lengths = self.lengths()
+        single = (lengths == 1) & self.kind_mask(BASELINE) & (self.shape_boxes >= 0)
+        if not single.any():
+            return 0
+        # lines without HPOS or WIDTH are left as they are
+        line_boxes = self.boxes[self.shape_boxes[single]]
+        incomplete = np.isnan(line_boxes[:, 0]) | np.isnan(line_boxes[:, 2])
+        single[np.flatnonzero(single)[incomplete]] = False
+        count = int(single.sum())
+        if count == 0:
+            return 0
+        new_lengths = np.where(single, 4, lengths)
+        new_offsets = np.zeros(len(new_lengths) + 1, dtype=np.int64)
+        np.cumsum(new_lengths, out=new_offsets[1:])
+        new_coords = np.empty(new_offsets[-1])
+        # copy the other shapes as they are
+        kept = ~single
+        new_coords[_ranges(new_offsets[:-1][kept], lengths[kept])] = \
+            self.coords[_ranges(self.offsets[:-1][kept], lengths[kept])]
+        # and build the extrapolated ones
+        y = self.coords[self.offsets[:-1][single]]
+        line_boxes = self.boxes[self.shape_boxes[single]]
+        ax = line_boxes[:, 0]
+        bx = line_boxes[:, 0] + line_boxes[:, 2]
+        new_coords[new_offsets[:-1][single][:, None] + np.arange(4)] = np.stack([ax, y, bx, y], axis=1)
+        self.coords = new_coords
+        self.offsets = new_offsets
+        self.dirty_shapes |= single
+        return count
+
+    def scale(self, ratio):
+        """Multiply every position, size, baseline and polygon coordinate by a ratio (truncated to int)
+
+        :param ratio: ratio to apply
+        :type ratio: float
+        :return: None
+        """
+        self.boxes = np.trunc(self.boxes * ratio)
+        self.dirty_boxes[:] = True
+        self.coords = np.trunc(self.coords * ratio)
+        self.dirty_shapes[:] = True
+
+    def pad(self, vpadding, names=("String",)):
+        """Add a value to the VPOS of the elements of the given names
+
+        :param vpadding: value to add to VPOS
+        :param names: names of the elements to move
+        :type vpadding: int
+        :type names: tuple
+        :return: None
+        """
+        rows = np.array([name in names for name in self.box_names], dtype=bool)
+        if rows.any():
+            self.boxes[rows, 1] = np.trunc(self.boxes[rows, 1] + vpadding)
+            self.dirty_boxes |= rows
+
+    def normalize(self):
+        """Mark the baselines and polygons declared with commas ("x1,y1 x2,y2") to be written back
+        with space separated values
+
+        :return: number of normalized shapes
+        :rtype: int
+        """
+        commas = np.array(self.shape_commas, dtype=bool)
+        self.dirty_shapes |= commas
+        return int(commas.sum())
+
+    # ---- serializing
+    def write_back(self):
+        """Write the modified coordinates back into the elements they were read from
+
+        :return: None
+        """
+        if self.dirty_boxes.any():
+            rows = np.flatnonzero(self.dirty_boxes)
+            values = self.boxes[rows]
+            present = ~np.isnan(values)
+            formatted = _format(values[present])
+            position = 0
+            for row, row_present in zip(rows.tolist(), present.tolist()):
+                owner = self.box_owners[row]
+                for column, is_present in enumerate(row_present):
+                    if not is_present:
+                        continue
+                    if self.engine == "soup":
+                        owner.attrs[BOX_ATTRIBUTES[column]] = formatted[position]
+                    else:
+                        setattr(owner, MODEL_BOX_ATTRIBUTES[column], float(formatted[position]))
+                    position += 1
+            self.dirty_boxes[:] = False
+        if self.dirty_shapes.any():
+            shapes = np.flatnonzero(self.dirty_shapes)
+            starts = self.offsets[shapes]
+            lengths = self.offsets[shapes + 1] - starts
+            # gather the coordinates of the modified shapes to format them all at once
+            values = self.coords[_ranges(starts, lengths)]
+            bounds = np.zeros(len(shapes) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=bounds[1:])
+            bounds = bounds.tolist()
+            if self.engine == "soup":
+                formatted = _format(values)
+            for position, index in enumerate(shapes.tolist()):
+                owner, kind = self.shape_owners[index], self.shape_kinds[index]
+                if self.engine == "soup":
+                    owner.attrs[kind] = " ".join(formatted[bounds[position]:bounds[position + 1]])
+                elif kind == BASELINE:
+                    owner.baseline = array("d", values[bounds[position]:bounds[position + 1]].tobytes())
+                else:
+                    owner.points = array("d", values[bounds[position]:bounds[position + 1]].tobytes())
+            self.dirty_shapes[:] = False
+
+
+def _ranges(starts, lengths):
+    """Return the flat indices covering [start, start + length) for each pair of starts and lengths"""
+    within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + within
+
+
+def _format(values):
+    """Format coordinates, without decimals for whole numbers"""
+    if values.size == 0:
+        return []
+    if np.all(values == np.trunc(values)):
+        return [str(value) for value in values.astype(np.int64).tolist()]
+    return [str(int(value)) if value.is_integer() else repr(value) for value in values.tolist()]
+
+
+def from_soup(xml_tree):
+    """Gather the coordinates of the elements in the PrintSpace of an ALTO XML tree in a single pass
+
+    :param xml_tree: ALTO XML tree
+    :type xml_tree: type(BeautifulSoup())
+    :return: page geometry
+    :rtype: PageGeometry
+    """
+    geometry = PageGeometry("soup")
+    scopes = xml_tree.find_all("PrintSpace") or [xml_tree]
+    boxes, shape_boxes, tokens, lengths = [], [], [], []
+    nan = float("nan")
+    for scope in scopes:
+        for tag in scope.find_all(True):
+            attrs = tag.attrs
+            box_row = -1
+            if "HPOS" in attrs or "VPOS" in attrs or "WIDTH" in attrs or "HEIGHT" in attrs:
+                box_row = len(geometry.box_owners)
+                geometry.box_owners.append(tag)
+                geometry.box_names.append(tag.name)
+                boxes.extend(float(attrs[a]) if a in attrs else nan for a in BOX_ATTRIBUTES)
+            if tag.name == "TextLine" and BASELINE in attrs:
+                kind = BASELINE
+            elif tag.name == "Polygon" and POINTS in attrs:
+                kind = POINTS
+            else:
+                continue
+            value = str(attrs[kind])
+            values = value.replace(",", " ").split()
+            geometry.shape_owners.append(tag)
+            geometry.shape_kinds.append(kind)
+            geometry.shape_commas.append("," in value)
+            shape_boxes.append(box_row if kind == BASELINE else -1)
+            tokens.extend(values)
+            lengths.append(len(values))
+    return geometry._finish(boxes, shape_boxes, tokens, lengths)
+
+
+def from_model(alto):
+    """Gather the coordinates of the elements in the PrintSpace of a page model
+
+    :param alto: page model
+    :type alto: model.Alto
+    :return: page geometry
+    :rtype: PageGeometry
+    """
+    if alto.page is None or alto.page.print_space is None:
+        return from_blocks([])
+    return from_blocks(alto.page.print_space.blocks)
+
+
+def from_blocks(blocks):
+    """Gather the coordinates of blocks of a page model (and of the elements they contain)
+
+    :param blocks: TextBlock and Illustration objects
+    :type blocks: list
+    :return: page geometry
+    :rtype: PageGeometry
+    """
+    geometry = PageGeometry("model")
+    boxes, shape_boxes, tokens, lengths = [], [], [], []
+    nan = float("nan")
+    for box in model.iter_boxes(blocks):
+        box_row = len(geometry.box_owners)
+        geometry.box_owners.append(box)
+        geometry.box_names.append(type(box).__name__)
+        boxes.extend(nan if getattr(box, a) is None else getattr(box, a) for a in MODEL_BOX_ATTRIBUTES)
+        if isinstance(box, model.TextLine) and box.baseline is not None:
+            geometry.shape_owners.append(box)
+            geometry.shape_kinds.append(BASELINE)
+            geometry.shape_commas.append(False)
+            shape_boxes.append(box_row)
+            tokens.extend(box.baseline)
+            lengths.append(len(box.baseline))
+        if box.polygon is not None:
+            geometry.shape_owners.append(box.polygon)
+            geometry.shape_kinds.append(POINTS)
+            geometry.shape_commas.append(False)
+            shape_boxes.append(-1)
+            tokens.extend(box.polygon.points)
+            lengths.append(len(box.polygon.points))
+    return geometry._finish(boxes, shape_boxes, tokens, lengths)
@@ -11,10 +11,10 @@ date: 25/03/2021
 import os
 
 from bs4 import BeautifulSoup
-from tqdm import tqdm
 from PIL import Image
 
 from ..utils import utils
+from . import geometry, model, sidecar
 
 
 # ALTO_V_4_0 = 'http://www.loc.gov/standards/alto/v4/alto-4-0.xsd'
@@ -39,7 +39,7 @@ def get_schema_spec(xml_tree):
 
     :param xml_tree: parsed xml tree
     :type xml_tree: type(BeautifulSoup())
-    :return: False if not a valid ALTO file, else the value(s) in //alto/xsi:schemaLocation as a list
+    :return: False if not a valid ALTO file, else the value(s) in //alto/xsi:schemaLocation and the namespace as a list
     :rtype: bool or list
     """
     schema = False
@@ -49,7 +49,7 @@ def get_schema_spec(xml_tree):
     elif len(root) > 1:
         utils.report(f"Too many <alto> tags ({len(root)}) in this file, I'm freaking out!", "E")
     else:
-        schema = root[0].attrs["xmlns"].split()
+        schema = utils.schema_declarations(root[0].attrs.get("xmlns"), root[0].attrs.get("xsi:schemaLocation"))
     return schema
 
 
@@ -186,8 +186,21 @@ def get_ratio(canvas_size, xml_tree):
 
     """
     xml_size = xml_tree.find_all("Page")[0]
-    xml_height = xml_size.attrs["HEIGHT"]
-    xml_width = xml_size.attrs["WIDTH"]
+    return get_ratio_from_sizes(canvas_size, xml_size.attrs["WIDTH"], xml_size.attrs["HEIGHT"])
+
+
+def get_ratio_from_sizes(canvas_size, xml_width, xml_height):
+    """Compare source image size and canvas size as declared in the XML file to get ratio
+
+    :param canvas_size: source image size (width, height)
+    :param xml_width: width declared in the XML file
+    :param xml_height: height declared in the XML file
+    :type canvas_size: tuple
+    :type xml_width: str or float
+    :type xml_height: str or float
+    :return: ratio
+    :rtype: float
+    """
     #print("in xml : ", xml_width, ", ", xml_height)
     original_width, original_height = canvas_size
     #print("original :", original_width, ", ", original_height)
@@ -211,16 +224,10 @@ def apply_ratio_to_coordinates(xml_tree):
     """
     canvas_size = get_canvas_size(xml_tree)
     ratio = get_ratio(canvas_size, xml_tree)
-    tags = xml_tree.PrintSpace.find_all(True)
-    for tag in tags:
-        if "HPOS" in tag.attrs:
-            tag.attrs["HPOS"] = int(float(tag.attrs["HPOS"]) * ratio)
-        if "VPOS" in tag.attrs:
-            tag.attrs["VPOS"] = int(float(tag.attrs["VPOS"]) * ratio)
-        if "WIDTH" in tag.attrs:
-            tag.attrs["WIDTH"] = int(float(tag.attrs["WIDTH"]) * ratio)
-        if "HEIGHT" in tag.attrs:
-            tag.attrs["HEIGHT"] = int(float(tag.attrs["HEIGHT"]) * ratio)
+    # positions, sizes, baselines and polygons of every element in the PrintSpace
+    page_geometry = geometry.from_soup(xml_tree)
+    page_geometry.scale(ratio)
+    page_geometry.write_back()
     return xml_tree
 
 
@@ -232,17 +239,10 @@ def apply_padding(xml_tree, vpadding):
     :param vpadding: value to add to VPOS attributes
     :type vpadding: int
     """
-    # un-necessary:
-    #for tl in xml_tree.find_all('TextLine'):
-    #    if "VPOS" in tl.attrs:
-    #        tl.attrs['VPOS'] = int(tl.attrs['VPOS'] + vpadding)
-    for st in xml_tree.find_all('String'):
-        if 'VPOS' in st.attrs:
-            st.attrs['VPOS'] = int(st.attrs['VPOS'] + vpadding)
-    # un-necessary:
-    #for sp in xml_tree.find_all('SP'):
-    #    if "VPOS" in sp.attrs:
-    #        sp.attrs['VPOS'] = int(sp.attrs['VPOS'] + vpadding)
+    # TextLine and SP elements don't need to be moved
+    page_geometry = geometry.from_soup(xml_tree)
+    page_geometry.pad(vpadding, names=("String",))
+    page_geometry.write_back()
     return xml_tree
 
 
@@ -286,13 +286,15 @@ def save_processed_file(xml_file_name, xml_content, destination):
     :param xml_content: parsed XML tree
     :type xml_file_name: str
     :type xml_content: type(BeautifulSoup())
-    :return: None
+    :return: path to the new file
+    :rtype: str
     """
     if not os.path.isdir(destination):
         os.makedirs(destination)
     path_to_file = os.path.join(destination, xml_file_name)
     # TODO @alix improve the export with prettify(): remove the blank space inside '//Measurements'
     utils.write_file(path_to_file, str(xml_content))
+    return path_to_file
 
 
 ## main function
@@ -303,57 +305,114 @@ def handle_a_file(file, limb_to_es_obj):
     :type file: str
     :param limb_to_es_obj: Limb to Es object
     :type limb_to_es_obj: LimbToEs
-    :return: None
+    :return: path to the transformed file, None if the file was skipped
+    :rtype: str or None
     """
-    if limb_to_es_obj.args.padding:
-        length = 8
-    else:
-        length = 7
-
-    xml_tree = utils.read_file(file, 'xml')
-    pbar = tqdm(total=length, desc="Processing...", unit=" step")
-    pbar.update(1)  # getting schema version
-    schemas = get_schema_spec(xml_tree)
+    args = limb_to_es_obj.args
+    if args.engine == "model":
+        return handle_a_file_with_model(file, limb_to_es_obj)
+    output = None
+    with args.stage("read"):
+        xml_tree = utils.read_file(file, 'mmap')
+    args.metrics.bytes_in += utils.file_size(file)
+    with args.stage("schema"):
+        schemas = get_schema_spec(xml_tree)
 
     if schemas:
-        if limb_to_es_obj.args.talkative:
+        if args.talkative:
             utils.report(f"Found the following schema specs declaration(s): {schemas}\n---", "H")
-        pbar.update(1)  # controlling schema version
         alto_version = control_schema_version(schemas)
-        if limb_to_es_obj.args.talkative:
+        if args.talkative:
             if alto_version:
                 utils.report(f"Detected ALTO version: v{alto_version}\n---", "H")
 
         if alto_version in [2, 3, 4]:  # even if the schema spec is ALTO 4, there may be other issues...
             # and we still need to switch to SCRIPTA ALTO specs anyways...
-            if limb_to_es_obj.args.talkative:
+            if args.talkative:
                 utils.report("Buckle up, we're fixing the schema declaration!\n---", "H")
-            pbar.update(1)  # changing schema declaration to ALTO 4 (SCRIPTA flavored)
-            switch_to_v4(xml_tree)
+            with args.stage("switch_to_v4"):
+                switch_to_v4(xml_tree)
 
-            if limb_to_es_obj.args.talkative:
+            if args.talkative:
                 utils.report("I'm adding a <sourceImageInformation> element to point towards the image file\n---", "H")
-            pbar.update(1)  # adding file name in source image information
-            add_sourceimageinformation(xml_tree, file, limb_to_es_obj.image_files)
+            with args.stage("source_image"):
+                add_sourceimageinformation(xml_tree, file, limb_to_es_obj.image_files)
             # modifier les coordonnées
-            if limb_to_es_obj.args.talkative:
+            if args.talkative:
                 utils.report("Fixing the ratio (coordinates)\n---", "H")
-            pbar.update(1)  # fixing baseline declarations
-            xml_tree = apply_ratio_to_coordinates(xml_tree)
-
-            if limb_to_es_obj.args.padding:
-                if limb_to_es_obj.args.talkative:
+            # coordinates are parsed once, scaled and padded together and written back at the end
+            with args.stage("geometry"):
+                page_geometry = geometry.from_soup(xml_tree)
+            with args.stage("ratio"):
+                page_geometry.scale(get_ratio(get_canvas_size(xml_tree), xml_tree))
+
+            if args.padding:
+                if args.talkative:
                     utils.report("Adjusting y-axis coords in textline and strings nodes\n---", "H")
-                pbar.update(1)
-                xml_tree = apply_padding(xml_tree, limb_to_es_obj.args.vpadding)
+                with args.stage("padding"):
+                    page_geometry.pad(args.vpadding, names=("String",))
+            with args.stage("geometry"):
+                page_geometry.write_back()
 
-            if limb_to_es_obj.args.talkative:
+            if args.talkative:
                 utils.report("Wrapping up\n---", "H")
-            pbar.update(1)  # fixing baseline declarations
-            xml_tree = clean_filename(xml_tree)
+            with args.stage("filename"):
+                xml_tree = clean_filename(xml_tree)
 
+            counts = utils.count_tags(xml_tree, ["TextLine", "String"])
+            args.metrics.lines_touched += counts["TextLine"]
+            args.metrics.strings_touched += counts["String"]
             # TODO @alix: improve the saving process, obviously!
-            pbar.update(1)  # saving file
-            save_processed_file(file.split(os.sep)[-1], xml_tree, limb_to_es_obj.args.destination)
-        pbar.close()
+            with args.stage("save"):
+                output = save_processed_file(file.split(os.sep)[-1], xml_tree, args.destination)
+            args.metrics.bytes_out += os.path.getsize(output)
+            if args.sidecars:
+                with args.stage("sidecars"):
+                    sidecar.write_sidecars(output, xml_tree, page_geometry, args.sidecars)
+    return output
+
+
+def handle_a_file_with_model(file, limb_to_es_obj):
+    """Same as handle_a_file() but working on the compact page model instead of a BeautifulSoup tree
 
+    :param file: path to an ALTO XML file
+    :type file: str
+    :param limb_to_es_obj: Limb to Es object
+    :type limb_to_es_obj: LimbToEs
+    :return: path to the transformed file, None if the file was skipped
+    :rtype: str or None
+    """
+    args = limb_to_es_obj.args
+    with args.stage("read"):
+        alto = model.read(file)
+    args.metrics.bytes_in += utils.file_size(file)
+    with args.stage("schema"):
+        alto_version = control_schema_version(utils.schema_declarations(alto.namespace, alto.schema_location))
+    if args.talkative and alto_version:
+        utils.report(f"Detected ALTO version: v{alto_version}\n---", "H")
+    if alto_version not in [2, 3, 4]:
+        return None
+    # the schema declaration is switched to ALTO 4 (SCRIPTA flavored) when writing the model
+    with args.stage("source_image"):
+        image_filename, ideal_image_filename = get_image_filename(file, limb_to_es_obj.image_files).split("||")
+        alto.description.file_name = ideal_image_filename
+    with args.stage("ratio"):
+        canvas_size = Image.open(image_filename).size
+        xml_size = alto.page
+        ratio = get_ratio_from_sizes(canvas_size, xml_size.width, xml_size.height)
+        page_geometry = geometry.from_model(alto)
+        page_geometry.scale(ratio)
+    if args.padding:
+        with args.stage("padding"):
+            page_geometry.pad(args.vpadding, names=("String",))
+    page_geometry.write_back()
+    lines, strings = model.count_lines_and_strings(alto)
+    args.metrics.lines_touched += lines
+    args.metrics.strings_touched += strings
+    with args.stage("save"):
+        output = save_processed_file(file.split(os.sep)[-1], model.write(alto), args.destination)
+    args.metrics.bytes_out += os.path.getsize(output)
+    if args.sidecars:
+        with args.stage("sidecars"):
+            sidecar.write_sidecars(output, alto, page_geometry, args.sidecars)
+    return output
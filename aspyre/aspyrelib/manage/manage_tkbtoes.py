@@ -8,11 +8,12 @@ date: 19/03/2021
 """
 
 import os
+import re
 
 from bs4 import BeautifulSoup
-from tqdm import tqdm
 
 from ..utils import utils
+from . import geometry, model, sidecar
 
 
 # ALTO_V_4_0 = 'http://www.loc.gov/standards/alto/v4/alto-4-0.xsd'
@@ -92,8 +93,9 @@ def remove_commas_in_points(xml_tree):
     :type xml_tree: type(BeautifulSoup())
     :return: None
     """
-    for polygon in xml_tree.find_all('Polygon', POINTS=True):
-        polygon.attrs['POINTS'] = polygon.attrs['POINTS'].replace(',', ' ')
+    page_geometry = geometry.from_soup(xml_tree)
+    page_geometry.normalize()
+    page_geometry.write_back()
 
 
 def get_image_filename(file_name, list_of_image_files):
@@ -174,13 +176,22 @@ def extrapolate_baseline_coordinates(xml_tree):
           <String CONTENT="UNIVERSEL." HEIGHT="179" HPOS="487" ID="string_tl_2" VPOS="918" WIDTH="2404"/>
       </TextLine>
     """
-    for text_line in xml_tree.find_all("TextLine"):
-        if len(text_line.attrs["BASELINE"].split()) == 1:
-            baseline_y = int(text_line.attrs["BASELINE"])
-            baseline_ax = int(text_line.attrs["HPOS"])
-            baseline_bx = int(text_line.attrs["HPOS"]) + int(text_line.attrs["WIDTH"])
-            baseline = f"{baseline_ax} {baseline_y} {baseline_bx} {baseline_y}"
-            text_line.attrs["BASELINE"] = baseline
+    page_geometry = geometry.from_soup(xml_tree)
+    page_geometry.extrapolate_baselines()
+    page_geometry.write_back()
+
+
+def output_destination(tkb_to_es_obj):
+    """Return the directory where the transformed files of a scenario object go
+
+    The documents of a multi-document export have a directory of their own (see aspyre.WorkUnit).
+
+    :param tkb_to_es_obj: Tkb to Es object or document of an export
+    :type tkb_to_es_obj: TkbToEs or WorkUnit
+    :return: path to the directory
+    :rtype: str
+    """
+    return getattr(tkb_to_es_obj, "destination", None) or tkb_to_es_obj.args.destination
 
 
 def save_processed_file(xml_file_name, xml_content, destination):
@@ -190,7 +201,8 @@ def save_processed_file(xml_file_name, xml_content, destination):
     :param xml_content: parsed XML tree
     :type xml_file_name: str
     :type xml_content: type(BeautifulSoup())
-    :return: None
+    :return: path to the new file
+    :rtype: str
     """
     # Do we need a try except here?
     print(f"[DEBUG] {destination}")
@@ -199,6 +211,7 @@ def save_processed_file(xml_file_name, xml_content, destination):
     path_to_file = os.path.join(destination, xml_file_name)
     # TODO @alix improve the export with prettify(): remove the blank space inside '//Measurements'
     utils.write_file(path_to_file, str(xml_content))
+    return path_to_file
 
 
 def handle_a_file(file, tkb_to_es_obj):
@@ -215,7 +228,8 @@ def handle_a_file(file, tkb_to_es_obj):
     :type talk: bool
     :type src: str
     :type dest: str
-    :return: None
+    :return: path to the transformed file, None if the file was skipped
+    :rtype: str or None
     """
 
     #global talkative
@@ -225,44 +239,59 @@ def handle_a_file(file, tkb_to_es_obj):
     #source = src
     #destination = dest
 
-    xml_tree = utils.read_file(file, 'xml')
-    pbar = tqdm(total=7, desc="Processing...", unit=" step")
-    pbar.update(1)  # getting schema version
-    schemas = get_schema_spec(xml_tree)
+    args = tkb_to_es_obj.args
+    if args.engine == "model":
+        return handle_a_file_with_model(file, tkb_to_es_obj)
+    output = None
+    with args.stage("read"):
+        xml_tree = utils.read_file(file, 'mmap')
+    args.metrics.bytes_in += utils.file_size(file)
+    with args.stage("schema"):
+        schemas = get_schema_spec(xml_tree)
     if schemas:
-        if tkb_to_es_obj.args.talkative:
+        if args.talkative:
             utils.report(f"Schema Specs: {schemas}", "H")
-        pbar.update(1)  # controlling schema version
         alto_version = control_schema_version(schemas)
-        if tkb_to_es_obj.args.talkative:
+        if args.talkative:
             if alto_version:
                 utils.report(f"Detected ALTO version: v{alto_version}", "H")
         if alto_version == 2 or alto_version == 4:  # even if the schema spec is ALTO 4, there may be other issues...
             # and we still need to switch to SCRIPTA ALTO specs anyways...
-            if tkb_to_es_obj.args.talkative:
+            if args.talkative:
                 utils.report("Buckle up, we're fixing the schema declaration!", "H")
-            pbar.update(1)  # changing schema declaration to ALTO 4 (SCRIPTA flavored)
-            switch_to_v4(xml_tree)
-            if tkb_to_es_obj.args.talkative:
+            with args.stage("switch_to_v4"):
+                switch_to_v4(xml_tree)
+            if args.talkative:
                 utils.report("I'm adding a <sourceImageInformation> element to point towards the image file", "H")
-            pbar.update(1)  # adding file name in source image information
-            add_sourceimageinformation(xml_tree, file, tkb_to_es_obj.image_files)
-            if tkb_to_es_obj.args.talkative:
+            with args.stage("source_image"):
+                add_sourceimageinformation(xml_tree, file, tkb_to_es_obj.image_files)
+            if args.talkative:
                 utils.report("I'm now looking for <ComposedBlock> and removing them", "H")
-            pbar.update(1)  # removing ComposedBlock elements
-            remove_composed_block(xml_tree)
-            if tkb_to_es_obj.args.talkative:
+            with args.stage("composed_blocks"):
+                remove_composed_block(xml_tree)
+            # baselines and polygons are parsed once, fixed together and written back at the end
+            with args.stage("geometry"):
+                page_geometry = geometry.from_soup(xml_tree)
+            if args.talkative:
                 utils.report("I'm looking at the baselines and fixing them", "H")
-            pbar.update(1)  # fixing baseline declarations
-            extrapolate_baseline_coordinates(xml_tree)
-            if tkb_to_es_obj.args.talkative:
+            with args.stage("baselines"):
+                page_geometry.extrapolate_baselines()
+            if args.talkative:
                 utils.report("I'm cleaning the file", "H")
-            pbar.update(1)  # fixing polygons' points' declaration
-            remove_commas_in_points(xml_tree)
+            with args.stage("points"):
+                page_geometry.normalize()
+            with args.stage("geometry"):
+                page_geometry.write_back()
+            counts = utils.count_tags(xml_tree, ["TextLine", "String"])
+            args.metrics.lines_touched += counts["TextLine"]
+            args.metrics.strings_touched += counts["String"]
             # TODO @alix: improve the saving process, obviously!
-            pbar.update(1)  # saving file
-            save_processed_file(file.split(os.sep)[-1], xml_tree, tkb_to_es_obj.args.destination)
-        pbar.close()
+            with args.stage("save"):
+                output = save_processed_file(file.split(os.sep)[-1], xml_tree, output_destination(tkb_to_es_obj))
+            args.metrics.bytes_out += os.path.getsize(output)
+            if args.sidecars:
+                with args.stage("sidecars"):
+                    sidecar.write_sidecars(output, xml_tree, page_geometry, args.sidecars)
 
         # It might be an idea to just keep the //TextLine as long as their ID start with "line_"
         # If they start with TableCell_, they should become region (maybe?)
@@ -271,6 +300,49 @@ def handle_a_file(file, tkb_to_es_obj):
         # But let's keep in mind that if we just want to import the data into eScriptorium to train a segmenter
         #     really we only need the TextLine and their baseline, we could remove the rest. Just sayin'
         # TODO @alix: add an else statement to record which file were not processed
+    return output
+
+
+def handle_a_file_with_model(file, tkb_to_es_obj):
+    """Same as handle_a_file() but working on the compact page model instead of a BeautifulSoup tree
+
+    :param file: path to an ALTO XML file
+    :param tkb_to_es_obj: Transkribus to Es object
+    :type file: str
+    :type tkb_to_es_obj: TkbToEs
+    :return: path to the transformed file, None if the file was skipped
+    :rtype: str or None
+    """
+    args = tkb_to_es_obj.args
+    with args.stage("read"):
+        alto = model.read(file)
+    args.metrics.bytes_in += utils.file_size(file)
+    with args.stage("schema"):
+        alto_version = None
+        if alto.schema_location:
+            alto_version = control_schema_version(alto.schema_location.split())
+    if args.talkative and alto_version:
+        utils.report(f"Detected ALTO version: v{alto_version}", "H")
+    if alto_version != 2 and alto_version != 4:
+        return None
+    # the schema declaration is switched to ALTO 4 (SCRIPTA flavored) when writing the model
+    # and ComposedBlock elements were already flattened when reading it
+    with args.stage("source_image"):
+        alto.description.file_name = get_image_filename(file, tkb_to_es_obj.image_files)
+    with args.stage("baselines"):
+        page_geometry = geometry.from_model(alto)
+        page_geometry.extrapolate_baselines()
+        page_geometry.write_back()
+    lines, strings = model.count_lines_and_strings(alto)
+    args.metrics.lines_touched += lines
+    args.metrics.strings_touched += strings
+    with args.stage("save"):
+        output = save_processed_file(file.split(os.sep)[-1], model.write(alto), output_destination(tkb_to_es_obj))
+    args.metrics.bytes_out += os.path.getsize(output)
+    if args.sidecars:
+        with args.stage("sidecars"):
+            sidecar.write_sidecars(output, alto, page_geometry, args.sidecars)
+    return output
 
 
 def get_list_of_source_images(mets):
@@ -283,7 +355,7 @@ def get_list_of_source_images(mets):
     """
     source_images = []
     for mets_file in mets:
-        content = utils.read_file(mets_file, 'xml')
+        content = utils.read_file(mets_file, 'mmap')
         # if "Image" option wasn't checked when requesting export on Transkribus
         # there will be no #//ns3:fileGrp[@ID="IMG"]/ns3:file/ns3:Flocat/@ns2:href
         # so Aspyre will not be able to run
@@ -339,3 +411,44 @@ def locate_alto_files(package, source):
         alto_dir_content = utils.list_directory(alto_dir[0])
         alto_dir_content = [f for f in alto_dir_content if f.endswith('.xml')]
     return alto_dir_content
+
+
+def find_documents(trp_export):
+    """List the documents of a TRP Export directory: the directories containing a 'mets.xml' file
+
+    An export of several documents has one directory per document, each with its own 'mets.xml'
+    file and 'alto/' directory.
+
+    :param trp_export: absolute path to the TRP Export directory
+    :type trp_export: str
+    :return: absolute paths to the documents' directories, sorted
+    :rtype: list
+    """
+    documents = []
+    for dirpath, dirnames, filenames in os.walk(trp_export):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        if "mets.xml" in filenames:
+            documents.append(dirpath)
+            dirnames[:] = []
+    return sorted(documents)
+
+
+def document_names(documents, trp_export):
+    """Name the documents of a TRP Export directory after their directory (its path in the export if
+    several documents have the same directory name), so they can be used in file names
+
+    :param documents: absolute paths to the documents' directories
+    :param trp_export: absolute path to the TRP Export directory
+    :type documents: list
+    :type trp_export: str
+    :return: names, in the same order as documents
+    :rtype: list
+    """
+    basenames = [os.path.basename(document) for document in documents]
+    names = []
+    for document, basename in zip(documents, basenames):
+        name = basename
+        if basenames.count(basename) > 1 or not basename:
+            name = os.path.relpath(document, trp_export).replace(os.sep, "_")
+        names.append(re.sub(r"[^\w.-]+", "_", name).strip("_") or "document")
+    return names
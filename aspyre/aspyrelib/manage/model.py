@@ -0,0 +1,402 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT manage model package"""
+
+import io
+import re
+from array import array
+from xml.sax.saxutils import escape
+
+from lxml import etree
+
+from ..utils import utils
+
+
+ALTO_V_SCRIPTA = 'https://gitlab.inria.fr/scripta/escriptorium/-/raw/develop/app/escriptorium/static/alto-4-1-baselines.xsd'
+ALTO_V4_NAMESPACE = "http://www.loc.gov/standards/alto/ns-v4#"
+XSI_NAMESPACE = "http://www.w3.org/2001/XMLSchema-instance"
+XSI_SCHEMA_LOCATION = f"{{{XSI_NAMESPACE}}}schemaLocation"
+ATTR_ESCAPES = {'"': "&quot;", "\n": "&#10;", "\t": "&#9;"}
+
+
+# ------------------------- MODEL
+# geometry is kept as floats (None when the attribute is missing),
+# POINTS and BASELINE as flat arrays of coordinates (x1 y1 x2 y2 ...)
+
+class Polygon():
+    __slots__ = ("points",)
+
+    def __init__(self, points):
+        self.points = points
+
+
+class String():
+    __slots__ = ("id", "content", "hpos", "vpos", "width", "height", "polygon")
+
+    def __init__(self, id=None, content="", hpos=None, vpos=None, width=None, height=None):
+        self.id = id
+        self.content = content
+        self.hpos = hpos
+        self.vpos = vpos
+        self.width = width
+        self.height = height
+        self.polygon = None
+
+
+class TextLine():
+    __slots__ = ("id", "hpos", "vpos", "width", "height", "baseline", "polygon", "strings")
+
+    def __init__(self, id=None, hpos=None, vpos=None, width=None, height=None, baseline=None):
+        self.id = id
+        self.hpos = hpos
+        self.vpos = vpos
+        self.width = width
+        self.height = height
+        self.baseline = baseline
+        self.polygon = None
+        self.strings = []
+
+
+class TextBlock():
+    __slots__ = ("id", "hpos", "vpos", "width", "height", "polygon", "lines")
+
+    def __init__(self, id=None, hpos=None, vpos=None, width=None, height=None):
+        self.id = id
+        self.hpos = hpos
+        self.vpos = vpos
+        self.width = width
+        self.height = height
+        self.polygon = None
+        self.lines = []
+
+
+class Illustration():
+    __slots__ = ("id", "type", "hpos", "vpos", "width", "height", "polygon")
+
+    def __init__(self, id=None, type=None, hpos=None, vpos=None, width=None, height=None):
+        self.id = id
+        self.type = type
+        self.hpos = hpos
+        self.vpos = vpos
+        self.width = width
+        self.height = height
+        self.polygon = None
+
+
+class PrintSpace():
+    __slots__ = ("hpos", "vpos", "width", "height", "blocks")
+
+    def __init__(self, hpos=None, vpos=None, width=None, height=None):
+        self.hpos = hpos
+        self.vpos = vpos
+        self.width = width
+        self.height = height
+        self.blocks = []  # TextBlock and Illustration objects, in document order
+
+
+class Page():
+    __slots__ = ("id", "physical_img_nr", "width", "height", "print_space")
+
+    def __init__(self, id=None, physical_img_nr=None, width=None, height=None):
+        self.id = id
+        self.physical_img_nr = physical_img_nr
+        self.width = width
+        self.height = height
+        self.print_space = None
+
+
+class Description():
+    __slots__ = ("measurement_unit", "file_name")
+
+    def __init__(self, measurement_unit="pixel", file_name=None):
+        self.measurement_unit = measurement_unit
+        self.file_name = file_name
+
+
+class Alto():
+    __slots__ = ("namespace", "schema_location", "description", "page")
+
+    def __init__(self, namespace=None, schema_location=None):
+        self.namespace = namespace
+        self.schema_location = schema_location
+        self.description = Description()
+        self.page = None
+
+    def version(self):
+        """Return the ALTO version declared by the namespace (2, 3 or 4), None if unknown"""
+        found = re.search(r"/alto/ns-v(\d)#", self.namespace or "")
+        return int(found.group(1)) if found else None
+
+    def text_lines(self):
+        """Iterate over every TextLine of the page"""
+        if self.page is None or self.page.print_space is None:
+            return
+        for block in self.page.print_space.blocks:
+            if isinstance(block, TextBlock):
+                yield from block.lines
+
+    def boxes(self):
+        """Iterate over every element of the page with a position (PrintSpace descendants)"""
+        if self.page is None or self.page.print_space is None:
+            return
+        yield from iter_boxes(self.page.print_space.blocks)
+
+
+def iter_boxes(blocks):
+    """Iterate over blocks and every element they contain with a position"""
+    for block in blocks:
+        yield block
+        if isinstance(block, TextBlock):
+            for line in block.lines:
+                yield line
+                yield from line.strings
+
+
+# ------------------------- READER
+def _num(value):
+    """Convert an attribute value to float, None if missing"""
+    return None if value is None else float(value)
+
+
+def parse_points(value):
+    """Parse a POINTS or BASELINE value ("x1,y1 x2,y2" or "x1 y1 x2 y2") into a flat array"""
+    return array("d", map(float, value.replace(",", " ").split()))
+
+
+def read(source):
+    """Parse an ALTO v2, v3 or v4 document into a compact Alto object
+
+    ComposedBlock elements are flattened: their TextBlock and Illustration elements
+    become blocks of the PrintSpace. Elements which are not part of the model are ignored.
+
+    :param source: path to an ALTO XML file, binary file object or bytes
+    :type source: str or file object or bytes
+    :return: page model
+    :rtype: Alto
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    if isinstance(source, str):
+        with utils.open_mapped(source) as raw:
+            return read(raw if not isinstance(raw, bytes) else io.BytesIO(raw))
+    alto = None
+    for alto, block in iter_read(source):
+        if block is not None and alto.page is not None and alto.page.print_space is not None:
+            alto.page.print_space.blocks.append(block)
+    return alto
+
+
+def iter_read(source):
+    """Parse an ALTO document incrementally, block by block
+
+    Yields (alto, block) every time a TextBlock or an Illustration (and its content) was read, then
+    (alto, None) at the end of the document. alto holds what was read so far, apart from the blocks
+    which are not added to the PrintSpace: they can be handled and forgotten as they come.
+
+    :param source: binary file object
+    :type source: file object
+    :return: generator of (page model, block)
+    :rtype: generator
+    """
+    alto = Alto()
+    page = None
+    print_space = None
+    opened = []  # model objects currently open, to attach polygons and children
+    orphans = set()  # blocks outside of a Page
+    for event, el in etree.iterparse(source, events=("start", "end"), remove_comments=True, remove_pis=True,
+                                     huge_tree=True):
+        tag = el.tag.rpartition("}")[2]
+        if event == "start":
+            obj = None
+            if tag == "alto":
+                alto.namespace = el.nsmap.get(None)
+                alto.schema_location = el.get(XSI_SCHEMA_LOCATION)
+            elif tag == "Page":
+                page = Page(el.get("ID"), el.get("PHYSICAL_IMG_NR"), _num(el.get("WIDTH")), _num(el.get("HEIGHT")))
+                alto.page = page
+            elif tag == "PrintSpace" and page is not None:
+                print_space = PrintSpace(_num(el.get("HPOS")), _num(el.get("VPOS")),
+                                         _num(el.get("WIDTH")), _num(el.get("HEIGHT")))
+                page.print_space = print_space
+            elif tag == "TextBlock" or tag == "Illustration":
+                if page is not None and print_space is None:
+                    # blocks outside of a PrintSpace (in margins for instance)
+                    print_space = PrintSpace()
+                    page.print_space = print_space
+                if tag == "TextBlock":
+                    obj = TextBlock(el.get("ID"), _num(el.get("HPOS")), _num(el.get("VPOS")),
+                                    _num(el.get("WIDTH")), _num(el.get("HEIGHT")))
+                else:
+                    obj = Illustration(el.get("ID"), el.get("TYPE"), _num(el.get("HPOS")), _num(el.get("VPOS")),
+                                       _num(el.get("WIDTH")), _num(el.get("HEIGHT")))
+                if print_space is None:
+                    orphans.add(id(obj))  # read but not part of the page
+            elif tag == "TextLine":
+                baseline = el.get("BASELINE")
+                obj = TextLine(el.get("ID"), _num(el.get("HPOS")), _num(el.get("VPOS")),
+                               _num(el.get("WIDTH")), _num(el.get("HEIGHT")),
+                               parse_points(baseline) if baseline else None)
+                if opened and isinstance(opened[-1], TextBlock):
+                    opened[-1].lines.append(obj)
+            elif tag == "String":
+                obj = String(el.get("ID"), el.get("CONTENT", ""), _num(el.get("HPOS")), _num(el.get("VPOS")),
+                             _num(el.get("WIDTH")), _num(el.get("HEIGHT")))
+                if opened and isinstance(opened[-1], TextLine):
+                    opened[-1].strings.append(obj)
+            elif tag == "Polygon" and opened and el.get("POINTS"):
+                opened[-1].polygon = Polygon(parse_points(el.get("POINTS")))
+            if obj is not None:
+                opened.append(obj)
+        else:
+            if tag in ("TextBlock", "Illustration"):
+                block = opened.pop()
+                if id(block) in orphans:
+                    orphans.discard(id(block))
+                else:
+                    yield alto, block
+            elif tag in ("TextLine", "String"):
+                opened.pop()
+            elif tag == "MeasurementUnit":
+                alto.description.measurement_unit = (el.text or "").strip()
+            elif tag == "fileName":
+                alto.description.file_name = (el.text or "").strip()
+            # free the memory used by lxml as we go
+            el.clear()
+            while el.getprevious() is not None:
+                del el.getparent()[0]
+    yield alto, None
+
+
+# ------------------------- STATISTICS
+def count_lines_and_strings(alto):
+    """Return the number of TextLine and String elements in the page
+
+    :param alto: page model
+    :type alto: Alto
+    :return: number of lines, number of strings
+    :rtype: tuple
+    """
+    lines = strings = 0
+    for line in alto.text_lines():
+        lines += 1
+        strings += len(line.strings)
+    return lines, strings
+
+
+# ------------------------- WRITER
+def _fmt(value):
+    """Format a coordinate, without decimals when it is a whole number"""
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _attrs(*pairs):
+    """Render the attributes which are not None"""
+    rendered = []
+    for name, value in pairs:
+        if value is None:
+            continue
+        if isinstance(value, float):
+            value = _fmt(value)
+        else:
+            value = escape(str(value), ATTR_ESCAPES)
+        rendered.append(f' {name}="{value}"')
+    return "".join(rendered)
+
+
+def _points(points):
+    return " ".join(_fmt(value) for value in points)
+
+
+def _shape(polygon, indent):
+    if polygon is None:
+        return []
+    return [f'{indent}<Shape><Polygon POINTS="{_points(polygon.points)}"/></Shape>']
+
+
+def write(alto):
+    """Serialize a page model as an eScriptorium flavoured ALTO 4 document
+
+    :param alto: page model
+    :type alto: Alto
+    :return: ALTO XML document
+    :rtype: str
+    """
+    out = write_head(alto)
+    if alto.page is not None and alto.page.print_space is not None:
+        for block in alto.page.print_space.blocks:
+            out.extend(_write_block(block))
+    out.extend(write_tail(alto))
+    return "\n".join(out) + "\n"
+
+
+def write_head(alto):
+    """Serialize the beginning of a document, up to the opening of the PrintSpace, as a list of lines"""
+    out = ['<?xml version="1.0" encoding="UTF-8"?>',
+           f'<alto xmlns="{ALTO_V4_NAMESPACE}" xmlns:xsi="{XSI_NAMESPACE}" '
+           f'xsi:schemaLocation="{ALTO_V4_NAMESPACE} {ALTO_V_SCRIPTA}">',
+           '  <Description>',
+           f'    <MeasurementUnit>{escape(alto.description.measurement_unit or "pixel")}</MeasurementUnit>']
+    if alto.description.file_name is not None:
+        out.append(f'    <sourceImageInformation><fileName>{escape(alto.description.file_name)}</fileName>'
+                   '</sourceImageInformation>')
+    out.append('  </Description>')
+    out.append('  <Layout>')
+    page = alto.page
+    if page is not None:
+        out.append(f'    <Page{_attrs(("ID", page.id), ("PHYSICAL_IMG_NR", page.physical_img_nr), ("WIDTH", page.width), ("HEIGHT", page.height))}>')
+        ps = page.print_space
+        if ps is not None:
+            out.append(f'      <PrintSpace{_attrs(("HPOS", ps.hpos), ("VPOS", ps.vpos), ("WIDTH", ps.width), ("HEIGHT", ps.height))}>')
+    return out
+
+
+def write_tail(alto):
+    """Serialize the end of a document, from the closing of the PrintSpace, as a list of lines"""
+    out = []
+    if alto.page is not None:
+        if alto.page.print_space is not None:
+            out.append('      </PrintSpace>')
+        out.append('    </Page>')
+    out.append('  </Layout>')
+    out.append('</alto>')
+    return out
+
+
+def write_block(block):
+    """Serialize a TextBlock or an Illustration (and its content)
+
+    :param block: block of the page
+    :type block: TextBlock or Illustration
+    :return: XML fragment, ending with a new line
+    :rtype: str
+    """
+    return "\n".join(_write_block(block)) + "\n"
+
+
+def _write_block(block):
+    """Serialize a TextBlock or an Illustration (and its content) as a list of lines"""
+    box = (("HPOS", block.hpos), ("VPOS", block.vpos), ("WIDTH", block.width), ("HEIGHT", block.height))
+    if isinstance(block, Illustration):
+        attrs = _attrs(("ID", block.id), ("TYPE", block.type), *box)
+        if block.polygon is None:
+            return [f'        <Illustration{attrs}/>']
+        return [f'        <Illustration{attrs}>'] + _shape(block.polygon, "          ") + ['        </Illustration>']
+    out = [f'        <TextBlock{_attrs(("ID", block.id), *box)}>']
+    out += _shape(block.polygon, "          ")
+    for line in block.lines:
+        baseline = _points(line.baseline) if line.baseline is not None else None
+        out.append(f'          <TextLine{_attrs(("ID", line.id), ("BASELINE", baseline), ("HPOS", line.hpos), ("VPOS", line.vpos), ("WIDTH", line.width), ("HEIGHT", line.height))}>')
+        out += _shape(line.polygon, "            ")
+        for string in line.strings:
+            attrs = _attrs(("ID", string.id), ("CONTENT", string.content), ("HPOS", string.hpos),
+                           ("VPOS", string.vpos), ("WIDTH", string.width), ("HEIGHT", string.height))
+            if string.polygon is None:
+                out.append(f'            <String{attrs}/>')
+            else:
+                out.append(f'            <String{attrs}>')
+                out += _shape(string.polygon, "              ")
+                out.append('            </String>')
+        out.append('          </TextLine>')
+    out.append('        </TextBlock>')
+    return out
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT manage pipe package"""
+
+from . import manage_tkbtoes, manage_pdfaltotoes, manage_limbtoes, model, geometry
+from .check import ACCEPTED_VERSIONS
+from ..utils import utils
+
+
+def parse_image_size(value):
+    """Parse an image size given as "WIDTHxHEIGHT"
+
+    :param value: image size, ex: "2480x3508"
+    :type value: str
+    :return: (width, height)
+    :rtype: tuple
+    """
+    try:
+        width, height = (int(v) for v in value.lower().split("x"))
+    except (AttributeError, ValueError):
+        raise ValueError(f"{value} is not a valid image size (expected WIDTHxHEIGHT)")
+    if width <= 0 or height <= 0:
+        raise ValueError(f"{value} is not a valid image size (expected WIDTHxHEIGHT)")
+    return width, height
+
+
+def detect_version(alto, scenario):
+    """Return the ALTO version of a document as each scenario detects it"""
+    if scenario == "tkb":
+        return manage_tkbtoes.control_schema_version(alto.schema_location.split()) if alto.schema_location else None
+    declarations = utils.schema_declarations(alto.namespace, alto.schema_location)
+    if scenario == "pdfalto":
+        return manage_pdfaltotoes.control_schema_version(declarations)
+    return manage_limbtoes.control_schema_version(declarations)
+
+
+def filter_document(instream, outstream, scenario, image_name, image_size=None, vpadding=0):
+    """Convert an ALTO document read from instream and write it to outstream, block by block
+
+    The transformations are those of the scenarios' handle_a_file_with_model(): baselines are
+    extrapolated (tkb), coordinates are scaled to the image size (pdfalto, limb) and VPOS of String
+    elements padded (pdfalto, limb). With pdfalto, the blocks read before the Illustration giving
+    the size of the canvas are kept until it is found.
+
+    :param instream: ALTO XML document opened in binary mode
+    :param outstream: binary stream where the converted document is written
+    :param scenario: keyword describing the scenario
+    :param image_name: name of the image, written in sourceImageInformation/fileName
+    :param image_size: (width, height) of the image (pdfalto and limb)
+    :param vpadding: value to add to VPOS attributes in String nodes (pdfalto and limb)
+    :type instream: file object
+    :type outstream: file object
+    :type scenario: str
+    :type image_name: str
+    :type image_size: tuple or None
+    :type vpadding: int
+    :return: number of blocks written
+    :rtype: int
+    """
+    if scenario in ("pdfalto", "limb") and image_size is None:
+        raise ValueError(f"The image size is required in {scenario} scenario")
+    checked = started = False
+    ratio = None
+    pending = []
+    written = 0
+
+    def emit(text):
+        outstream.write(text.encode("utf-8"))
+
+    def convert(block):
+        page_geometry = geometry.from_blocks([block])
+        if scenario == "tkb":
+            page_geometry.extrapolate_baselines()
+        else:
+            page_geometry.scale(ratio)
+            if vpadding:
+                page_geometry.pad(vpadding, names=("String",))
+        page_geometry.write_back()
+        emit(model.write_block(block))
+
+    for alto, block in model.iter_read(instream):
+        if not checked:
+            version = detect_version(alto, scenario)
+            if version not in ACCEPTED_VERSIONS[scenario]:
+                raise ValueError(f"Unsupported ALTO version for {scenario} scenario: {version}")
+            alto.description.file_name = image_name
+            checked = True
+        if ratio is None and scenario != "tkb":
+            if scenario == "limb" and alto.page is not None:
+                ratio = manage_limbtoes.get_ratio_from_sizes(image_size, alto.page.width, alto.page.height)
+            elif scenario == "pdfalto" and isinstance(block, model.Illustration) and block.type == "image":
+                ratio = manage_pdfaltotoes.get_ratio_from_sizes(image_size, block.width, block.height)
+        if block is None:
+            break
+        if ratio is None and scenario != "tkb":
+            pending.append(block)
+            continue
+        if not started:
+            emit("\n".join(model.write_head(alto)) + "\n")
+            started = True
+        for waiting in pending:
+            convert(waiting)
+        written += len(pending) + 1
+        pending = []
+        convert(block)
+        outstream.flush()
+    if pending or (ratio is None and scenario != "tkb"):
+        raise ValueError("Couldn't find the size of the page in the document")
+    if not started:
+        emit("\n".join(model.write_head(alto)) + "\n")
+    emit("\n".join(model.write_tail(alto)) + "\n")
+    outstream.flush()
+    return written
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT manage sidecar package"""
+
+import json
+import os
+
+import numpy as np
+
+from . import geometry, model
+
+SIDECAR_KINDS = ["text", "geometry"]
+TEXT_SUFFIX = ".lines.jsonl"
+GEOMETRY_SUFFIX = ".geometry.npz"
+
+
+def sidecar_paths(output):
+    """Return the paths to the sidecar files of a transformed file (whether they exist or not)
+
+    :param output: path to the transformed ALTO XML file
+    :type output: str
+    :return: kind -> path
+    :rtype: dict
+    """
+    base = output[:-len(".xml")] if output.endswith(".xml") else output
+    return {"text": base + TEXT_SUFFIX, "geometry": base + GEOMETRY_SUFFIX}
+
+
+def image_name(page):
+    """Return the image file name declared in a page (sourceImageInformation/fileName)
+
+    :param page: ALTO XML tree or page model
+    :type page: type(BeautifulSoup()) or model.Alto
+    :return: image file name, None if there is none
+    :rtype: str or None
+    """
+    if isinstance(page, model.Alto):
+        return page.description.file_name
+    tag = page.find("fileName")
+    return tag.get_text().strip() if tag is not None else None
+
+
+def _line_text(line):
+    if isinstance(line, model.TextLine):
+        return " ".join(string.content for string in line.strings)
+    return " ".join(string.get("CONTENT", "") for string in line.find_all("String"))
+
+
+def _line_polygon(line):
+    if isinstance(line, model.TextLine):
+        return line.polygon
+    shape = line.find("Shape", recursive=False)
+    return shape.find("Polygon") if shape is not None else None
+
+
+def collect_lines(page_geometry):
+    """Gather the text and the coordinates of the TextLine elements of a page from its geometry
+
+    Call it after page_geometry.write_back(): coordinates are those of the transformed file.
+
+    :param page_geometry: geometry of the page (see geometry.from_soup() and geometry.from_model())
+    :type page_geometry: geometry.PageGeometry
+    :return: ids, texts, boxes (n x 4), baselines and polygons (lists of flat coordinate arrays)
+    :rtype: dict
+    """
+    shapes = {}
+    for index, (owner, kind) in enumerate(zip(page_geometry.shape_owners, page_geometry.shape_kinds)):
+        shapes[(id(owner), kind)] = index
+    ids, texts, rows, baselines, polygons = [], [], [], [], []
+    empty = np.empty(0)
+    for row, (owner, name) in enumerate(zip(page_geometry.box_owners, page_geometry.box_names)):
+        if name != "TextLine":
+            continue
+        ids.append(owner.id if isinstance(owner, model.TextLine) else owner.get("ID"))
+        texts.append(_line_text(owner))
+        rows.append(row)
+        baseline = shapes.get((id(owner), geometry.BASELINE))
+        baselines.append(empty if baseline is None else page_geometry.shape(baseline))
+        polygon = shapes.get((id(_line_polygon(owner)), geometry.POINTS))
+        polygons.append(empty if polygon is None else page_geometry.shape(polygon))
+    return {"ids": ids, "texts": texts, "boxes": page_geometry.boxes[rows].reshape(-1, 4),
+            "baselines": baselines, "polygons": polygons}
+
+
+def _ragged(shapes):
+    offsets = np.zeros(len(shapes) + 1, dtype=np.int64)
+    np.cumsum([len(shape) for shape in shapes], out=offsets[1:])
+    coords = np.concatenate(shapes).astype(np.float32) if shapes else np.empty(0, dtype=np.float32)
+    return coords, offsets
+
+
+def write_text(path, lines, page, image):
+    """Write the text of the lines of a page as JSON lines"""
+    with open(path, "w", encoding="utf-8") as fh:
+        for number, (line_id, text) in enumerate(zip(lines["ids"], lines["texts"])):
+            fh.write(json.dumps({"page": page, "image": image, "line": number, "id": line_id, "text": text},
+                                ensure_ascii=False) + "\n")
+
+
+def write_geometry(path, lines, page, image):
+    """Write the coordinates of the lines of a page in a compressed NumPy archive"""
+    baseline_coords, baseline_offsets = _ragged(lines["baselines"])
+    polygon_coords, polygon_offsets = _ragged(lines["polygons"])
+    with open(path, "wb") as fh:
+        np.savez_compressed(fh, page=np.array(page), image=np.array(image or ""),
+                            ids=np.array([line_id or "" for line_id in lines["ids"]], dtype=str),
+                            boxes=lines["boxes"].astype(np.float32),
+                            baseline_coords=baseline_coords, baseline_offsets=baseline_offsets,
+                            polygon_coords=polygon_coords, polygon_offsets=polygon_offsets)
+
+
+def write_sidecars(output, page, page_geometry, kinds):
+    """Write the sidecar files of a transformed page next to it
+
+    :param output: path to the transformed ALTO XML file
+    :param page: the transformed page (for the name of its image)
+    :param page_geometry: geometry of the transformed page, written back
+    :param kinds: sidecars to write ("text" and/or "geometry")
+    :type output: str
+    :type page: type(BeautifulSoup()) or model.Alto
+    :type page_geometry: geometry.PageGeometry
+    :type kinds: list
+    :return: paths to the written files
+    :rtype: list
+    """
+    lines = collect_lines(page_geometry)
+    name, image = os.path.basename(output), image_name(page)
+    paths = sidecar_paths(output)
+    written = []
+    if "text" in kinds:
+        write_text(paths["text"], lines, name, image)
+        written.append(paths["text"])
+    if "geometry" in kinds:
+        write_geometry(paths["geometry"], lines, name, image)
+        written.append(paths["geometry"])
+    return written
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT manage stream package"""
+
+import os
+import posixpath
+import shutil
+import tarfile
+
+from . import zip
+from ..utils import utils, storage
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+STREAM_ARCHIVE_EXTENSIONS = [".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz", ".tar.zst", ".tzst"]
+ZSTD_EXTENSIONS = [".tar.zst", ".tzst"]
+
+
+def is_stream_archive(filename):
+    """Control that a file is a tar archive Aspyre can read as a stream
+
+    :param filename: name of the file
+    :type filename: str
+    :return: True if it is a (compressed) tar archive, False otherwise
+    :rtype: bool
+    """
+    return any(filename.lower().endswith(ext) for ext in STREAM_ARCHIVE_EXTENSIONS)
+
+
+def strip_extension(filename):
+    """Remove the (compound) extension of a tar archive's name
+
+    ex: 'export.tar.gz' -> 'export'
+
+    :param filename: name of the archive
+    :type filename: str
+    :return: name without extension
+    :rtype: str
+    """
+    for ext in STREAM_ARCHIVE_EXTENSIONS:
+        if filename.lower().endswith(ext):
+            return filename[:-len(ext)]
+    return filename
+
+
+def open_stream(source):
+    """Open a (compressed) tar archive for sequential reading
+
+    :param source: path to the archive or store://<bucket>/<key> (read with prefetching, see storage.ObjectReader)
+    :type source: str
+    :return: archive opened in stream mode (members can only be read in order, once)
+    :rtype: tarfile.TarFile
+    """
+    if any(source.lower().endswith(ext) for ext in ZSTD_EXTENSIONS):
+        if zstandard is None:
+            raise ImportError("Reading .tar.zst archives requires the 'zstandard' package (pip install zstandard)")
+        reader = zstandard.ZstdDecompressor().stream_reader(storage.open_read(source), closefd=True)
+        tar = tarfile.open(fileobj=reader, mode="r|")
+    elif storage.is_remote(source):
+        # gzip, bzip2 and xz compression are detected by tarfile
+        tar = tarfile.open(fileobj=storage.open_read(source), mode="r|*")
+    else:
+        return tarfile.open(source, mode="r|*")
+    tar.fileobj._extfileobj = False  # the archive owns the reader: closed with it
+    return tar
+
+
+def safe_member_name(member):
+    """Return the normalized name of a tar member, or None if it must not be written on disk
+
+    Only regular files are kept: links, devices, absolute paths and paths
+    going out of the destination ("../") are refused.
+
+    :param member: member of a tar archive
+    :type member: tarfile.TarInfo
+    :return: normalized relative path, or None
+    :rtype: str or None
+    """
+    if not member.isfile():
+        return None
+    name = posixpath.normpath(member.name.replace("\\", "/"))
+    if name.startswith("/") or name == ".." or name.startswith("../") or name == ".":
+        return None
+    return name
+
+
+def iter_unpack(source, unpack_dest, scenario, load=None):
+    """Read a tar archive as a stream and write its eligible members, one at a time
+
+    :param source: path to the archive
+    :param unpack_dest: path to the directory where the members should be written
+    :param scenario: keyword describing the scenario (see zip.is_eligible())
+    :param load: function load(name, path, fh, size) called before a member is written: if it returns True,
+                 it read the member from fh and the member isn't written (path is where it would have been)
+    :type source: str
+    :type unpack_dest: str
+    :type scenario: str
+    :type load: function or None
+    :return: generator of (relative path in the archive, path to the (written) file, size in bytes)
+    :rtype: generator
+    """
+    ignored = 0
+    with open_stream(source) as tar:
+        for member in tar:
+            name = safe_member_name(member)
+            if name is None:
+                if not member.isdir():
+                    ignored += 1
+                continue
+            if not zip.is_eligible(name, scenario):
+                ignored += 1
+                continue
+            path = os.path.join(unpack_dest, *name.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with tar.extractfile(member) as fh:
+                if load is None or not load(name, path, fh, member.size):
+                    with open(path, "wb") as out:
+                        shutil.copyfileobj(fh, out)
+            yield name, path, member.size
+    utils.report(f"Ignored {ignored} non-eligible file(s) while unpacking\n---", "W")
+
+
+def classify(name, scenario):
+    """Tell what a member of an archive is for a scenario (mirrors the scenarios' locate_* functions)
+
+    :param name: relative path of the member in the archive
+    :param scenario: keyword describing the scenario
+    :type name: str
+    :type scenario: str
+    :return: "alto", "image", "mets" or None if the member is not used
+    :rtype: str or None
+    """
+    parts = name.split("/")
+    if scenario == "tkb":
+        # the document may be in a directory of the export (see document_of())
+        if parts[-1] == "mets.xml":
+            return "mets"
+        if len(parts) >= 2 and parts[-2] == "alto" and name.endswith(".xml"):
+            return "alto"
+    elif scenario == "pdfalto":
+        if len(parts) == 3 and parts[1] == "out" and name.endswith(".xml") and not name.endswith("_metadata.xml"):
+            return "alto"
+        if len(parts) == 4 and parts[1] == "out" and parts[2].endswith("xml_data") and name.endswith(".png"):
+            return "image"
+    elif scenario == "limb":
+        if len(parts) <= 2:
+            return "alto" if name.endswith(".xml") else "image"
+    return None
+
+
+def document_of(name):
+    """Return the directory of the Transkribus document a mets.xml or ALTO XML member belongs to
+
+    ex: 'export/doc_1/alto/page.xml' -> 'export/doc_1', 'mets.xml' -> ''
+
+    :param name: relative path of the member in the archive
+    :type name: str
+    :return: relative path of the document's directory, empty at the root of the archive
+    :rtype: str
+    """
+    parts = name.split("/")
+    return "/".join(parts[:-2] if parts[-2:-1] == ["alto"] else parts[:-1])
+
+
+def paired_files(file, image_files, scenario):
+    """Return the images read so far an ALTO XML file may be paired with
+
+    :param file: path to the ALTO XML file
+    :param image_files: image files read so far
+    :param scenario: keyword describing the scenario ("pdfalto" or "limb": Transkribus pages are paired
+                     with the image file names listed in mets.xml)
+    :type file: str
+    :type image_files: list
+    :type scenario: str
+    :return: paths to the images
+    :rtype: list
+    """
+    if scenario == "pdfalto":
+        return [image for image in image_files if f"{file}_data" in image]
+    if scenario == "limb":
+        # same rule as manage_limbtoes.get_image_filename()
+        numbering = os.path.basename(file).replace('.xml', '').split("_")[-1]
+        return [image for image in image_files if numbering in os.path.basename(image).split('.')[0].split('_')[-1]]
+    return []
+
+
+def page_is_ready(file, image_files, scenario):
+    """Control that the members an ALTO XML file is paired with have already been read
+
+    :param file: path to the ALTO XML file
+    :param image_files: image files read so far (tkb: image file names listed in mets.xml)
+    :param scenario: keyword describing the scenario
+    :type file: str
+    :type image_files: list
+    :type scenario: str
+    :return: True if the file can be converted
+    :rtype: bool
+    """
+    if scenario == "tkb":
+        # the image file names come from mets.xml
+        return len(image_files) > 0
+    return len(paired_files(file, image_files, scenario)) > 0
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT manage validation package"""
+
+import os
+
+from lxml import etree
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "schemas")
+# ALTO 4.4 (Library of Congress): its BASELINE accepts the list of points eScriptorium's
+# alto-4-1-baselines.xsd (see manage_tkbtoes.ALTO_V_SCRIPTA) added to ALTO 4.1
+BUNDLED_SCHEMA = os.path.join(SCHEMA_DIR, "alto-4-4.xsd")
+MAX_ERRORS = 5  # schema errors kept per invalid page
+
+_schemas = {}  # path to the XSD -> compiled schema, in this process
+_parser = None
+
+
+def get_schema(path=BUNDLED_SCHEMA):
+    """Return the compiled schema of an XSD file, compiled on the first call in the process
+
+    :param path: path to the XSD file (the files it imports are looked up next to it)
+    :type path: str
+    :return: compiled schema
+    :rtype: etree.XMLSchema
+    """
+    path = os.path.abspath(path)
+    schema = _schemas.get(path)
+    if schema is None:
+        parser = etree.XMLParser(no_network=True, resolve_entities=False)
+        schema = etree.XMLSchema(etree.parse(path, parser))
+        _schemas[path] = schema
+    return schema
+
+
+def validate_file(path, schema_path=BUNDLED_SCHEMA, max_errors=MAX_ERRORS):
+    """Validate a transformed file against the ALTO schema
+
+    :param path: path to the transformed file
+    :param schema_path: path to the XSD file
+    :param max_errors: number of errors returned at most
+    :type path: str
+    :type schema_path: str
+    :type max_errors: int
+    :return: first schema errors ("line <n>: <message>"), empty if the file is valid
+    :rtype: list
+    """
+    global _parser
+    schema = get_schema(schema_path)
+    if _parser is None:
+        _parser = etree.XMLParser(no_network=True, resolve_entities=False, huge_tree=True)
+    try:
+        document = etree.parse(path, _parser)
+    except etree.XMLSyntaxError as e:
+        return [f"line {e.lineno}: {e.msg}"]
+    if schema.validate(document):
+        return []
+    return [f"line {error.line}: {error.message}" for error in list(schema.error_log)[:max_errors]]
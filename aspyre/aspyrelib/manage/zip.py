@@ -7,15 +7,32 @@ author: Alix Chagué
 date: 19/03/2021
 """
 
+import json
 import os
-from zipfile import ZipFile
+import shutil
+import struct
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from zipfile import ZipFile, ZipInfo, BadZipFile
 
-from ..utils import utils
+from ..utils import utils, storage
 
 ALLOWED_ARCHIVE_EXTENSIONS = ["zip"]
+ARCHIVE_ROOT = "alto4eScriptorium"
+LOCAL_HEADER_SIZE = 30  # fixed part of a zip local file header
+COPY_CHUNK_SIZE = 1024 * 1024
+DATA_DESCRIPTOR_SIZE = 16  # signature, CRC and sizes written after the data of a streamed member
+MAX_WASTE = 0.25  # share of dead bytes in an updated archive above which it is compacted
+PREFETCH_BYTES = 8 * 1024 * 1024  # member data fetched per batch of requests from an object store archive
 
 
 # ------------------------- ZIP
+def tmp_path(path):
+    """Return a name to write a file aside before renaming it to path, private to the current process"""
+    return f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+
+
 def allowed_archive_file(filename, allowed_extensions=ALLOWED_ARCHIVE_EXTENSIONS):
     """Control that file extension is accepted
 
@@ -35,39 +52,141 @@ def allowed_archive_file(filename, allowed_extensions=ALLOWED_ARCHIVE_EXTENSIONS
         return False
 
 
-def safely_unzip(zip_src, unpack_dest, scenario):
-    """Unzip a zip file with as many precautions as possible
+def is_eligible(filename, scenario):
+    """Control that an archive member should be unpacked for a scenario
 
-    :param zip_src: path to the directory where the uploaded zip file is located
-    :param unpack_dest: path to the directory where the zip file should be unzipped
-    :type zip_src: str
-    :type unpack_dest: str
-    :return: ('error', '<message>') if an error occurred, (None, None) otherwise
-    :rtype: tuple
+    :param filename: name of the member in the archive
+    :param scenario: keyword describing the scenario
+    :type filename: str
+    :type scenario: str
+    :return: True if the member is eligible, False if it should be ignored
+    :rtype: bool
     """
-    zph = ZipFile(zip_src, 'r')
-    files = zph.infolist()
-    ignored_files = []
+    lower = filename.lower()
     if scenario == "tkb":
     # then we are only interested in xml files
-        ignored_files += [f for f in files if not f.filename.lower().endswith('.xml')]
+        if not lower.endswith('.xml'):
+            return False
     elif scenario == "pdfalto" or scenario == "limb":
-        ignored_files += [f for f in files if not (f.filename.lower().endswith('.xml') or utils.is_image(f.filename))]
+        if not (lower.endswith('.xml') or utils.is_image(filename)):
+            return False
     # ignoring hidden files and folder
-    ignored_files += [f for f in files if f.filename.split(os.sep)[-1].startswith('.') or f.filename.startswith('.')]
+    if filename.split(os.sep)[-1].startswith('.') or filename.startswith('.'):
+        return False
     # ignoring OSX generated folders
-    ignored_files += [f for f in files if f.filename.lower().startswith('__macosx')]
-    files = [f for f in files if f not in ignored_files]
+    if lower.startswith('__macosx'):
+        return False
     # additional control
     # ignoring files containing .exe, .php or .asp - ex: 'my_suspicious_file.exe.xml' will be ignored
     # note that this might cause unexpected errors TODO: test
-    ignored_files += [f for f in files if '.exe' in f.filename.lower() or '.php' in f.filename.lower() or \
-                      '.asp' in f.filename.lower() or '.py' in f.filename.lower()]
+    if '.exe' in lower or '.php' in lower or '.asp' in lower or '.py' in lower:
+        return False
+    return True
+
+
+def select_members(files, scenario):
+    """Sort the members of an archive between files eligible for a scenario and ignored files
+
+    :param files: members of the archive
+    :param scenario: keyword describing the scenario
+    :type files: list
+    :type scenario: str
+    :return: eligible members, ignored members
+    :rtype: tuple
+    """
+    eligible_files, ignored_files = [], []
+    for f in files:
+        if is_eligible(f.filename, scenario):
+            eligible_files.append(f)
+        else:
+            ignored_files.append(f)
+    return eligible_files, ignored_files
+
+
+def open_zip(source):
+    """Open a zip file for reading, from the local filesystem or from the object store (see storage.open_read())
+
+    :param source: path to the zip file or store://<bucket>/<key>
+    :type source: str
+    :return: zip file opened for reading
+    :rtype: ZipFile
+    """
+    if not storage.is_remote(source):
+        return ZipFile(source, "r")
+    fh = storage.open_read(source)
+    try:
+        zph = ZipFile(fh, "r")
+    except Exception:
+        fh.close()
+        raise
+    zph._filePassed = 0  # the archive owns the reader: closed with it
+    return zph
+
+
+def member_span(member):
+    """Return the number of bytes a member takes in its archive, local header included (upper bound)"""
+    return LOCAL_HEADER_SIZE + len(member.orig_filename.encode("utf-8")) + len(member.extra) \
+        + member.compress_size + DATA_DESCRIPTOR_SIZE + 64  # the local extra field can be longer
+
+
+def iter_prefetched(zph, members, batch_bytes=PREFETCH_BYTES):
+    """Yield the members of an archive in the order they are stored; from the object store, the data of
+    the next batch of members is fetched beforehand, in as few ranged requests as possible (the members
+    left out, ex: the images in Transkribus scenario, aren't read)
+
+    :param zph: zip file opened for reading
+    :param members: members to read
+    :param batch_bytes: bytes of member data fetched per batch
+    :type zph: ZipFile
+    :type members: list
+    :type batch_bytes: int
+    :return: generator of ZipInfo
+    :rtype: generator
+    """
+    members = sorted(members, key=lambda m: m.header_offset)
+    reader = getattr(zph.fp, "raw", None)
+    if not hasattr(reader, "prefetch_ranges"):
+        yield from members
+        return
+    index = 0
+    while index < len(members):
+        batch, total = [], 0
+        while index < len(members) and (not batch or total + member_span(members[index]) <= batch_bytes):
+            batch.append(members[index])
+            total += member_span(members[index])
+            index += 1
+        reader.prefetch_ranges([(member.header_offset, member_span(member)) for member in batch])
+        yield from batch
+
+
+def unpack_destination(source):
+    """Return the path to the directory where an archive is unpacked
+
+    :param source: path to archive
+    :type source: str
+    :return: path to the directory
+    :rtype: str
+    """
+    return os.path.join(os.path.dirname(source), f"{os.path.basename(source).split('.')[0]}_unpacking")
+
+
+def safely_unzip(zip_src, unpack_dest, scenario):
+    """Unzip a zip file with as many precautions as possible
+
+    :param zip_src: path to the directory where the uploaded zip file is located
+    :param unpack_dest: path to the directory where the zip file should be unzipped
+    :type zip_src: str
+    :type unpack_dest: str
+    :return: ('error', '<message>') if an error occurred, (None, None) otherwise
+    :rtype: tuple
+    """
+    zph = open_zip(zip_src)
+    files, ignored_files = select_members(zph.infolist(), scenario)
     if scenario == "tkb":
         if 'mets.xml' not in [f.filename.split(os.sep)[-1] for f in files]:
             zph.close()
             return "error", "This is not a valid Transkribus Archive (not mets.xml file)"
-    for file in files:
+    for file in iter_prefetched(zph, files):
         zph.extract(file, path=unpack_dest)
     zph.close()
     utils.report(f"Ignored {len(ignored_files)} non-eligible file(s) while unpacking\n---", "W")
@@ -75,11 +194,13 @@ def safely_unzip(zip_src, unpack_dest, scenario):
     return None, None
 
 
-def unzip_scenario(source, scenario):
+def unzip_scenario(source, scenario, unpack_dest=None):
     """Take an archive and safely unzip it
 
     :param source: path to archive
     :type source: str
+    :param unpack_dest: path to the directory where the archive should be unpacked (default: next to it)
+    :type unpack_dest: str or None
     :return: False if failed, else path to the unzipped source
     :rtype: bool or str
     """
@@ -87,7 +208,8 @@ def unzip_scenario(source, scenario):
         utils.report("This file extension is not allowed\n---", "E")
         return False
 
-    unpack_dest = os.path.join(os.path.dirname(source), f"{os.path.basename(source).split('.')[0]}_unpacking")
+    if unpack_dest is None:
+        unpack_dest = unpack_destination(source)
     try:
         os.mkdir(unpack_dest)
     except FileExistsError as e:
@@ -104,37 +226,442 @@ def unzip_scenario(source, scenario):
         return unpack_dest
 
 
-def zip_dir(destination, sourcepath):
+def copy_raw_member(src_zph, member, dst_zph, arcname):
+    """Copy a member of a zip file into another one as it is stored (no decompression nor recompression)
+
+    zipfile has no public API for this: the compressed bytes are copied after a local header
+    built from the source member, and the member is registered in dst_zph's central directory.
+
+    :param src_zph: zip file opened for reading
+    :param member: member of src_zph to copy
+    :param dst_zph: zip file opened for writing
+    :param arcname: name of the member in dst_zph
+    :type src_zph: ZipFile
+    :type member: ZipInfo
+    :type dst_zph: ZipFile
+    :type arcname: str
+    :return: None
+    """
+    if member.flag_bits & 0x1:
+        raise ValueError(f"{member.filename} is encrypted")
+    src_zph.fp.seek(member.header_offset)
+    header = src_zph.fp.read(LOCAL_HEADER_SIZE)
+    if header[:4] != b"PK\x03\x04":
+        raise BadZipFile(f"Bad local file header for {member.filename}")
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    data_offset = member.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length
+
+    zinfo = ZipInfo(arcname, date_time=member.date_time)
+    zinfo.compress_type = member.compress_type
+    # sizes and CRC are known: no data descriptor after the data
+    zinfo.flag_bits = member.flag_bits & ~0x08
+    zinfo.CRC = member.CRC
+    zinfo.compress_size = member.compress_size
+    zinfo.file_size = member.file_size
+    zinfo.external_attr = member.external_attr
+    zinfo.header_offset = dst_zph.fp.tell()
+    dst_zph.fp.write(zinfo.FileHeader())
+    src_zph.fp.seek(data_offset)
+    remaining = member.compress_size
+    while remaining > 0:
+        chunk = src_zph.fp.read(min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise BadZipFile(f"Truncated data for {member.filename}")
+        dst_zph.fp.write(chunk)
+        remaining -= len(chunk)
+    dst_zph.filelist.append(zinfo)
+    dst_zph.NameToInfo[arcname] = zinfo
+    dst_zph.start_dir = dst_zph.fp.tell()
+    dst_zph._didModify = True
+
+
+def write_images(ziph, files, images, image_source=None):
+    """Add the images paired with XML files to a zip file being written, under alto4eScriptorium/
+
+    :param ziph: zip file opened for writing
+    :param files: names of the XML files in the archive
+    :param images: XML file name -> (image member name in image_source or path to the image, name in the archive)
+    :param image_source: path to the source zip file the images are copied from without recompression,
+                         None if images are paths to files (then stored without compression)
+    :type ziph: ZipFile
+    :type files: list
+    :type images: dict
+    :type image_source: str or None
+    :return: number of images added
+    :rtype: int
+    """
+    added = 0
+    src_zph = open_zip(image_source) if image_source else None
+    try:
+        for file in files:
+            if file not in images:
+                continue
+            image, arcname = images[file]
+            arcname = os.path.join(ARCHIVE_ROOT, arcname)
+            if arcname in ziph.NameToInfo:
+                continue  # several pages sharing an image
+            if src_zph is not None:
+                try:
+                    copy_raw_member(src_zph, src_zph.getinfo(image), ziph, arcname)
+                except (KeyError, ValueError) as e:
+                    utils.report(f"Couldn't add {image} to the archive: {e}", "W")
+                    continue
+            else:
+                # images are already compressed, storing them is a plain copy
+                with open(image, "rb") as fh, ziph.open(ZipInfo.from_file(image, arcname), "w") as out:
+                    shutil.copyfileobj(fh, out, COPY_CHUNK_SIZE)
+            added += 1
+    finally:
+        if src_zph is not None:
+            src_zph.close()
+    return added
+
+
+def write_zip(zip_destination, source, files, images=None, image_source=None):
+    """Write XML files in a new zip file, under alto4eScriptorium/
+
+    The archive is written next to its destination and renamed once complete,
+    so a file found at zip_destination is always a finished archive.
+
+    :param zip_destination: path to the zip file to create
+    :param source: path to the directory containing the XML files
+    :param files: names of the XML files to put in the archive
+    :param images: if set, also put the images paired with the XML files in the archive (see write_images())
+    :param image_source: path to the source zip file containing the images (see write_images())
+    :type zip_destination: str
+    :type source: str
+    :type files: list
+    :type images: dict or None
+    :type image_source: str or None
+    :return: path to the created zip file
+    :rtype: str
+    """
+    tmp_destination = tmp_path(zip_destination)
+    try:
+        with ZipFile(tmp_destination, "w") as ziph:
+            for file in files:
+                ziph.write(os.path.join(source, file), arcname=os.path.join(ARCHIVE_ROOT, file))
+            if images:
+                write_images(ziph, files, images, image_source)
+        os.replace(tmp_destination, zip_destination)
+    except Exception:
+        if os.path.exists(tmp_destination):
+            os.remove(tmp_destination)
+        raise
+    return zip_destination
+
+
+def file_crc(path):
+    """Return the CRC-32 of a file, as stored in zip files"""
+    crc = 0
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(COPY_CHUNK_SIZE), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def is_unchanged(member, crc, size):
+    """Control that a member of a zip file holds the bytes whose CRC-32 and size are given"""
+    return member is not None and member.CRC == crc and member.file_size == size
+
+
+def waste(ziph):
+    """Estimate the bytes of a zip file taken by dead entries (replaced members, former central directories)
+
+    :param ziph: zip file opened for reading
+    :type ziph: ZipFile
+    :return: dead bytes, bytes before the central directory
+    :rtype: tuple
+    """
+    live = 0
+    for member in ziph.infolist():
+        live += LOCAL_HEADER_SIZE + len(member.filename.encode("utf-8")) + len(member.extra) + member.compress_size
+        if member.flag_bits & 0x08:
+            live += DATA_DESCRIPTOR_SIZE
+    return max(ziph.start_dir - live, 0), ziph.start_dir
+
+
+def compact_zip(zip_destination):
+    """Rewrite a zip file without its dead entries, copying the members as they are stored
+
+    :param zip_destination: path to the zip file
+    :type zip_destination: str
+    :return: None
+    """
+    tmp_destination = tmp_path(zip_destination)
+    try:
+        with ZipFile(zip_destination, "r") as src_zph, ZipFile(tmp_destination, "w") as dst_zph:
+            for member in src_zph.infolist():
+                copy_raw_member(src_zph, member, dst_zph, member.filename)
+        os.replace(tmp_destination, zip_destination)
+    except Exception:
+        if os.path.exists(tmp_destination):
+            os.remove(tmp_destination)
+        raise
+
+
+def update_zip(zip_destination, source, files, images=None, image_source=None, max_waste=MAX_WASTE):
+    """Update a zip file created by write_zip() with the XML files (and images) which are new or changed
+
+    Members whose size and CRC-32 are unchanged are left as they are; the others are appended at the end of the
+    archive and the central directory is rewritten without the entries they replace. Members which aren't in
+    files are kept. The archive is modified in place (if the update fails, it is truncated back to its former
+    state) and compacted once its dead bytes exceed max_waste of its size. If it doesn't exist yet, it is created.
+
+    :param zip_destination: path to the zip file to update
+    :param source: path to the directory containing the XML files
+    :param files: names of the XML files to put in the archive
+    :param images: if set, also put the images paired with the XML files in the archive (see write_images())
+    :param image_source: path to the source zip file containing the images (see write_images())
+    :param max_waste: share of dead bytes above which the archive is compacted
+    :type zip_destination: str
+    :type source: str
+    :type files: list
+    :type images: dict or None
+    :type image_source: str or None
+    :type max_waste: float
+    :return: number of members written, number of members left unchanged, True if the archive was compacted
+    :rtype: tuple
+    """
+    if not os.path.isfile(zip_destination):
+        write_zip(zip_destination, source, files, images=images, image_source=image_source)
+        with ZipFile(zip_destination, "r") as ziph:
+            return len(ziph.infolist()), 0, False
+    original_size = os.path.getsize(zip_destination)
+    ziph = ZipFile(zip_destination, "a")
+    try:
+        changed, replaced, unchanged = [], set(), 0
+        for file in files:
+            path, arcname = os.path.join(source, file), os.path.join(ARCHIVE_ROOT, file)
+            if is_unchanged(ziph.NameToInfo.get(arcname), file_crc(path), os.path.getsize(path)):
+                unchanged += 1
+            else:
+                changed.append(file)
+                replaced.add(arcname)
+        written = len(changed)
+        if images:
+            src_zph = open_zip(image_source) if image_source else None
+            seen = set()
+            try:
+                for file in files:
+                    if file not in images:
+                        continue
+                    image, arcname = images[file]
+                    arcname = os.path.join(ARCHIVE_ROOT, arcname)
+                    if arcname in seen:
+                        continue  # several pages sharing an image
+                    seen.add(arcname)
+                    try:
+                        if src_zph is not None:
+                            member = src_zph.getinfo(image)
+                            crc, size = member.CRC, member.file_size
+                        else:
+                            crc, size = file_crc(image), os.path.getsize(image)
+                    except (KeyError, OSError):
+                        continue  # reported by write_images()
+                    if is_unchanged(ziph.NameToInfo.get(arcname), crc, size):
+                        unchanged += 1
+                    else:
+                        replaced.add(arcname)
+            finally:
+                if src_zph is not None:
+                    src_zph.close()
+        if replaced:
+            ziph.filelist = [member for member in ziph.filelist if member.filename not in replaced]
+            for arcname in replaced:
+                ziph.NameToInfo.pop(arcname, None)
+            # new members go after the current central directory: it stays valid until the new one is written
+            ziph.fp.seek(0, os.SEEK_END)
+            ziph.start_dir = ziph.fp.tell()
+            for file in changed:
+                ziph.write(os.path.join(source, file), arcname=os.path.join(ARCHIVE_ROOT, file))
+            if images:
+                written += write_images(ziph, files, images, image_source)
+            ziph._didModify = True
+        ziph.close()
+    except Exception:
+        # nothing was written before the former end of the file
+        ziph._didModify = False
+        ziph.close()
+        os.truncate(zip_destination, original_size)
+        raise
+    compacted = False
+    if replaced:
+        with ZipFile(zip_destination, "r") as ziph:
+            dead, total = waste(ziph)
+        if total and dead > max_waste * total:
+            compact_zip(zip_destination)
+            compacted = True
+    return written, unchanged, compacted
+
+
+def plan_shards(source, files, max_pages=None, max_bytes=None):
+    """Split a list of XML files into shards capped by number of pages and/or size
+
+    A file bigger than max_bytes gets a shard of its own.
+
+    :param source: path to the directory containing the XML files
+    :param files: names of the XML files (in the order they should be distributed)
+    :param max_pages: maximum number of files per shard (None: no limit)
+    :param max_bytes: maximum cumulated size of the files in a shard (None: no limit)
+    :type source: str
+    :type files: list
+    :type max_pages: int or None
+    :type max_bytes: int or None
+    :return: list of shards (lists of file names)
+    :rtype: list
+    """
+    shards = []
+    current, current_size = [], 0
+    for file in files:
+        size = os.path.getsize(os.path.join(source, file))
+        full = (max_pages and len(current) >= max_pages) or (max_bytes and current_size + size > max_bytes)
+        if current and full:
+            shards.append(current)
+            current, current_size = [], 0
+        current.append(file)
+        current_size += size
+    if current:
+        shards.append(current)
+    return shards
+
+
+def write_index(index_destination, index):
+    """Write (or replace) a shard index file
+
+    :param index_destination: path to the JSON index file
+    :param index: content of the index
+    :type index_destination: str
+    :type index: dict
+    :return: None
+    """
+    # the index may be read while shards are still being written: write aside and rename
+    tmp_destination = tmp_path(index_destination)
+    with open(tmp_destination, "w", encoding="utf-8") as fh:
+        json.dump(index, fh, indent=2)
+    os.replace(tmp_destination, index_destination)
+
+
+def zip_dir_in_shards(source, destination, name, max_pages=None, max_bytes=None, workers=None, images=None,
+                      image_source=None):
+    """Create several zip files (shards) out of a directory, written concurrently, and an index file
+
+    The index (aspyre_<name>_index.json) maps each page to its shard and records the state
+    of each shard ("pending" or "ready"); it is updated every time a shard is finished so
+    imports can start with the first shards while the others are still being written.
+
+    :param source: path to the directory containing the XML files
+    :param destination: path to the directory where the shards should be stored
+    :param name: base name of the output (aspyre_<name>_<n>.zip)
+    :param max_pages: maximum number of pages per shard
+    :param max_bytes: maximum cumulated size of the XML files in a shard
+    :param workers: number of shards written at the same time (None: let the executor decide)
+    :param images: if set, each shard also contains the images of its pages (see write_images())
+    :param image_source: path to the source zip file containing the images (see write_images())
+    :type source: str
+    :type destination: str
+    :type name: str
+    :type max_pages: int or None
+    :type max_bytes: int or None
+    :type workers: int or None
+    :type images: dict or None
+    :type image_source: str or None
+    :return: path to the index file
+    :rtype: str
+    """
+    xmls = sorted(f for f in os.listdir(source) if f.endswith('.xml'))
+    shards = plan_shards(source, xmls, max_pages=max_pages, max_bytes=max_bytes)
+    width = max(4, len(str(len(shards))))
+    index_destination = os.path.abspath(os.path.join(destination, f"aspyre_{name}_index.json"))
+    index = {"root": ARCHIVE_ROOT, "max_pages": max_pages, "max_bytes": max_bytes, "shards": [], "pages": {}}
+    for number, files in enumerate(shards, start=1):
+        shard_name = f"aspyre_{name}_{number:0{width}d}.zip"
+        index["shards"].append({"file": shard_name, "pages": len(files), "status": "pending"})
+        for file in files:
+            index["pages"][file] = shard_name
+    write_index(index_destination, index)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(write_zip, os.path.join(destination, entry["file"]), source, files,
+                                   images=images, image_source=image_source): entry
+                   for entry, files in zip(index["shards"], shards)}
+        for future in as_completed(futures):
+            entry = futures[future]
+            future.result()  # propagate errors
+            entry["status"] = "ready"
+            entry["size"] = os.path.getsize(os.path.join(destination, entry["file"]))
+            write_index(index_destination, index)
+            utils.report(f"Shard ready: {entry['file']} ({entry['pages']} page(s))", "I")
+    return index_destination
+
+
+def zip_dir(destination, sourcepath, shard_pages=None, shard_bytes=None, images=None, image_source=None,
+            output_dir=None, name=None, update=False):
     """Create a zip file out of a directory
 
     :param destination: path where the archive should be stored
     :param sourcepath: initial path to source
+    :param shard_pages: if set, split the output in several zip files of at most shard_pages pages
+    :param shard_bytes: if set, split the output in several zip files of at most shard_bytes bytes of XML
+    :param images: if set, also put the images paired with the XML files in the archive (see write_images())
+    :param image_source: path to the source zip file containing the images (see write_images())
+    :param output_dir: path to the directory where the archive should be created (default: parent of destination)
+    :param name: base name of the archive, aspyre_<name>.zip (default: from sourcepath)
+    :param update: update the archive if it already exists rather than rewriting it (see update_zip())
     :type destination: str
     :type sourcepath: str
-    :return: path to the created zip file
+    :type shard_pages: int or None
+    :type shard_bytes: int or None
+    :type images: dict or None
+    :type image_source: str or None
+    :type output_dir: str or None
+    :type name: str or None
+    :type update: bool
+    :return: path to the created zip file (to the shard index if the output was split)
     :rtype: str
     """
     source = destination  # what is in the destination is the XML files that were created, isn't it?
-    destination = os.sep.join(destination.split(os.sep)[:-1])
-    zip_destination = os.path.abspath(
-        os.path.join(destination, f"aspyre_{os.path.basename(sourcepath).replace('_unpacking', '')}.zip"))
+    destination = os.sep.join(destination.split(os.sep)[:-1]) if output_dir is None else output_dir
+    if name is None:
+        name = os.path.basename(sourcepath).replace('_unpacking', '')
+    if shard_pages or shard_bytes:
+        if update:
+            utils.report("Sharded archives can't be updated, they are written again.\n---", "W")
+        try:
+            index_destination = zip_dir_in_shards(source, destination, name,
+                                                  max_pages=shard_pages, max_bytes=shard_bytes,
+                                                  images=images, image_source=image_source)
+        except Exception as e:
+            utils.report(f"{e}\n---", "E")
+            utils.report("Failed at creating the ZIP archives.\n---", "W")
+            return None
+        utils.report(f"Created sharded archives, see the index at: {index_destination}", "I")
+        utils.report(f"You can import them into eScriptorium one by one as soon as they are ready! :)\n---", "I")
+        return index_destination
+    zip_destination = os.path.abspath(os.path.join(destination, f"aspyre_{name}.zip"))
     xmls = [f for f in os.listdir(source) if f.endswith('.xml')]
+    if update and os.path.isfile(zip_destination):
+        try:
+            written, unchanged, compacted = update_zip(zip_destination, source, xmls, images=images,
+                                                       image_source=image_source)
+        except Exception as e:
+            utils.report(f"{e}\n---", "E")
+            utils.report("Failed at updating the ZIP archive, it was left as it was.\n---", "W")
+            return None
+        utils.report(f"Updated the archive at: {zip_destination} ({written} file(s) added or replaced, "
+                     f"{unchanged} unchanged{', compacted' if compacted else ''})", "I")
+        utils.report(f"You can directly import it into eScriptorium! :)\n---", "I")
+        return zip_destination
     try:
-        ziph = ZipFile(zip_destination, "w")
-        for file in xmls:
-            ziph.write(os.path.join(source, file), arcname=os.path.join("alto4eScriptorium", file))
-        ziph.close()
+        write_zip(zip_destination, source, xmls, images=images, image_source=image_source)
         failed = False
     except Exception as e:
-        print(e)
+        utils.report(f"{e}\n---", "E")
         failed = True
     if failed:
-        print("---")
         utils.report("Failed at creating a ZIP archive.\n---", "W")  # No big deal technically
         return None
     # TODO : which is best? alto4escriptorium? or aspyre_{basename} ?
     #utils.report(f"Creating a new archive at: {os.path.join(destination, 'alto4eScriptorium.zip')}", "I")
-    print("---")
     utils.report(f"Creating a new archive at: {zip_destination}", "I")
     utils.report(f"You can directly import it into eScriptorium! :)\n---", "I")
     return zip_destination
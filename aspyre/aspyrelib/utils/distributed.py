@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT distributed package"""
+
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+MANIFEST_NAME = "manifest.json"
+LOCKS_DIR = "locks"
+OUTPUTS_DIR = "out"
+RESULTS_DIR = "done"
+MANIFEST_VERSION = 2  # 2: the paths in the shared directory are relative to it
+
+
+def owner_id():
+    """Identify the current process across hosts"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _write_json(path, content):
+    """Write a JSON file aside and rename it, so it is never read half-written"""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(content, fh, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    with open(path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def prepare_shared(shared):
+    """Create the directories of a shared work directory
+
+    :param shared: path to the shared directory
+    :type shared: str
+    :return: None
+    """
+    for directory in (LOCKS_DIR, OUTPUTS_DIR, RESULTS_DIR):
+        os.makedirs(os.path.join(shared, directory), exist_ok=True)
+
+
+def plan_units(files, unit_pages):
+    """Split a list of pages into work units
+
+    :param files: paths to the pages
+    :param unit_pages: maximum number of pages per unit
+    :type files: list
+    :type unit_pages: int
+    :return: list of units ({"id": ..., "pages": [...]})
+    :rtype: list
+    """
+    units = []
+    for start in range(0, len(files), unit_pages):
+        units.append({"id": f"unit_{len(units) + 1:06d}", "pages": files[start:start + unit_pages]})
+    return units
+
+
+def manifest_exists(shared):
+    return os.path.isfile(os.path.join(shared, MANIFEST_NAME))
+
+
+def _to_shared(shared, path):
+    """Express a path in the shared directory relative to it (other paths are kept absolute)"""
+    root = os.path.abspath(shared)
+    path = os.path.abspath(path)
+    return os.path.relpath(path, root) if os.path.commonpath([root, path]) == root else path
+
+
+def _from_shared(shared, path):
+    return os.path.join(os.path.abspath(shared), path)
+
+
+def write_manifest(shared, manifest):
+    """Write the manifest of a job
+
+    The paths to the unpacked source, the pages of the units and the image files (unless they are file names,
+    as with the Transkribus scenario) are written relative to the shared directory: hosts can mount it
+    anywhere (see read_manifest()).
+
+    :param shared: path to the shared directory
+    :param manifest: job definition and work units
+    :type shared: str
+    :type manifest: dict
+    :return: path to the manifest
+    :rtype: str
+    """
+    image_paths = all(os.path.isabs(path) for path in manifest["image_files"])
+    manifest = dict(manifest, version=MANIFEST_VERSION, image_paths=image_paths,
+                    unzipped_source=_to_shared(shared, manifest["unzipped_source"]),
+                    image_files=[_to_shared(shared, path) for path in manifest["image_files"]] if image_paths
+                    else manifest["image_files"],
+                    units=[dict(unit, pages=[_to_shared(shared, page) for page in unit["pages"]])
+                           for unit in manifest["units"]])
+    path = os.path.join(shared, MANIFEST_NAME)
+    _write_json(path, manifest)
+    return path
+
+
+def read_manifest(shared):
+    """Read the manifest of a job, with the paths resolved from where the shared directory is on this host
+
+    :param shared: path to the shared directory
+    :type shared: str
+    :return: job definition and work units
+    :rtype: dict
+    """
+    manifest = _read_json(os.path.join(shared, MANIFEST_NAME))
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version: {manifest.get('version')}")
+    manifest["unzipped_source"] = _from_shared(shared, manifest["unzipped_source"])
+    if manifest["image_paths"]:
+        manifest["image_files"] = [_from_shared(shared, path) for path in manifest["image_files"]]
+    for unit in manifest["units"]:
+        unit["pages"] = [_from_shared(shared, page) for page in unit["pages"]]
+    return manifest
+
+
+# ---- leases
+def _lock_path(shared, unit_id):
+    return os.path.join(shared, LOCKS_DIR, f"{unit_id}.lock")
+
+
+def _read_lease(path):
+    """Read a lock file, None if it is gone; a lock being written counts as a fresh lease"""
+    try:
+        return _read_json(path)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        return {"owner": None, "expires": os.path.getmtime(path) + 60}
+
+
+def _create_lock(path, lease):
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w", encoding="utf-8") as fh:
+        json.dump({"owner": owner_id(), "claimed": time.time(), "expires": time.time() + lease}, fh)
+    return True
+
+
+def claim(shared, unit_id, lease):
+    """Try to take the lease on a unit
+
+    The lock file is created exclusively; an expired lock is first moved aside (an atomic rename,
+    so only one of the workers competing for it succeeds) and deleted.
+
+    :param shared: path to the shared directory
+    :param unit_id: identifier of the unit
+    :param lease: duration of the lease (s)
+    :type shared: str
+    :type unit_id: str
+    :type lease: float
+    :return: True if the unit was claimed
+    :rtype: bool
+    """
+    path = _lock_path(shared, unit_id)
+    if _create_lock(path, lease):
+        return True
+    current = _read_lease(path)
+    if current is None or current["expires"] > time.time():
+        return False
+    stale = f"{path}.{uuid.uuid4().hex}.stale"
+    try:
+        os.rename(path, stale)
+    except FileNotFoundError:
+        return False
+    moved = _read_lease(stale)
+    if moved is not None and moved["expires"] > time.time():
+        # the lease was renewed in the meantime: put it back unless someone already replaced it
+        try:
+            os.link(stale, path)
+        except OSError:
+            pass
+        os.remove(stale)
+        return False
+    os.remove(stale)
+    return _create_lock(path, lease)
+
+
+def renew(shared, unit_id, lease):
+    """Extend the lease on a unit held by the current process
+
+    :return: False if the lease was lost (expired and claimed by another worker)
+    :rtype: bool
+    """
+    path = _lock_path(shared, unit_id)
+    current = _read_lease(path)
+    if current is None or current["owner"] != owner_id():
+        return False
+    _write_json(path, dict(current, expires=time.time() + lease))
+    return True
+
+
+class LeaseKeeper():
+    def __init__(self, shared, unit_id, lease, interval=None):
+        """Renew the lease on a unit from a background thread while it is converted (a context manager)
+
+        The lease is renewed every interval seconds, however long a page takes; lost is set once
+        the lease was lost. A renewal failing on an error (ex: the shared directory is briefly
+        unavailable) is tried again at the next interval.
+
+        :param shared: path to the shared directory
+        :param unit_id: identifier of the unit
+        :param lease: duration of the lease (s)
+        :param interval: time between two renewals (s, default: a third of the lease)
+        :type shared: str
+        :type unit_id: str
+        :type lease: float
+        :type interval: float or None
+        """
+        self.shared = shared
+        self.unit_id = unit_id
+        self.lease = lease
+        self.interval = lease / 3 if interval is None else interval
+        self.lost = False
+        self.renewals = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"aspyre-lease-{unit_id}", daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                renewed = renew(self.shared, self.unit_id, self.lease)
+            except OSError:
+                continue
+            if not renewed:
+                self.lost = True
+                return
+            self.renewals += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stopped.set()
+        self.thread.join()
+        return False
+
+
+def release(shared, unit_id):
+    """Remove the lock of a unit held by the current process"""
+    path = _lock_path(shared, unit_id)
+    current = _read_lease(path)
+    if current is not None and current["owner"] == owner_id():
+        os.remove(path)
+
+
+# ---- results
+def unit_output(shared, unit_id):
+    """Return the path to the directory holding the converted files of a unit"""
+    return os.path.join(shared, OUTPUTS_DIR, unit_id)
+
+
+def is_done(shared, unit_id):
+    return os.path.isfile(os.path.join(shared, RESULTS_DIR, f"{unit_id}.json"))
+
+
+def mark_done(shared, unit_id, result):
+    """Record the outcome of a unit (after its converted files were moved to unit_output())
+
+    :param shared: path to the shared directory
+    :param unit_id: identifier of the unit
+    :param result: outcome of the unit (pages processed, failed...)
+    :type shared: str
+    :type unit_id: str
+    :type result: dict
+    :return: None
+    """
+    _write_json(os.path.join(shared, RESULTS_DIR, f"{unit_id}.json"), dict(result, unit=unit_id, owner=owner_id()))
+
+
+def read_results(shared, manifest):
+    """Read the outcome of the units of a job
+
+    :return: outcome of the finished units, identifiers of the units which are not finished
+    :rtype: tuple
+    """
+    results, missing = [], []
+    for unit in manifest["units"]:
+        if is_done(shared, unit["id"]):
+            results.append(_read_json(os.path.join(shared, RESULTS_DIR, f"{unit['id']}.json")))
+        else:
+            missing.append(unit["id"])
+    return results, missing
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT isolation package"""
+
+import multiprocessing
+import os
+import time
+from collections import deque
+from multiprocessing.connection import wait
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows: no memory limit
+    resource = None
+
+
+POLL_INTERVAL = 0.5  # seconds between two checks of the running pages when nothing happens
+STOP_GRACE = 5  # seconds given to a worker to exit before it is killed
+
+
+class PageResult():
+    def __init__(self, file, status, output=None, reason=None, duration=0.0, metrics=None, log=None,
+                 warnings=None):
+        """Outcome of the conversion of a page
+
+        :param file: path to the converted file
+        :type file: str
+        :param status: "processed", "skipped" or "failed"
+        :type status: str
+        :param output: path to the transformed file (processed pages only)
+        :type output: str or None
+        :param reason: why the page failed
+        :type reason: str or None
+        :param duration: time spent on the page (s)
+        :type duration: float
+        :param metrics: counters collected while converting the page (in a worker)
+        :type metrics: RunMetrics or None
+        :param log: log records emitted while converting the page (in a worker)
+        :type log: list or None
+        :param warnings: warning and error messages emitted while converting the page (see aspyre.iter_convert())
+        :type warnings: list or None
+        """
+        self.file = file
+        self.status = status
+        self.output = output
+        self.reason = reason
+        self.duration = duration
+        self.metrics = metrics
+        self.log = log
+        self.warnings = warnings
+
+
+def isolation_available():
+    """Return True if pages can be converted in forked worker processes on this platform"""
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def address_space():
+    """Return the size of the address space of the current process (bytes), 0 if it can't be known"""
+    try:
+        with open("/proc/self/statm", "r") as fh:
+            return int(fh.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def limit_memory(max_memory):
+    """Limit how much the address space of the current process can grow from now on
+
+    The limit is set above what the process already maps (ex: the libraries a forked worker inherits),
+    so max_memory is what converting pages may add, whatever the size of the parent process.
+
+    :param max_memory: growth allowed, in bytes
+    :type max_memory: int
+    :return: True if the limit was set
+    :rtype: bool
+    """
+    if resource is None:
+        return False
+    max_memory += address_space()
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        max_memory = min(max_memory, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (max_memory, hard))
+    return True
+
+
+def _worker_main(connection, convert, initializer, finalizer, max_memory):
+    """Loop of a worker process: receive a batch of files, convert them, send back a PageResult per file"""
+    if initializer is not None:
+        initializer()
+    if max_memory:
+        limit_memory(max_memory)
+    try:
+        while True:
+            batch = connection.recv()
+            if batch is None:
+                break
+            for file, payload in batch:
+                connection.send(convert(file) if payload is None else convert(file, payload))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        if finalizer is not None:
+            finalizer()
+        connection.close()
+
+
+class _Worker():
+    def __init__(self, context, convert, initializer, finalizer, max_memory):
+        """Start a worker process connected to the coordinator by a pipe"""
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_worker_main, daemon=True,
+                                       args=(child_connection, convert, initializer, finalizer, max_memory))
+        self.process.start()
+        child_connection.close()
+        self.batch = deque()
+        self.started = None
+
+    @property
+    def file(self):
+        """File being converted, None if the worker is idle"""
+        return self.batch[0][0] if self.batch else None
+
+    def assign(self, batch):
+        self.batch = deque(batch)
+        self.started = time.monotonic()
+        self.connection.send(batch)
+
+    def release(self):
+        """Mark the current file as done, return it, its payload and the time spent on it"""
+        (file, payload), started, now = self.batch.popleft(), self.started, time.monotonic()
+        self.started = now if self.batch else None
+        return file, payload, now - started
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(STOP_GRACE)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+
+def _as_batch(task):
+    # a path, a (path, payload) pair or a list of them -> list of (path, payload)
+    items = task if isinstance(task, list) else [task]
+    return [item if isinstance(item, tuple) else (item, None) for item in items]
+
+
+def iter_isolated(files, convert, workers=1, timeout=None, max_memory=None, initializer=None, finalizer=None,
+                  release=None):
+    """Convert files in a pool of worker processes, with a timeout and a memory limit per page
+
+    convert(file) runs in a worker and must return a (picklable) PageResult; a result is yielded
+    for every file, including the ones whose worker hung or crashed. An item of files can be a list
+    of paths: the batch is sent to a worker at once, its files are converted one after the other
+    (the timeout applies to each of them); if the worker hangs or crashes, the files of the batch
+    it didn't start are given to another worker. A path can come with a payload, as a (path, payload)
+    pair: convert(file, payload) is called instead and release(payload) is called in the calling
+    process once the file is done (converted or failed). files is consumed as workers become idle,
+    it can be a generator producing files while the first ones are converted. Closing the generator
+    stops the workers.
+
+    :param files: paths to the files to convert, (path, payload) pairs, or lists of them (batches)
+    :param convert: function converting a file in a worker
+    :param workers: number of worker processes
+    :param timeout: maximum time spent on a page (s), None for no limit
+    :param max_memory: maximum address space of a worker (bytes), None for no limit
+    :param initializer: function called in each worker when it starts
+    :param finalizer: function called in each worker before it exits normally
+    :param release: function called with the payload of a file once it is done
+    :type files: iterable
+    :type convert: function
+    :type workers: int
+    :type timeout: float or None
+    :type max_memory: int or None
+    :type release: function or None
+    :return: generator of PageResult, in completion order
+    :rtype: generator
+    """
+    # workers are forked: they inherit the scenario's state (args, image files...) without pickling it
+    context = multiprocessing.get_context("fork")
+    source = iter(files)
+    pending = deque()
+    pool = []
+
+    def start():
+        return _Worker(context, convert, initializer, finalizer, max_memory)
+
+    def next_batch():
+        if not pending:
+            task = next(source, None)
+            if task is None:
+                return None
+            pending.append(task)
+        return _as_batch(pending.popleft())
+
+    def done(worker):
+        file, payload, duration = worker.release()
+        if release is not None and payload is not None:
+            release(payload)
+        return file, duration
+
+    def replace(worker, reason):
+        file, duration = done(worker)
+        if worker.batch:
+            pending.appendleft(list(worker.batch))
+        worker.kill()
+        pool[pool.index(worker)] = start()
+        return PageResult(file, "failed", reason=reason, duration=duration)
+
+    try:
+        while True:
+            for worker in pool:
+                if worker.file is None:
+                    batch = next_batch()
+                    if batch:
+                        worker.assign(batch)
+            while len(pool) < max(1, workers):
+                batch = next_batch()
+                if batch is None:
+                    break
+                pool.append(start())
+                pool[-1].assign(batch)
+            busy = [worker for worker in pool if worker.file is not None]
+            if not busy:
+                break
+            wait_for = POLL_INTERVAL
+            if timeout:
+                wait_for = max(0, min(wait_for, min(w.started + timeout for w in busy) - time.monotonic()))
+            ready = wait([w.connection for w in busy] + [w.process.sentinel for w in busy], wait_for)
+            for worker in busy:
+                if worker.connection in ready:
+                    try:
+                        result = worker.connection.recv()
+                    except (EOFError, OSError):
+                        # the worker died while sending its result
+                        yield replace(worker, f"worker crashed (exit code {worker.process.exitcode})")
+                        continue
+                    done(worker)
+                    yield result
+                elif worker.process.sentinel in ready:
+                    worker.process.join()
+                    yield replace(worker, f"worker crashed (exit code {worker.process.exitcode})")
+                elif timeout and time.monotonic() - worker.started > timeout:
+                    yield replace(worker, f"timed out after {timeout}s")
+    finally:
+        for worker in pool:
+            if worker.file is None:
+                worker.stop()
+            else:
+                worker.kill()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT logger package"""
+
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+from termcolor import colored
+
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+# utils.report() letter codes: [I]nfo | [W]arning | [E]rror | [S]uccess | [H]ighlight
+CODE_LEVELS = {"I": 20, "S": 20, "H": 20, "W": 30, "E": 40}
+CODE_COLORS = {"W": "yellow", "E": "red", "S": "green", "H": "blue"}
+MAX_RECENT = 10000  # distinct messages remembered for deduplication before old ones are forgotten
+
+
+class FileSink():
+    def __init__(self, path):
+        """Append records to a JSON lines file from a background thread
+
+        Each record is written with a single write() on a file opened in append mode,
+        so several processes (workers) can share the same file.
+
+        :param path: path to the log file
+        :type path: str
+        """
+        self.path = path
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name="aspyre-log-sink", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            lines = [record]
+            # write everything that is already waiting at once
+            while True:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    self.queue.put(None)
+                    break
+                lines.append(record)
+            data = "".join(json.dumps(line, ensure_ascii=False, default=str) + "\n" for line in lines)
+            os.write(self.fd, data.encode("utf-8"))
+
+    def write(self, record):
+        self.queue.put(record)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        os.close(self.fd)
+
+
+class Logger():
+    def __init__(self, level="info", history_size=1000, dedup_window=60.0, rate_limit=20, rate_period=1.0,
+                 flush_interval=0.2, flush_lines=50):
+        """Structured logger
+
+        :param level: minimum level of the messages displayed in the console ("debug|info|warning|error")
+        :type level: str
+        :param history_size: number of records kept in memory, per channel
+        :type history_size: int
+        :param dedup_window: an info or warning message identical to one displayed less than dedup_window seconds
+            ago is not displayed (errors always are)
+        :type dedup_window: float
+        :param rate_limit: maximum number of info or warning messages of a kind (letter code) displayed per
+            rate_period (errors are not limited)
+        :type rate_limit: int
+        :param rate_period: duration of the rate limiting period (s)
+        :type rate_period: float
+        :param flush_interval: maximum time a message stays in the console buffer (s)
+        :type flush_interval: float
+        :param flush_lines: maximum number of messages in the console buffer
+        :type flush_lines: int
+        """
+        self.level = LEVELS[level]
+        self.history_size = history_size
+        self.dedup_window = dedup_window
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.flush_interval = flush_interval
+        self.flush_lines = flush_lines
+        self.sink = None
+        self.console = None  # stream where messages are displayed, None for sys.stdout
+        self._reset()
+
+    def _reset(self):
+        """(Re)initialize the state which is not shared with a parent process"""
+        self.lock = threading.Lock()
+        self.history = {}  # channel -> deque of records
+        self.emitted = 0  # number of records emitted by this process
+        self.recent = {}  # (code, message) -> [last time displayed, times suppressed since]
+        self.rates = {}  # code -> [start of the period, messages displayed, messages suppressed]
+        self.buffer = []
+        self.buffered_since = None
+
+    def configure(self, level=None, file=None, console=None):
+        """Change the console level and/or start writing the records in a file
+
+        :param level: minimum level of the messages displayed in the console ("debug|info|warning|error")
+        :type level: str or None
+        :param file: path to a JSON lines log file
+        :type file: str or None
+        :param console: stream where messages are displayed (ex: sys.stderr when stdout carries data)
+        :type console: file object or None
+        :return: None
+        """
+        if console is not None:
+            self.console = console
+        if level is not None:
+            self.level = LEVELS[level.lower()]
+        if file is not None and (self.sink is None or self.sink.path != file):
+            if self.sink is not None:
+                self.sink.close()
+            self.sink = FileSink(file)
+
+    # ---- recording
+    def log(self, message, code="I", channel="report", console=True, limit=True, **fields):
+        """Record a message
+
+        :param message: message to record
+        :type message: str
+        :param code: letter code ([I]nfo | [W]arning | [E]rror | [S]uccess | [H]ighlight)
+        :type code: str
+        :param channel: "report" for messages to the user, "run" for the execution log of AspyreArgs
+        :type channel: str
+        :param console: display the message in the console (if its level is high enough)
+        :type console: bool
+        :param limit: apply deduplication and rate limiting to the display of the message (not to errors)
+        :type limit: bool
+        :param fields: additional structured information (ex: page="...")
+        :return: the record
+        :rtype: dict
+        """
+        record = {"time": time.time(), "level": CODE_LEVELS.get(code, 20), "code": code, "channel": channel,
+                  "pid": os.getpid(), "message": str(message)}
+        if fields:
+            record.update(fields)
+        with self.lock:
+            self.emitted += 1
+            self.history.setdefault(channel, deque(maxlen=self.history_size)).append(record)
+            if console and record["level"] >= self.level:
+                self._display(record, limit)
+        if self.sink is not None:
+            self.sink.write(record)
+        return record
+
+    def report(self, message, code_type="I", limit=True):
+        """Record a message for the user (see utils.report())"""
+        return self.log(message, code=code_type, limit=limit)
+
+    def _display(self, record, limit=True):
+        """Display a record in the console unless it is a duplicate or over the rate limit (lock held)
+
+        Errors are always displayed: the first error of a page must not be hidden by the ones of other pages.
+        """
+        now = record["time"]
+        code = record["code"]
+        if limit and record["level"] < LEVELS["error"]:
+            key = (code, record["message"])
+            recent = self.recent.get(key)
+            if recent is not None and now - recent[0] < self.dedup_window:
+                recent[1] += 1
+                return
+            rate = self.rates.setdefault(code, [now, 0, 0])
+            if now - rate[0] >= self.rate_period:
+                self._summarize_rate(code, rate)
+                rate[0], rate[1], rate[2] = now, 0, 0
+            if rate[1] >= self.rate_limit:
+                rate[2] += 1
+                return
+            rate[1] += 1
+            if recent is not None and recent[1]:
+                self.buffer.append(_render(code, f"(last message repeated {recent[1]} time(s))"))
+            self.recent[key] = [now, 0]
+            if len(self.recent) > MAX_RECENT:
+                # forget the messages which are out of the deduplication window
+                self.recent = {k: v for k, v in self.recent.items() if now - v[0] < self.dedup_window or v[1]}
+        self.buffer.append(_render(code, record["message"]))
+        if self.buffered_since is None:
+            self.buffered_since = now
+        # errors are displayed right away, the rest is written in batches
+        if record["level"] >= LEVELS["error"] or len(self.buffer) >= self.flush_lines \
+                or now - self.buffered_since >= self.flush_interval:
+            self._flush_console()
+
+    def _summarize_rate(self, code, rate):
+        if rate[2]:
+            self.buffer.append(_render(code, f"{rate[2]} more message(s) not displayed (rate limit)"))
+            rate[2] = 0
+
+    def _flush_console(self):
+        if self.buffer:
+            console = self.console or sys.stdout
+            console.write("\n".join(self.buffer) + "\n")
+            console.flush()
+            self.buffer = []
+        self.buffered_since = None
+
+    def flush(self):
+        """Display the buffered messages and a summary of the suppressed ones"""
+        with self.lock:
+            for (code, message), recent in self.recent.items():
+                if recent[1]:
+                    self.buffer.append(_render(code, f"{message} (repeated {recent[1]} more time(s))"))
+                    recent[1] = 0
+            for code, rate in self.rates.items():
+                self._summarize_rate(code, rate)
+            self._flush_console()
+
+    def close(self):
+        """Flush the console and stop the file sink"""
+        self.flush()
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
+
+    # ---- history
+    def entries(self, channel=None):
+        """Return the records kept in memory
+
+        :param channel: only return the records of this channel
+        :type channel: str or None
+        :return: records, oldest first
+        :rtype: list
+        """
+        with self.lock:
+            if channel is not None:
+                return list(self.history.get(channel, []))
+            return sorted((r for records in self.history.values() for r in records), key=lambda r: r["time"])
+
+    def mark(self):
+        """Return a marker to collect the records emitted from now on with records_since()"""
+        return self.emitted
+
+    def records_since(self, mark):
+        """Return the records emitted by this process since mark (as far as the history goes)"""
+        with self.lock:
+            count = self.emitted - mark
+            records = sorted((r for records in self.history.values() for r in records), key=lambda r: r["time"])
+            return records[-count:] if count > 0 else []
+
+    def absorb(self, records):
+        """Add records emitted by another process (a worker) to the history, without displaying them again"""
+        with self.lock:
+            for record in records:
+                self.history.setdefault(record["channel"], deque(maxlen=self.history_size)).append(record)
+
+    # ---- processes
+    def _before_fork(self):
+        with self.lock:
+            self._flush_console()
+
+    def _after_fork_in_child(self):
+        self._reset()
+        if self.sink is not None:
+            # the sink's thread doesn't exist in the child: start a new one on the same file
+            os.close(self.sink.fd)
+            self.sink = FileSink(self.sink.path)
+
+
+def _render(code, message):
+    """Format a message as utils.report() always did"""
+    if code not in CODE_LEVELS:
+        # unknown color parameter, treated as "normal" text
+        return message
+    if code in CODE_COLORS:
+        return colored(f"[{code}] {message}", CODE_COLORS[code])
+    return f"[{code}] {message}"
+
+
+LOGGER = Logger()
+atexit.register(LOGGER.close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=LOGGER._before_fork, after_in_child=LOGGER._after_fork_in_child)
+
+
+def get_logger():
+    """Return the logger shared by the whole process"""
+    return LOGGER
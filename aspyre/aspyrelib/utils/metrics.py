@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT metrics package"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+
+PROMETHEUS_PREFIX = "aspyre"
+
+
+class RunMetrics():
+    def __init__(self):
+        """Collect machine-readable counters about an Aspyre run"""
+        self.started = time.time()
+        self.finished = None
+        self.pages_processed = 0
+        self.pages_failed = 0
+        self.pages_skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.lines_touched = 0
+        self.strings_touched = 0
+        # stage name -> [number of calls, total time (s), longest call (s)]
+        self.stages = {}
+        self.failures = []  # {"page": path to the file, "reason": why it failed}
+        self.pages_validated = 0
+        # {"page": path to the file, "output": path in the output directory, "errors": first schema errors}
+        self.invalid = []
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block and record it as a call to stage 'name'
+
+        :param name: name of the stage (ex: "read", "switch_to_v4")
+        :type name: str
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_latency(name, time.perf_counter() - start)
+
+    def add_latency(self, name, seconds):
+        """Record a call to a stage
+
+        :param name: name of the stage
+        :param seconds: duration of the call
+        :type name: str
+        :type seconds: float
+        :return: None
+        """
+        record = self.stages.setdefault(name, [0, 0.0, 0.0])
+        record[0] += 1
+        record[1] += seconds
+        record[2] = max(record[2], seconds)
+
+    def merge(self, other):
+        """Add the counters collected by another RunMetrics (ex: in a worker process) to these ones
+
+        :param other: counters to add
+        :type other: RunMetrics
+        :return: None
+        """
+        self.pages_processed += other.pages_processed
+        self.pages_failed += other.pages_failed
+        self.pages_skipped += other.pages_skipped
+        self.bytes_in += other.bytes_in
+        self.bytes_out += other.bytes_out
+        self.lines_touched += other.lines_touched
+        self.strings_touched += other.strings_touched
+        for name, (count, total, longest) in other.stages.items():
+            record = self.stages.setdefault(name, [0, 0.0, 0.0])
+            record[0] += count
+            record[1] += total
+            record[2] = max(record[2], longest)
+        self.failures.extend(other.failures)
+        self.pages_validated += other.pages_validated
+        self.invalid.extend(other.invalid)
+
+    def stop(self):
+        """Mark the end of the run (only the first call counts)"""
+        if self.finished is None:
+            self.finished = time.time()
+
+    def duration(self):
+        """Return the duration of the run so far, in seconds"""
+        end = self.finished if self.finished is not None else time.time()
+        return end - self.started
+
+    def pages_per_sec(self):
+        """Return the number of successfully processed pages per second"""
+        duration = self.duration()
+        if duration <= 0:
+            return 0.0
+        return self.pages_processed / duration
+
+    def to_dict(self, **info):
+        """Build the run report
+
+        :param info: additional information on the run (scenario, source, status...)
+        :return: JSON serializable report
+        :rtype: dict
+        """
+        report = dict(info)
+        report.update({
+            "started": self.started,
+            "finished": self.finished,
+            "duration": round(self.duration(), 6),
+            "pages": {"processed": self.pages_processed,
+                      "failed": self.pages_failed,
+                      "skipped": self.pages_skipped},
+            "bytes": {"in": self.bytes_in, "out": self.bytes_out},
+            "lines_touched": self.lines_touched,
+            "strings_touched": self.strings_touched,
+            "pages_per_sec": round(self.pages_per_sec(), 3),
+            "stages": {name: {"count": count,
+                              "total": round(total, 6),
+                              "mean": round(total / count, 6) if count else 0.0,
+                              "max": round(longest, 6)}
+                       for name, (count, total, longest) in self.stages.items()},
+            "failures": self.failures,
+            "validation": {"validated": self.pages_validated,
+                           "invalid": len(self.invalid),
+                           "failures": self.invalid},
+        })
+        return report
+
+    def write_json(self, path, **info):
+        """Dump the run report as a JSON file
+
+        :param path: path to the JSON file
+        :param info: additional information on the run (scenario, source, status...)
+        :type path: str
+        :return: None
+        """
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(self.to_dict(**info), fh, indent=2)
+
+    def to_prometheus(self, success=None, **labels):
+        """Render the counters in Prometheus text exposition format
+
+        :param success: outcome of the run, exposed as a 0/1 gauge if provided
+        :type success: bool or None
+        :param labels: labels added to every sample (ex: scenario="tkb")
+        :return: content of the textfile
+        :rtype: str
+        """
+        def sample(name, value, **extra):
+            all_labels = dict(labels, **extra)
+            rendered = ",".join(f'{key}="{_escape_label(val)}"' for key, val in sorted(all_labels.items()))
+            return f"{PROMETHEUS_PREFIX}_{name}{{{rendered}}} {value}"
+
+        def family(name, kind, help_text, samples):
+            return [f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}",
+                    f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}"] + samples
+
+        # every value describes the last run: the file is replaced at each run, hence gauges
+        lines = []
+        lines += family("run_pages", "gauge", "Pages handled during the last run, by outcome.",
+                        [sample("run_pages", self.pages_processed, outcome="processed"),
+                         sample("run_pages", self.pages_failed, outcome="failed"),
+                         sample("run_pages", self.pages_skipped, outcome="skipped")])
+        lines += family("run_bytes", "gauge", "Bytes read and written during the last run.",
+                        [sample("run_bytes", self.bytes_in, direction="in"),
+                         sample("run_bytes", self.bytes_out, direction="out")])
+        lines += family("run_lines_touched", "gauge", "TextLine elements in the converted pages.",
+                        [sample("run_lines_touched", self.lines_touched)])
+        lines += family("run_strings_touched", "gauge", "String elements in the converted pages.",
+                        [sample("run_strings_touched", self.strings_touched)])
+        lines += family("run_stage_seconds", "summary", "Time spent in each stage during the last run.",
+                        [sample("run_stage_seconds_sum", f"{total:.6f}", stage=name)
+                         for name, (count, total, longest) in sorted(self.stages.items())] +
+                        [sample("run_stage_seconds_count", count, stage=name)
+                         for name, (count, total, longest) in sorted(self.stages.items())])
+        lines += family("run_stage_max_seconds", "gauge", "Longest call to each stage during the last run.",
+                        [sample("run_stage_max_seconds", f"{longest:.6f}", stage=name)
+                         for name, (count, total, longest) in sorted(self.stages.items())])
+        lines += family("run_pages_validated", "gauge", "Pages validated against the ALTO schema, by outcome.",
+                        [sample("run_pages_validated", self.pages_validated - len(self.invalid), outcome="valid"),
+                         sample("run_pages_validated", len(self.invalid), outcome="invalid")])
+        lines += family("run_pages_per_second", "gauge", "Throughput of the last run.",
+                        [sample("run_pages_per_second", f"{self.pages_per_sec():.3f}")])
+        lines += family("run_duration_seconds", "gauge", "Duration of the last run.",
+                        [sample("run_duration_seconds", f"{self.duration():.3f}")])
+        lines += family("run_finished_timestamp_seconds", "gauge", "End of the last run (unix time).",
+                        [sample("run_finished_timestamp_seconds", f"{self.finished or time.time():.3f}")])
+        if success is not None:
+            lines += family("run_success", "gauge", "1 if the last run finished successfully, 0 otherwise.",
+                            [sample("run_success", int(bool(success)))])
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, success=None, **labels):
+        """Write the counters in a Prometheus textfile (for node exporter's textfile collector)
+
+        :param path: path to the .prom file
+        :param success: outcome of the run, exposed as a 0/1 gauge if provided
+        :param labels: labels added to every sample
+        :type path: str
+        :return: None
+        """
+        # the collector may read the file at any time: write aside and rename
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            fh.write(self.to_prometheus(success=success, **labels))
+        os.replace(tmp_path, path)
+
+
+def _escape_label(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT profiling package"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import shutil
+import tracemalloc
+from contextlib import contextmanager
+
+
+PARTS_DIRNAME = "parts"
+STAGES_DIRNAME = "stages"
+ALLOCATIONS_FILENAME = "allocations.json"
+SUMMARY_FILENAME = "summary.txt"
+
+
+class StageProfiler():
+    def __init__(self, allocations=False):
+        """Record cProfile statistics per stage and, optionally, peak allocations per page
+
+        :param allocations: activate tracemalloc to record peak allocation per page and per stage
+        :type allocations: bool
+        """
+        self.allocations = allocations
+        self.profiles = {}  # stage name -> cProfile.Profile
+        self.stack = []  # open stages: [name, peak allocation]
+        self.page_peaks = {}  # page -> peak allocation (bytes)
+        self.stage_peaks = {}  # stage name -> peak allocation (bytes)
+        self.sites = []  # top allocation sites at the highest memory usage seen
+        self.max_current = 0
+        self.dumps = 0
+        if self.allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _fold_peak(self):
+        """Report the peak allocation since the last reset to every open stage"""
+        peak = tracemalloc.get_traced_memory()[1]
+        for entry in self.stack:
+            entry[1] = max(entry[1], peak)
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name):
+        """Profile the enclosed block as a call to stage 'name'
+
+        Only one profiler can be active at a time: a nested stage suspends its parent,
+        so each stage's statistics only cover the work that is not done in a sub-stage.
+
+        :param name: name of the stage
+        :type name: str
+        """
+        if self.stack:
+            self.profiles[self.stack[-1][0]].disable()
+        if self.allocations:
+            self._fold_peak()
+        profile = self.profiles.setdefault(name, cProfile.Profile())
+        self.stack.append([name, 0])
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            if self.allocations:
+                self._fold_peak()
+                self._watch_sites()
+            name, peak = self.stack.pop()
+            self.stage_peaks[name] = max(self.stage_peaks.get(name, 0), peak)
+            if self.stack:
+                self.profiles[self.stack[-1][0]].enable()
+
+    @contextmanager
+    def page(self, name):
+        """Record the peak allocation while the enclosed block converts page 'name'
+
+        Meant to be used inside the "page" stage wrapping the conversion of a file.
+
+        :param name: name of the page (path to the ALTO XML file)
+        :type name: str
+        """
+        if not self.allocations or not self.stack:
+            yield
+            return
+        entry = self.stack[-1]
+        try:
+            yield
+        finally:
+            # inner stages have been folded back into their parents
+            self._fold_peak()
+            self.page_peaks[name] = entry[1]
+
+    def _watch_sites(self):
+        """Keep the top allocation sites when memory usage reaches a new high"""
+        current = tracemalloc.get_traced_memory()[0]
+        if current > self.max_current:
+            self.max_current = current
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            stats = snapshot.statistics("lineno")[:25]
+            self.sites = [{"site": str(stat.traceback), "size": stat.size, "count": stat.count} for stat in stats]
+
+    def dump(self, folder):
+        """Write this process' statistics in a new subdirectory of folder/parts
+
+        :param folder: profiling output folder
+        :type folder: str
+        :return: path to the created subdirectory
+        :rtype: str
+        """
+        self.dumps += 1
+        part = os.path.join(folder, PARTS_DIRNAME, f"{os.getpid()}-{self.dumps}")
+        os.makedirs(part, exist_ok=True)
+        for name, profile in self.profiles.items():
+            # stages opened but not profiling anything yet have no stats to dump
+            if profile.getstats():
+                profile.dump_stats(os.path.join(part, f"{name}.prof"))
+        if self.allocations:
+            with open(os.path.join(part, ALLOCATIONS_FILENAME), "w", encoding="utf-8") as fh:
+                json.dump({"pages": self.page_peaks, "stages": self.stage_peaks,
+                           "max_current": self.max_current, "sites": self.sites}, fh)
+        return part
+
+
+def prepare_folder(folder):
+    """Create the profiling output folder, removing the dumps left by a previous run
+
+    :param folder: profiling output folder
+    :type folder: str
+    :return: None
+    """
+    shutil.rmtree(os.path.join(folder, PARTS_DIRNAME), ignore_errors=True)
+    os.makedirs(folder, exist_ok=True)
+
+
+def merge_dumps(folder):
+    """Merge the statistics dumped by every process (main process and workers) in folder/parts
+
+    :param folder: profiling output folder
+    :type folder: str
+    :return: merged statistics per stage, merged allocation records
+    :rtype: tuple
+    """
+    parts_dir = os.path.join(folder, PARTS_DIRNAME)
+    parts = [os.path.join(parts_dir, p) for p in sorted(os.listdir(parts_dir))] if os.path.isdir(parts_dir) else []
+    stats = {}
+    allocations = {"pages": {}, "stages": {}, "max_current": 0, "sites": []}
+    for part in parts:
+        for filename in sorted(os.listdir(part)):
+            path = os.path.join(part, filename)
+            if filename.endswith(".prof"):
+                name = filename[:-len(".prof")]
+                if name in stats:
+                    stats[name].add(path)
+                else:
+                    stats[name] = pstats.Stats(path)
+            elif filename == ALLOCATIONS_FILENAME:
+                with open(path, "r", encoding="utf-8") as fh:
+                    record = json.load(fh)
+                allocations["pages"].update(record["pages"])
+                for name, peak in record["stages"].items():
+                    allocations["stages"][name] = max(allocations["stages"].get(name, 0), peak)
+                if record["max_current"] > allocations["max_current"]:
+                    allocations["max_current"] = record["max_current"]
+                    allocations["sites"] = record["sites"]
+    stages_dir = os.path.join(folder, STAGES_DIRNAME)
+    os.makedirs(stages_dir, exist_ok=True)
+    for name, stage_stats in stats.items():
+        stage_stats.dump_stats(os.path.join(stages_dir, f"{name}.prof"))
+    if allocations["pages"] or allocations["stages"]:
+        with open(os.path.join(folder, ALLOCATIONS_FILENAME), "w", encoding="utf-8") as fh:
+            json.dump(allocations, fh, indent=2)
+    return stats, allocations
+
+
+def write_summary(folder, top=15):
+    """Merge the dumps in folder and write a summary of the top hotspots in folder/summary.txt
+
+    :param folder: profiling output folder
+    :param top: number of functions listed per stage
+    :type folder: str
+    :type top: int
+    :return: path to the summary
+    :rtype: str
+    """
+    stats, allocations = merge_dumps(folder)
+    summary = io.StringIO()
+    summary.write("ASPYRE PROFILE SUMMARY\n")
+    # stages sorted by the time spent in them
+    ranked = sorted(stats.items(), key=lambda item: item[1].total_tt, reverse=True)
+    summary.write("\n== Time per stage (exclusive of sub-stages)\n")
+    for name, stage_stats in ranked:
+        summary.write(f"{name:>20}: {stage_stats.total_tt:.4f}s\n")
+    if ranked:
+        stages_dir = os.path.join(folder, STAGES_DIRNAME)
+        overall = pstats.Stats(*[os.path.join(stages_dir, f"{name}.prof") for name, _ in ranked], stream=summary)
+        summary.write(f"\n== Top {top} hotspots, all stages\n")
+        overall.sort_stats("tottime").print_stats(top)
+    for name, stage_stats in ranked:
+        summary.write(f"\n== Top {top} hotspots in stage '{name}'\n")
+        stage_stats.stream = summary
+        stage_stats.sort_stats("tottime").print_stats(top)
+    if allocations["pages"]:
+        summary.write("\n== Heaviest pages (peak allocation)\n")
+        pages = sorted(allocations["pages"].items(), key=lambda item: item[1], reverse=True)
+        for page, peak in pages[:top]:
+            summary.write(f"{peak / 1024 / 1024:>10.2f} MiB  {page}\n")
+        summary.write("\n== Peak allocation per stage\n")
+        for name, peak in sorted(allocations["stages"].items(), key=lambda item: item[1], reverse=True):
+            summary.write(f"{name:>20}: {peak / 1024 / 1024:.2f} MiB\n")
+        summary.write(f"\n== Top allocation sites at highest usage ({allocations['max_current'] / 1024 / 1024:.2f} MiB)\n")
+        for site in allocations["sites"][:top]:
+            summary.write(f"{site['size'] / 1024:>10.1f} KiB {site['count']:>8} blocks  {site['site']}\n")
+    path = os.path.join(folder, SUMMARY_FILENAME)
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(summary.getvalue())
+    return path
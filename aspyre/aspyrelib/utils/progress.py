@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT progress package"""
+
+import threading
+import time
+
+from tqdm import tqdm
+
+
+class Progress():
+    def __init__(self, min_interval=0.5):
+        """Track the progress of a run and publish it to subscribers
+
+        Subscribers are called with a snapshot (see snapshot()) at most once every min_interval seconds,
+        and always for the first and the last page.
+
+        :param min_interval: minimum time between two publications (s)
+        :type min_interval: float
+        """
+        self.min_interval = min_interval
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.start()
+
+    def subscribe(self, callback):
+        """Call callback(snapshot) every time the progress is published
+
+        :param callback: function taking a snapshot (dict)
+        :type callback: function
+        :return: callback (to unsubscribe later)
+        :rtype: function
+        """
+        self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def start(self, pages=0, size=0, description=None, open_ended=False):
+        """(Re)start tracking a batch of pages
+
+        :param pages: number of pages to convert
+        :type pages: int
+        :param size: size of the files to convert (bytes)
+        :type size: int
+        :param description: what is being converted
+        :type description: str or None
+        :param open_ended: the pages are discovered along the way (see expect()), the batch
+                           is only finished when finish() is called
+        :type open_ended: bool
+        :return: None
+        """
+        with self.lock:
+            self.open_ended = open_ended
+            self.description = description
+            self.pages_total = pages
+            self.bytes_total = size
+            self.pages_done = 0
+            self.bytes_done = 0
+            self.failed = 0
+            self.skipped = 0
+            self.last_file = None
+            self.started = time.monotonic()
+            self.published = None
+        if pages:
+            self.publish(force=True)
+
+    def expect(self, pages=1, size=0):
+        """Add pages to convert to an open-ended batch
+
+        :param pages: number of pages discovered
+        :type pages: int
+        :param size: size of the files discovered (bytes)
+        :type size: int
+        :return: None
+        """
+        with self.lock:
+            self.pages_total += pages
+            self.bytes_total += size
+        self.publish()
+
+    def finish(self):
+        """Close an open-ended batch: no more pages are expected"""
+        with self.lock:
+            self.open_ended = False
+        self.publish(force=True)
+
+    def advance(self, file=None, size=0, status="processed"):
+        """Record a finished page
+
+        :param file: path to the page
+        :type file: str or None
+        :param size: size of the page (bytes)
+        :type size: int
+        :param status: "processed", "skipped" or "failed"
+        :type status: str
+        :return: None
+        """
+        with self.lock:
+            self.pages_done += 1
+            self.bytes_done += size
+            if status == "failed":
+                self.failed += 1
+            elif status == "skipped":
+                self.skipped += 1
+            self.last_file = file
+            done = not self.open_ended and self.pages_done >= self.pages_total
+        self.publish(force=done)
+
+    def snapshot(self):
+        """Return the current state of the run
+
+        :return: pages and bytes done and to do, failures, elapsed time (s), throughput (per s) and ETA (s)
+        :rtype: dict
+        """
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            pages_per_sec = self.pages_done / elapsed if elapsed > 0 else 0.0
+            bytes_per_sec = self.bytes_done / elapsed if elapsed > 0 else 0.0
+            eta = None
+            if self.bytes_total and bytes_per_sec:
+                # pages vary a lot in size: the ETA is based on the bytes left
+                eta = (self.bytes_total - self.bytes_done) / bytes_per_sec
+            elif self.pages_total and pages_per_sec:
+                eta = (self.pages_total - self.pages_done) / pages_per_sec
+            return {"description": self.description,
+                    "pages_done": self.pages_done, "pages_total": self.pages_total,
+                    "bytes_done": self.bytes_done, "bytes_total": self.bytes_total,
+                    "failed": self.failed, "skipped": self.skipped, "last_file": self.last_file,
+                    "elapsed": elapsed, "pages_per_sec": pages_per_sec, "bytes_per_sec": bytes_per_sec,
+                    "eta": eta, "finished": not self.open_ended and self.pages_total > 0
+                                            and self.pages_done >= self.pages_total}
+
+    def publish(self, force=False):
+        """Send a snapshot to the subscribers, unless the last one was sent less than min_interval ago
+
+        :param force: publish even if the last snapshot is recent
+        :type force: bool
+        :return: None
+        """
+        if not self.subscribers:
+            return
+        now = time.monotonic()
+        with self.lock:
+            if not force and self.published is not None and now - self.published < self.min_interval:
+                return
+            self.published = now
+        snapshot = self.snapshot()
+        for callback in list(self.subscribers):
+            callback(snapshot)
+
+
+class ConsoleDisplay():
+    def __init__(self, unit=" page"):
+        """Subscriber displaying the progress of a run in a single tqdm bar"""
+        self.unit = unit
+        self.bar = None
+
+    def __call__(self, snapshot):
+        if self.bar is None:
+            self.bar = tqdm(total=snapshot["pages_total"], desc=snapshot["description"] or "Processing",
+                            unit=self.unit, mininterval=0)
+        # the total grows while an archive is read as a stream
+        self.bar.total = snapshot["pages_total"]
+        self.bar.n = snapshot["pages_done"]
+        self.bar.set_postfix_str(f"{snapshot['bytes_per_sec'] / 1024 / 1024:.2f} MB/s, "
+                                 f"{snapshot['failed']} failed, {snapshot['skipped']} skipped", refresh=False)
+        self.bar.refresh()
+        if snapshot["finished"]:
+            self.close()
+
+    def close(self):
+        if self.bar is not None:
+            self.bar.close()
+            self.bar = None
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT scheduler package"""
+
+import math
+import os
+
+SMALL_PAGE_BYTES = 64 * 1024  # pages smaller than this are batched
+BATCH_BYTES = 1024 * 1024  # maximum cumulated size of a batch of small pages
+BATCH_PAGES = 32  # maximum number of pages in a batch
+WORKER_BASELINE = 64 * 1024 * 1024  # memory used by an idle worker (bytes)
+# peak memory used to convert a page, per byte of ALTO XML (see aspyre/memory_benchmark.py)
+MEMORY_FACTORS = {"soup": 24, "model": 8}
+MEMORY_SHARE = 0.8  # share of the available memory the workers may use
+STREAM_PAGE_BYTES = 4 * 1024 * 1024  # size assumed for the pages of an archive read as a stream
+
+
+def available_cores():
+    """Return the number of cores the current process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def available_memory():
+    """Return the memory available for new processes (bytes), None if it can't be known"""
+    try:
+        with open("/proc/meminfo", "r") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def page_memory(size, engine="soup"):
+    """Estimate the peak memory of a worker converting a page
+
+    :param size: size of the ALTO XML file (bytes)
+    :param engine: "soup" or "model"
+    :type size: int
+    :type engine: str
+    :return: number of bytes
+    :rtype: int
+    """
+    return WORKER_BASELINE + MEMORY_FACTORS.get(engine, MEMORY_FACTORS["soup"]) * size
+
+
+def choose_workers(sizes, engine="soup", max_memory=None, cores=None, memory=None):
+    """Choose the number of workers converting pages at the same time
+
+    As many as there are cores, as long as that many workers converting the largest page at the same
+    time fit in the available memory. The memory of a worker is the estimate of page_memory(), capped by
+    max_memory (what a worker may add to its baseline, see isolation.limit_memory()).
+    When the sizes aren't known before the pages are read (archive read as a stream), pages of
+    STREAM_PAGE_BYTES are assumed.
+
+    :param sizes: sizes of the pages (bytes), None if they aren't known
+    :param engine: "soup" or "model"
+    :param max_memory: memory a worker may add to its baseline (bytes), None if there is no limit
+    :param cores: number of cores (default: available_cores())
+    :param memory: available memory (bytes) (default: available_memory())
+    :type sizes: list or None
+    :type engine: str
+    :type max_memory: int or None
+    :type cores: int or None
+    :type memory: int or None
+    :return: number of workers, estimated memory per worker (bytes)
+    :rtype: tuple
+    """
+    cores = cores or available_cores()
+    memory = available_memory() if memory is None else memory
+    largest = STREAM_PAGE_BYTES if sizes is None else max(sizes, default=0)
+    per_worker = page_memory(largest, engine)
+    if max_memory:
+        per_worker = min(per_worker, WORKER_BASELINE + max_memory)
+    workers = cores if sizes is None else min(cores, len(sizes) or 1)
+    if memory:
+        workers = min(workers, int(memory * MEMORY_SHARE // per_worker))
+    return max(1, workers), per_worker
+
+
+def plan_tasks(files, sizes, workers=1, small_bytes=SMALL_PAGE_BYTES, batch_bytes=BATCH_BYTES,
+               batch_pages=BATCH_PAGES):
+    """Order pages largest first and group the small ones in batches
+
+    The small pages are shared out between the workers: a batch holds len(small pages) / workers
+    pages, within batch_pages and batch_bytes.
+
+    :param files: paths to the pages
+    :param sizes: path -> size of the page (bytes)
+    :param workers: number of workers converting the pages
+    :param small_bytes: pages smaller than this are batched
+    :param batch_bytes: maximum cumulated size of a batch
+    :param batch_pages: maximum number of pages in a batch
+    :type files: list
+    :type sizes: dict
+    :type workers: int
+    :type small_bytes: int
+    :type batch_bytes: int
+    :type batch_pages: int
+    :return: tasks: a path, or a list of paths (batch), largest first
+    :rtype: list
+    """
+    ordered = sorted(files, key=lambda file: sizes.get(file, 0), reverse=True)
+    tasks = [file for file in ordered if sizes.get(file, 0) >= small_bytes]
+    small = ordered[len(tasks):]
+    batch_pages = min(batch_pages, max(1, math.ceil(len(small) / max(1, workers))))
+    batch, batch_size = [], 0
+    for file in small:
+        size = sizes.get(file, 0)
+        if batch and (len(batch) >= batch_pages or batch_size + size > batch_bytes):
+            tasks.append(batch)
+            batch, batch_size = [], 0
+        batch.append(file)
+        batch_size += size
+    if batch:
+        tasks.append(batch if len(batch) > 1 else batch[0])
+    return tasks
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT scratch package"""
+
+import errno
+import os
+import shutil
+import tempfile
+import uuid
+import weakref
+
+from . import storage
+
+JOB_PREFIX = "aspyre_job_"
+SPACE_MARGIN = 64 * 1024 * 1024  # free space left on the scratch device besides what a job needs (bytes)
+
+
+def default_root():
+    """Return the root of the scratch space when none is given (the system's temporary directory)"""
+    return tempfile.gettempdir()
+
+
+def required_space(source, scenario):
+    """Estimate the room needed to unpack a source archive
+
+    Exact for zip files (uncompressed size of the eligible members); for tar archives, only the
+    size of the archive is known before reading it, which is a lower bound when it is compressed.
+
+    :param source: path to the source archive
+    :param scenario: keyword describing the scenario
+    :type source: str
+    :type scenario: str
+    :return: number of bytes
+    :rtype: int
+    """
+    from ..manage import zip
+    if source.lower().endswith(".zip"):
+        with zip.open_zip(source) as zph:
+            files, _ = zip.select_members(zph.infolist(), scenario)
+        return sum(f.file_size for f in files)
+    return storage.size(source)
+
+
+def _remove(path, owner):
+    # forked workers inherit the finalizer: only the process which created the directory removes it
+    if os.getpid() == owner:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class ScratchSpace():
+    def __init__(self, root=None, margin=SPACE_MARGIN):
+        """Create the private directory of a job under root
+
+        :param root: directory where jobs create their scratch directory (default: see default_root())
+        :type root: str or None
+        :param margin: free space to leave on the device besides what the job needs (bytes)
+        :type margin: int
+        """
+        self.root = os.path.abspath(root or default_root())
+        self.margin = margin
+        os.makedirs(self.root, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=JOB_PREFIX, dir=self.root)
+        self._finalizer = weakref.finalize(self, _remove, self.path, os.getpid())
+
+    @property
+    def alive(self):
+        """True until the directory was removed"""
+        return self._finalizer.alive
+
+    def join(self, *names):
+        """Return a path inside the job's directory (nothing is created)"""
+        return os.path.join(self.path, *names)
+
+    def free_space(self):
+        """Return the free space on the scratch device (bytes)"""
+        return shutil.disk_usage(self.path).free
+
+    def ensure_space(self, needed):
+        """Control that the scratch device has room for needed bytes (plus the margin)
+
+        :param needed: number of bytes about to be written
+        :type needed: int
+        :return: None
+        :raises OSError: (ENOSPC) if there isn't enough room
+        """
+        free = self.free_space()
+        if needed + self.margin > free:
+            raise OSError(errno.ENOSPC, f"Not enough space in {self.root}: {needed / 1048576:.1f} MiB needed "
+                                        f"(+{self.margin / 1048576:.0f} MiB margin), "
+                                        f"{free / 1048576:.1f} MiB available")
+
+    def cleanup(self):
+        """Remove the job's directory and everything in it (can be called several times)"""
+        self._finalizer()
+
+
+def publish_file(source, destination, keep=False):
+    """Put a file in a directory, replacing the file of the same name atomically
+
+    The file is renamed (or hard linked if keep is set) when both are on the same device; otherwise it
+    is first copied next to its destination under a name private to the job, then renamed. A file
+    found in destination is always complete.
+
+    :param source: path to the finished file
+    :param destination: path to the directory where it should be
+    :param keep: leave the source file in place
+    :type source: str
+    :type destination: str
+    :type keep: bool
+    :return: path to the published file
+    :rtype: str
+    """
+    name = os.path.basename(source)
+    target = os.path.join(destination, name)
+    tmp_target = os.path.join(destination, f".{name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        if keep:
+            os.link(source, tmp_target)
+            os.replace(tmp_target, target)
+        else:
+            os.replace(source, target)
+        return target
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+    try:
+        shutil.copyfile(source, tmp_target)
+        os.replace(tmp_target, target)
+    except Exception:
+        if os.path.exists(tmp_target):
+            os.remove(tmp_target)
+        raise
+    if not keep:
+        os.remove(source)
+    return target
+
+
+def publish_files(staging, destination):
+    """Move the files of a staging directory to their destination, replacing each of them atomically
+    (see publish_file()); subdirectories (ex: one per document of a Transkribus export) are kept
+
+    :param staging: path to the directory holding the finished files
+    :param destination: path to the directory where they should be
+    :type staging: str
+    :type destination: str
+    :return: number of files moved
+    :rtype: int
+    """
+    moved = 0
+    for dirpath, dirnames, filenames in os.walk(staging):
+        dirnames.sort()
+        target = os.path.normpath(os.path.join(destination, os.path.relpath(dirpath, staging)))
+        os.makedirs(target, exist_ok=True)
+        for name in sorted(filenames):
+            publish_file(os.path.join(dirpath, name), target)
+            moved += 1
+    return moved
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT shared memory package
+  Only carries the ALTO XML files read from a tar archive to the isolated workers (see aspyre.iter_stream()):
+  the pages of zip archives and directories are read from the scratch space, and every output is a file.
+"""
+
+import io
+from collections import OrderedDict
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+MIN_SEGMENT = 64 * 1024  # smallest segment created (bytes), capacities are powers of two from there
+IDLE_SEGMENTS = 8  # segments kept in the pool for reuse once released
+ATTACHED_SEGMENTS = 16  # segments a worker keeps attached
+
+_pages = {}  # path -> memoryview: pages served from shared memory in this process
+_attached = OrderedDict()  # segment name -> SharedMemory, most recently used last
+
+
+def segment_capacity(size):
+    """Return the capacity of the segment holding size bytes (next power of two, at least MIN_SEGMENT)"""
+    capacity = MIN_SEGMENT
+    while capacity < size:
+        capacity *= 2
+    return capacity
+
+
+class SegmentPool():
+    def __init__(self, idle=IDLE_SEGMENTS):
+        """Shared memory segments owned by the reading process, recycled from one page to the next
+
+        :param idle: number of released segments kept for reuse (the others are destroyed)
+        :type idle: int
+        """
+        # workers are forked: started now, the resource tracker is shared with them and a segment
+        # they attach isn't destroyed when they exit
+        resource_tracker.ensure_running()
+        self.idle_limit = idle
+        self.segments = {}  # name -> SharedMemory, every segment alive
+        self.idle = []
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, size):
+        """Return a segment which can hold size bytes, reusing an idle one when possible
+
+        :param size: number of bytes
+        :type size: int
+        :return: segment
+        :rtype: shared_memory.SharedMemory
+        """
+        fitting = [segment for segment in self.idle if segment.size >= size]
+        if fitting:
+            segment = min(fitting, key=lambda s: s.size)
+            self.idle.remove(segment)
+            self.reused += 1
+            return segment
+        segment = shared_memory.SharedMemory(create=True, size=segment_capacity(size))
+        self.segments[segment.name] = segment
+        self.created += 1
+        return segment
+
+    def load(self, fh, size):
+        """Read size bytes from a binary file object into a segment
+
+        Nothing is read from fh if no segment can be created (OSError, e.g. /dev/shm is full).
+
+        :param fh: binary file object
+        :param size: number of bytes to read
+        :type fh: file object
+        :type size: int
+        :return: handle of the page: (segment name, size)
+        :rtype: tuple
+        """
+        segment = self.acquire(size)
+        view = segment.buf[:size]
+        try:
+            filled = 0
+            while filled < size:
+                count = fh.readinto(view[filled:])
+                if not count:
+                    raise EOFError(f"Expected {size} bytes, got {filled}")
+                filled += count
+        except Exception:
+            self.release((segment.name, size))
+            raise
+        finally:
+            view.release()
+        return segment.name, size
+
+    def release(self, handle):
+        """Give the segment of a page back to the pool
+
+        :param handle: handle of the page (see load()), None for a page which isn't in shared memory
+        :type handle: tuple or None
+        :return: None
+        """
+        if handle is None:
+            return
+        segment = self.segments.get(handle[0])
+        if segment is None or segment in self.idle:
+            return
+        if len(self.idle) < self.idle_limit:
+            self.idle.append(segment)
+        else:
+            self._destroy(segment)
+
+    def _destroy(self, segment):
+        del self.segments[segment.name]
+        segment.close()
+        segment.unlink()
+
+    def close(self):
+        """Destroy every segment (can be called several times)"""
+        for segment in list(self.segments.values()):
+            self._destroy(segment)
+        self.idle = []
+
+
+def attach(name):
+    """Return a segment created by the reading process, attached once per process"""
+    segment = _attached.pop(name, None)
+    if segment is None:
+        segment = shared_memory.SharedMemory(name=name)
+        while len(_attached) >= ATTACHED_SEGMENTS:
+            _, oldest = _attached.popitem(last=False)
+            try:
+                oldest.close()
+            except BufferError:
+                pass
+    _attached[name] = segment
+    return segment
+
+
+@contextmanager
+def serve_page(path, handle):
+    """Serve the bytes of a page from shared memory as the content of path (see page_reader())
+
+    :param path: path the page is known by (nothing needs to exist there)
+    :param handle: handle of the page (see SegmentPool.load())
+    :type path: str
+    :type handle: tuple
+    :return: None
+    """
+    name, size = handle
+    view = attach(name).buf[:size]
+    _pages[path] = view
+    try:
+        yield
+    finally:
+        del _pages[path]
+        view.release()
+
+
+class PageReader(io.RawIOBase):
+    def __init__(self, view):
+        """Read-only binary file object over a page held in shared memory"""
+        super().__init__()
+        self.view = view
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = min(len(buffer), len(self.view) - self.position)
+        buffer[:count] = self.view[self.position:self.position + count]
+        self.position += count
+        return count
+
+    def readall(self):
+        data = bytes(self.view[self.position:])
+        self.position = len(self.view)
+        return data
+
+
+def page_reader(path):
+    """Return a file object reading the page served for path, None if it isn't served from shared memory"""
+    view = _pages.get(path)
+    return PageReader(view) if view is not None else None
+
+
+def page_size(path):
+    """Return the size of the page served for path, None if it isn't served from shared memory"""
+    view = _pages.get(path)
+    return len(view) if view is not None else None
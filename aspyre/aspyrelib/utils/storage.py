@@ -0,0 +1,474 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT storage package"""
+
+import io
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote
+
+STORE_SCHEME = "store://"
+UPLOADS_DIR = ".uploads"  # uploads in progress, in each bucket
+BLOCK_SIZE = 1024 * 1024  # bytes fetched by a streaming reader per request
+PREFETCH_BLOCKS = 4  # blocks a streaming reader fetches ahead of the one being read
+CACHED_BLOCKS = 16  # blocks a streaming reader keeps
+MERGE_GAP = 64 * 1024  # ranges closer than this are fetched in one request by read_ranges()
+COPY_CHUNK_SIZE = 1024 * 1024
+
+_store_root = os.environ.get("ASPYRE_STORE_ROOT")
+_stores = {}
+_released = {"requests": 0, "bytes_read": 0, "bytes_written": 0}  # usage of the buckets dropped by configure()
+
+
+def configure(root):
+    """Set the directory holding the buckets of the object store (default: $ASPYRE_STORE_ROOT)
+
+    :param root: path to the directory
+    :type root: str
+    :return: None
+    """
+    global _store_root
+    _store_root = os.path.abspath(root)
+    for counter, value in usage().items():
+        _released[counter] = value
+    _stores.clear()
+
+
+def is_remote(path):
+    """Control that a path designates an object of the object store (store://<bucket>/<key>)"""
+    return isinstance(path, str) and path.startswith(STORE_SCHEME)
+
+
+def split_url(path):
+    """Split store://<bucket>/<key> into (bucket, key)"""
+    bucket, _, key = path[len(STORE_SCHEME):].partition("/")
+    if not bucket:
+        raise ValueError(f"No bucket in {path}")
+    return bucket, key.strip("/")
+
+
+def join(path, *names):
+    """Join names to a path or to a key prefix"""
+    if is_remote(path):
+        return "/".join([path.rstrip("/")] + [name.strip("/") for name in names])
+    return os.path.join(path, *names)
+
+
+def parent(path):
+    """Return the directory of a path, or the key prefix of an object (not above its bucket)"""
+    if is_remote(path):
+        bucket, key = split_url(path)
+        return STORE_SCHEME + "/".join([bucket] + key.split("/")[:-1])
+    return os.path.dirname(os.path.normpath(path))
+
+
+def get_storage(path):
+    """Return the backend holding a path, and the path in the backend
+
+    :param path: local path or store://<bucket>/<key>
+    :type path: str
+    :return: (LocalStorage or ObjectStore, path or key)
+    :rtype: tuple
+    """
+    if not is_remote(path):
+        return LocalStorage(), path
+    if _store_root is None:
+        raise ValueError(f"Can't read {path}: no object store root configured (store_root or $ASPYRE_STORE_ROOT)")
+    bucket, key = split_url(path)
+    if bucket not in _stores:
+        _stores[bucket] = ObjectStore(_store_root, bucket)
+    return _stores[bucket], key
+
+
+def read_ranges_from(read_range, ranges, gap=MERGE_GAP):
+    """Read several ranges in as few requests as possible: ranges closer than gap are merged
+
+    :param read_range: function read_range(start, length) -> bytes doing one request
+    :param ranges: (start, length) of each range
+    :param gap: largest gap between two ranges fetched in one request (bytes)
+    :type read_range: function
+    :type ranges: list
+    :type gap: int
+    :return: content of each range, in the order of ranges
+    :rtype: list
+    """
+    order = sorted(range(len(ranges)), key=lambda i: ranges[i][0])
+    results = [b""] * len(ranges)
+    group, group_start, group_end = [], None, None
+    for i in order + [None]:
+        if i is not None:
+            start, length = ranges[i]
+            if group and start - group_end <= gap:
+                group.append(i)
+                group_end = max(group_end, start + length)
+                continue
+        if group:
+            data = read_range(group_start, group_end - group_start)
+            for j in group:
+                offset = ranges[j][0] - group_start
+                results[j] = data[offset:offset + ranges[j][1]]
+        if i is not None:
+            group, group_start, group_end = [i], start, start + length
+    return results
+
+
+class LocalStorage():
+    """Local filesystem backend: paths are used as they are"""
+    remote = False
+
+    def list(self, prefix):
+        """List the files under a directory, recursively
+
+        :param prefix: path to a directory
+        :type prefix: str
+        :return: (path, size) of each file, sorted
+        :rtype: list
+        """
+        entries = []
+        for dirpath, _, filenames in os.walk(prefix):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                entries.append((path, os.path.getsize(path)))
+        return sorted(entries)
+
+    def exists(self, path):
+        return os.path.isfile(path)
+
+    def is_dir(self, path):
+        return os.path.isdir(path)
+
+    def size(self, path):
+        return os.path.getsize(path)
+
+    def read_range(self, path, start, length):
+        with open(path, "rb") as fh:
+            fh.seek(start)
+            return fh.read(length)
+
+    def read_ranges(self, path, ranges):
+        """Read several ranges of a file (see read_ranges_from())"""
+        with open(path, "rb") as fh:
+            def read_range(start, length):
+                fh.seek(start)
+                return fh.read(length)
+            return read_ranges_from(read_range, ranges)
+
+    def open_read(self, path):
+        return open(path, "rb")
+
+    def open_write(self, path):
+        """Open a file for writing; it replaces the file of the same name only once closed"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return AtomicWriter(path, f"{path}.{uuid.uuid4().hex[:8]}.tmp")
+
+
+class ObjectStore():
+    remote = True
+
+    def __init__(self, root, bucket):
+        """Bucket of an object store emulated in a local directory (<root>/<bucket>/<quoted key>)
+
+        :param root: path to the directory holding the buckets
+        :param bucket: name of the bucket
+        :type root: str
+        :type bucket: str
+        """
+        self.path = os.path.join(root, bucket)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def _object(self, key):
+        return os.path.join(self.path, quote(key, safe=""))
+
+    def _count(self, read=0, written=0):
+        with self.lock:
+            self.requests += 1
+            self.bytes_read += read
+            self.bytes_written += written
+
+    def list(self, prefix):
+        """List the objects whose key starts with prefix (one request)
+
+        :param prefix: key prefix ("" for the whole bucket)
+        :type prefix: str
+        :return: (key, size) of each object, sorted by key
+        :rtype: list
+        """
+        self._count()
+        entries = []
+        for entry in os.scandir(self.path):
+            key = unquote(entry.name)
+            if entry.is_file() and key.startswith(prefix):
+                entries.append((key, entry.stat().st_size))
+        return sorted(entries)
+
+    def exists(self, key):
+        self._count()
+        return os.path.isfile(self._object(key))
+
+    def is_dir(self, key):
+        """Control that the bucket exists (prefixes don't need to be created in an object store)"""
+        return os.path.isdir(self.path)
+
+    def size(self, key):
+        self._count()
+        return os.path.getsize(self._object(key))
+
+    def read_range(self, key, start, length):
+        """Read length bytes of an object from start (one ranged request)"""
+        with open(self._object(key), "rb") as fh:
+            fh.seek(start)
+            data = fh.read(length)
+        self._count(read=len(data))
+        return data
+
+    def read_ranges(self, key, ranges):
+        """Read several ranges of an object, neighbouring ranges in one request (see read_ranges_from())"""
+        return read_ranges_from(lambda start, length: self.read_range(key, start, length), ranges)
+
+    def open_read(self, key, prefetch=PREFETCH_BLOCKS):
+        """Open an object for (seekable) streaming reads through ranged requests (see ObjectReader)"""
+        return io.BufferedReader(ObjectReader(self, key, self.size(key), prefetch=prefetch), BLOCK_SIZE)
+
+    def open_write(self, key):
+        """Open an object for streaming writes: it only replaces the object of the same key once closed"""
+        uploads = os.path.join(self.path, UPLOADS_DIR)
+        os.makedirs(uploads, exist_ok=True)
+        return AtomicWriter(self._object(key), os.path.join(uploads, uuid.uuid4().hex), store=self)
+
+
+class ObjectReader(io.RawIOBase):
+    def __init__(self, store, key, size, block_size=BLOCK_SIZE, prefetch=PREFETCH_BLOCKS):
+        """Seekable reader over an object, fetching it by blocks through ranged requests
+
+        The blocks following the one being read are fetched in the background (prefetch), until
+        prefetch_ranges() is called: from then on, only the blocks of the ranges known in advance are
+        fetched beforehand, in as few requests as possible.
+
+        :param store: bucket holding the object
+        :param key: key of the object
+        :param size: size of the object
+        :param block_size: bytes per block
+        :param prefetch: blocks fetched ahead of the one being read (0: no prefetching)
+        :type store: ObjectStore
+        :type key: str
+        :type size: int
+        :type block_size: int
+        :type prefetch: int
+        """
+        super().__init__()
+        self.store = store
+        self.key = key
+        self.size = size
+        self.block_size = block_size
+        self.prefetch = prefetch
+        self.position = 0
+        self.blocks = OrderedDict()  # block number -> bytes or Future, most recently used last
+        self.executor = ThreadPoolExecutor(max_workers=prefetch) if prefetch else None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if self.position < 0:
+            raise ValueError("Negative seek position")
+        return self.position
+
+    def _fetch(self, number):
+        start = number * self.block_size
+        return self.store.read_range(self.key, start, min(self.block_size, self.size - start))
+
+    def _schedule(self, number):
+        if number * self.block_size < self.size and number not in self.blocks:
+            self.blocks[number] = self.executor.submit(self._fetch, number)
+
+    def _block(self, number):
+        block = self.blocks.pop(number, None)
+        if block is None:
+            block = self._fetch(number)
+        elif not isinstance(block, bytes):
+            block = block.result()
+        self.blocks[number] = block
+        if self.executor is not None and self.prefetch:
+            for ahead in range(number + 1, number + 1 + self.prefetch):
+                self._schedule(ahead)
+        while len(self.blocks) > CACHED_BLOCKS:
+            _, oldest = self.blocks.popitem(last=False)
+            if not isinstance(oldest, bytes):
+                oldest.cancel()
+        return block
+
+    def prefetch_ranges(self, ranges):
+        """Fetch the blocks covering ranges which will be read, neighbouring blocks in one request
+
+        :param ranges: (start, length) of each range
+        :type ranges: list
+        :return: None
+        """
+        self.prefetch = 0
+        numbers = sorted({number for start, length in ranges if length > 0
+                          for number in range(start // self.block_size,
+                                              (min(start + length, self.size) - 1) // self.block_size + 1)
+                          if number not in self.blocks and number * self.block_size < self.size})
+        numbers = numbers[:CACHED_BLOCKS]
+        spans = [(number * self.block_size, min(self.block_size, self.size - number * self.block_size))
+                 for number in numbers]
+        for number, data in zip(numbers, self.store.read_ranges(self.key, spans)):
+            self.blocks[number] = data
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        number, offset = divmod(self.position, self.block_size)
+        block = self._block(number)
+        count = min(len(buffer), len(block) - offset)
+        buffer[:count] = block[offset:offset + count]
+        self.position += count
+        return count
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        self.blocks.clear()
+        super().close()
+
+
+class AtomicWriter(io.BufferedWriter):
+    def __init__(self, target, tmp_path, store=None):
+        """Streaming writer: bytes go to tmp_path, which replaces target only once the writer is closed
+        without error (an upload aborted by an exception leaves target as it was)
+
+        :param target: path where the file or object ends up
+        :param tmp_path: path written to in the meantime
+        :param store: bucket counting the requests, for the object store backend
+        :type target: str
+        :type tmp_path: str
+        :type store: ObjectStore or None
+        """
+        super().__init__(io.FileIO(tmp_path, "w"), buffer_size=COPY_CHUNK_SIZE)
+        self.target = target
+        self.tmp_path = tmp_path
+        self.store = store
+        self.aborted = False
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.aborted = exc_type is not None
+        return super().__exit__(exc_type, exc_value, traceback)
+
+    def __del__(self):
+        # a writer dropped without being closed is an aborted upload
+        if not self.closed:
+            self.aborted = True
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        written = self.tell()
+        super().close()
+        if self.aborted:
+            os.remove(self.tmp_path)
+            return
+        os.replace(self.tmp_path, self.target)
+        if self.store is not None:
+            self.store._count(written=written)
+
+
+def open_read(path):
+    """Open a local file or an object for (seekable) streaming reads"""
+    backend, name = get_storage(path)
+    return backend.open_read(name)
+
+
+def open_write(path):
+    """Open a local file or an object for streaming writes, visible once closed"""
+    backend, name = get_storage(path)
+    return backend.open_write(name)
+
+
+def size(path):
+    """Return the size of a local file or an object"""
+    backend, name = get_storage(path)
+    return backend.size(name)
+
+
+def is_dir(path):
+    """Control that outputs can be written under a path (local directory or bucket of the object store)"""
+    try:
+        backend, name = get_storage(path)
+    except ValueError:
+        return False
+    return backend.is_dir(name)
+
+
+def put_file(path, destination):
+    """Copy a local file to a local directory or an object store prefix, in a streaming write
+
+    :param path: path to the local file
+    :param destination: path to the directory, or store://<bucket>/<prefix>
+    :type path: str
+    :type destination: str
+    :return: path to the copy
+    :rtype: str
+    """
+    target = join(destination, os.path.basename(path))
+    with open(path, "rb") as src, open_write(target) as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+    return target
+
+
+def put_files(directory, destination):
+    """Copy the files of a local directory (recursively) to an object store prefix, keeping their relative paths
+
+    :param directory: path to the local directory
+    :param destination: store://<bucket>/<prefix>
+    :type directory: str
+    :type destination: str
+    :return: number of files copied
+    :rtype: int
+    """
+    copied = 0
+    for path, _ in LocalStorage().list(directory):
+        relative = os.path.relpath(os.path.dirname(path), directory)
+        put_file(path, destination if relative == "." else join(destination, *relative.split(os.sep)))
+        copied += 1
+    return copied
+
+
+def usage(since=None):
+    """Return the requests made to the object store and the bytes read and written
+
+    The counters are kept for the whole process: a run reports the difference with the usage at its start.
+
+    :param since: usage returned earlier, to only count what happened after it
+    :type since: dict or None
+    :return: {"requests": int, "bytes_read": int, "bytes_written": int}
+    :rtype: dict
+    """
+    totals = {counter: value + sum(getattr(store, counter) for store in _stores.values())
+              for counter, value in _released.items()}
+    if since is None:
+        return totals
+    return {counter: value - since.get(counter, 0) for counter, value in totals.items()}
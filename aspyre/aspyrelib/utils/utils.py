@@ -8,11 +8,15 @@ date: 19/03/2021
 """
 
 import csv
+import io
 import json
+import mmap
 import os
+from contextlib import contextmanager
 
 from bs4 import BeautifulSoup
-from termcolor import cprint
+
+from . import logger, shm
 
 
 ALLOWED_IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.tif']
@@ -22,7 +26,7 @@ ALLOWED_IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.tif']
 def read_file(path, mode="default"):
     """Open a file and return its content (parsed if possible)
     :param path: (abs) path to the file
-    :param mode: "default|json"
+    :param mode: "default|json|csv|xml|mmap"
     :type path: str
     :type mode: str
     :return: content of the file
@@ -41,11 +45,68 @@ def read_file(path, mode="default"):
         with open(path, "r", encoding="utf-8") as fh:
             content = fh.read()
         content = BeautifulSoup(content, 'xml')
+    elif mode == "mmap":
+        # same as "xml" but the parser is fed the raw bytes, there is no decoded copy of the file
+        # path can also be an open binary file (archive member, stream, etc)
+        with open_mapped(path) as raw:
+            content = BeautifulSoup(raw, 'xml')
     else:
         content = False
     return content
 
 
+@contextmanager
+def open_mapped(source):
+    """Memory-map a file for reading, fall back to reading its bytes when it can't be mapped
+
+    A page handed over to a worker in shared memory (see shm.serve_page()) is read from there.
+
+    :param source: (abs) path to a file or binary file object
+    :type source: str or file object
+    :return: read-only memory map (or bytes, or file object over shared memory), closed on exit
+    :rtype: mmap.mmap or bytes or shm.PageReader
+    """
+    served = shm.page_reader(source) if isinstance(source, str) else None
+    if served is not None:
+        with served:
+            yield served
+        return
+    if hasattr(source, "read"):
+        fh, owned = source, False
+    else:
+        fh, owned = open(source, "rb"), True
+    mapped = None
+    try:
+        # an object we didn't open may have been partially consumed already
+        if owned or (fh.seekable() and fh.tell() == 0):
+            try:
+                mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+                # archive members and pipes have no mappable descriptor, empty files can't be mapped
+                mapped = None
+        if mapped is None:
+            yield fh.read()
+        else:
+            yield mapped
+    finally:
+        if mapped is not None:
+            mapped.close()
+        if owned:
+            fh.close()
+
+
+def file_size(path):
+    """Return the size of a file (bytes), or of the page served for path from shared memory
+
+    :param path: (abs) path to the file
+    :type path: str
+    :return: number of bytes
+    :rtype: int
+    """
+    size = shm.page_size(path)
+    return size if size is not None else os.path.getsize(path)
+
+
 def write_file(path, content, mode=False):
     """Create/Open a file and write a content in it
 
@@ -78,19 +139,8 @@ def report(message, code_type="I"):
     :param code_type: letter code to specify type of report [I]nfo | [W]arning | [E]rror | [S]uccess | [H]ighlight
     :return: None
     """
-    if code_type == "I":  # Info
-        print(f"[I] {message}")
-    elif code_type == "W":  # Warning
-        cprint(f"[W] {message}", "yellow")
-    elif code_type == "E":  # Error
-        cprint(f"[E] {message}", "red")
-    elif code_type == "S":  # Success
-        cprint(f"[S] {message}", "green")
-    elif code_type == "H":  # Highlight
-        cprint(f"[H] {message}", "blue")
-    else:
-        # unknown color parameter, treated as "normal" text
-        print(message)
+    # messages go through the structured logger: level filtering, deduplication, buffered display
+    logger.get_logger().report(message, code_type)
 
 
 def list_directory(dirpath):
@@ -122,6 +172,35 @@ def path_is_valid(tested_path):
     return valid
 
 
+def count_tags(xml_tree, names):
+    """Count the elements of a parsed XML tree matching a list of tag names, in a single pass
+
+    :param xml_tree: parsed XML tree
+    :param names: tag names to look for
+    :type xml_tree: type(BeautifulSoup())
+    :type names: list
+    :return: number of elements found for each tag name
+    :rtype: dict
+    """
+    counts = {name: 0 for name in names}
+    for tag in xml_tree.find_all(names):
+        counts[tag.name] += 1
+    return counts
+
+
+def schema_declarations(namespace, schema_location):
+    """List the declarations an ALTO version is detected from: the values in xsi:schemaLocation, then the namespace
+
+    ALTO 4 is only told apart by its schema location, ALTO 2 and 3 often only declare their namespace.
+
+    :param namespace: namespace of the <alto> element (None if there is none)
+    :param schema_location: value of its xsi:schemaLocation attribute (None if there is none)
+    :type namespace: str or None
+    :type schema_location: str or None
+    :return: declarations, to be given to the scenarios' control_schema_version()
+    :rtype: list
+    """
+    return (schema_location or "").split() + (namespace or "").split()
 
 
 def is_image(filename):
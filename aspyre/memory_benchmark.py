@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""ASPYRE GT memory benchmark"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+SAMPLES = {"tkb": os.path.join(DATA, "altos", "alto_transcribus.xml"),
+           "limb": os.path.join(DATA, "altos", "alto_escriptorium.xml"),
+           "pdfalto": os.path.join(DATA, "altos", "alto_escriptorium.xml")}
+METS = os.path.join(DATA, "example", "mets.xml")
+TKB_PAGE = "PH 1858-520"  # the page mets.xml refers to
+PRINT_SPACE = re.compile(r"(<PrintSpace\b[^>]*>)(.*)(</PrintSpace>)", re.S)
+RESULT_MARK = "ASPYRE_MEMORY "
+
+
+# ------------------------- SAMPLES
+def scale_sample(xml, scale):
+    """Repeat the content of the print space of a page scale times (IDs are repeated too)"""
+    found = PRINT_SPACE.search(xml)
+    return xml[:found.start(2)] + found.group(2) * scale + xml[found.end(2):]
+
+
+def build_page(scenario, scale, folder):
+    """Write a page (and what it is paired with) as the scenario expects to find it once unpacked
+
+    :param scenario: keyword describing the scenario
+    :param scale: number of times the print space of the sample is repeated
+    :param folder: path to an empty directory
+    :type scenario: str
+    :type scale: int
+    :type folder: str
+    :return: path to the ALTO XML file
+    :rtype: str
+    """
+    from PIL import Image
+
+    with open(SAMPLES[scenario], "r", encoding="utf-8") as fh:
+        xml = scale_sample(fh.read(), scale)
+    if scenario != "tkb":
+        # pdfalto and LIMB Preprocessor produce ALTO v3
+        xml = xml.replace("ns-v4#", "ns-v3#")
+    if scenario == "tkb":
+        with open(METS, "rb") as src, open(os.path.join(folder, "mets.xml"), "wb") as dst:
+            dst.write(src.read())
+        os.makedirs(os.path.join(folder, "alto"))
+        page = os.path.join(folder, "alto", f"{TKB_PAGE}.xml")
+    elif scenario == "pdfalto":
+        out = os.path.join(folder, "doc", "out")
+        os.makedirs(os.path.join(out, "page.xml_data"))
+        # the canvas size is read from an image illustration (1/16.67 of the image size)
+        xml = re.sub(r"(<PrintSpace\b[^>]*>)",
+                     r'\1<Illustration ID="bench_canvas" TYPE="image" HPOS="0" VPOS="0" WIDTH="60" HEIGHT="90"/>',
+                     xml, count=1)
+        Image.new("L", (1000, 1500)).save(os.path.join(out, "page.xml_data", "image-1.png"))
+        page = os.path.join(out, "page.xml")
+    else:
+        os.makedirs(os.path.join(folder, "doc"))
+        page_tag = re.search(r"<Page\b[^>]*>", xml).group(0)
+        width, height = (int(re.search(rf'{name}="(\d+)"', page_tag).group(1)) for name in ("WIDTH", "HEIGHT"))
+        Image.new("L", (width * 3, height * 3)).save(os.path.join(folder, "doc", "BENCH_X_0001.jpg"))
+        page = os.path.join(folder, "doc", "BENCH_0001.xml")
+    with open(page, "w", encoding="utf-8") as fh:
+        fh.write(xml)
+    return page
+
+
+# ------------------------- MEASURE (child process)
+def peak_rss():
+    """Return the peak resident set size of the current process (bytes)"""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def convert(scenario, engine, folder, traced=False):
+    """Convert the page found in folder, return its outcome and tracemalloc peak (bytes, None if not traced)"""
+    import tracemalloc
+    from aspyrelib import aspyre
+
+    args = aspyre.AspyreArgs(scenario=scenario, source=folder, destination=f"{folder}_output",
+                             engine=engine, log_level="error")
+    alto_files, image_files = aspyre.locate_pages(scenario, folder, folder)
+    unit = aspyre.WorkUnit(args, alto_files, image_files, folder)
+    if traced:
+        tracemalloc.start()
+    result = aspyre.convert_page(unit, aspyre.HANDLERS[scenario], alto_files[0])
+    traced_peak = None
+    if traced:
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, traced_peak
+
+
+def measure(scenario, engine, folder, warmup, traced):
+    """Measure the conversion of a page in the current (fresh) process and print the result as JSON
+
+    A first page (warmup) is converted to load everything which is loaded lazily, so the growth
+    of the peak RSS is due to the measured page.
+    """
+    import gc
+
+    convert(scenario, engine, warmup)
+    gc.collect()
+    baseline = peak_rss()
+    start = time.perf_counter()
+    result, traced_peak = convert(scenario, engine, folder, traced=traced)
+    duration = time.perf_counter() - start
+    print(RESULT_MARK + json.dumps({"status": result.status, "reason": result.reason, "rss_baseline": baseline,
+                      "rss_peak": peak_rss(), "traced_peak": traced_peak, "duration": duration}))
+
+
+def run_child(scenario, engine, folder, warmup, traced):
+    """Run measure() in a fresh interpreter"""
+    command = [sys.executable, os.path.abspath(__file__), "--child", scenario, engine, folder, warmup,
+               "1" if traced else "0"]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads([line for line in output.splitlines() if line.startswith(RESULT_MARK)][-1][len(RESULT_MARK):])
+
+
+# ------------------------- HISTORY
+def git_revision():
+    """Return the abbreviated hash of the current commit, None outside of a git repository"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def previous_results(history):
+    """Return the last recorded result of each (scenario, engine, scale)"""
+    previous = {}
+    if os.path.isfile(history):
+        with open(history, "r", encoding="utf-8") as fh:
+            for line in fh:
+                if line.strip():
+                    record = json.loads(line)
+                    previous[(record["scenario"], record["engine"], record["scale"])] = record
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the memory used to convert one page, per scenario, "
+                                                 "engine and page size")
+    parser.add_argument('-sc', '--scenarios', nargs="+", default=["tkb", "pdfalto", "limb"],
+                        help='Scenarios to measure (tkb|pdfalto|limb)')
+    parser.add_argument('-e', '--engines', nargs="+", default=["soup", "model"],
+                        help='Engines to measure (soup|model)')
+    parser.add_argument('-s', '--scales', nargs="+", type=int, default=[1, 10, 50],
+                        help='Number of times the print space of the samples is repeated')
+    parser.add_argument('-o', '--output', default="aspyre_memory.jsonl",
+                        help='JSON lines file where the results are appended')
+    parser.add_argument('-b', '--budget', type=float, default=None,
+                        help='Maximum growth of the peak RSS for one page (MiB), exit with an error above')
+    parser.add_argument('-tol', '--tolerance', type=float, default=0.1,
+                        help='Relative growth of the tracemalloc peak over the previous run reported as a regression')
+    parser.add_argument('--child', nargs=5, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        scenario, engine, folder, warmup, traced = args.child
+        measure(scenario, engine, folder, warmup, traced == "1")
+        return 0
+
+    previous = previous_results(args.output)
+    revision = git_revision()
+    problems = 0
+    print(f"{'scenario':<9}{'engine':<7}{'scale':>6}{'xml MiB':>9}{'rss +MiB':>10}{'traced MiB':>12}"
+          f"{'MiB/MiB':>9}  note")
+    with tempfile.TemporaryDirectory() as tmp, open(args.output, "a", encoding="utf-8") as history:
+        for scenario in args.scenarios:
+            warmup = os.path.join(tmp, f"{scenario}_warmup")
+            os.makedirs(warmup)
+            build_page(scenario, 1, warmup)
+            for scale in args.scales:
+                folder = os.path.join(tmp, f"{scenario}_{scale}")
+                os.makedirs(folder)
+                size = os.path.getsize(build_page(scenario, scale, folder))
+                for engine in args.engines:
+                    plain = run_child(scenario, engine, folder, warmup, traced=False)
+                    traced = run_child(scenario, engine, folder, warmup, traced=True)
+                    growth = max(plain["rss_peak"] - plain["rss_baseline"], 0)
+                    record = {"time": time.time(), "revision": revision, "scenario": scenario, "engine": engine,
+                              "scale": scale, "xml_bytes": size, "status": plain["status"],
+                              "rss_baseline": plain["rss_baseline"], "rss_peak": plain["rss_peak"],
+                              "rss_growth": growth, "traced_peak": traced["traced_peak"],
+                              "bytes_per_xml_byte": traced["traced_peak"] / size, "duration": plain["duration"]}
+                    history.write(json.dumps(record) + "\n")
+                    notes = []
+                    if plain["status"] != "processed":
+                        notes.append(f"{plain['status']}: {plain['reason']}")
+                    if args.budget is not None and growth > args.budget * 1024 * 1024:
+                        notes.append("OVER BUDGET")
+                        problems += 1
+                    before = previous.get((scenario, engine, scale))
+                    if before and before["traced_peak"] and \
+                            record["traced_peak"] > before["traced_peak"] * (1 + args.tolerance):
+                        notes.append(f"REGRESSION (was {before['traced_peak'] / 1048576:.1f} MiB "
+                                     f"at {before.get('revision')})")
+                        problems += 1
+                    print(f"{scenario:<9}{engine:<7}{scale:>6}{size / 1048576:>9.2f}{growth / 1048576:>10.1f}"
+                          f"{record['traced_peak'] / 1048576:>12.1f}{record['bytes_per_xml_byte']:>9.1f}  "
+                          f"{', '.join(notes)}")
+    print(f"Results appended to {args.output}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
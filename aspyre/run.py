@@ -9,16 +9,25 @@ date: 19/03/2021
 
 import argparse
 import os
+import sys
 
-from aspyrelib.aspyre import (AspyreArgs, TkbToEs, PdfaltoToEs, LimbToEs)
+from aspyrelib.aspyre import (AspyreArgs, TkbToEs, PdfaltoToEs, LimbToEs, CheckArchive, Coordinator,
+                              DistributedWorker, Merger, SUPPORTED_SCENARIOS)
+from aspyrelib.manage import pipe
 from aspyrelib.utils import utils as utils
+from aspyrelib.utils import logger
+
+
+def workers_count(value):
+    """Parse the value of --workers: a number of processes or auto"""
+    return value if value == "auto" else int(value)
 
 
 parser = argparse.ArgumentParser(description="Aspyre is a program transforming files to make them compatible" +
                                              "with eScriptorium Import XML module")
-parser.add_argument('-i', '--source', action='store', nargs=1, required=True,
+parser.add_argument('-i', '--source', action='store', nargs=1, default=[None],
                     help='Location of the source files')
-parser.add_argument('-sc', '--scenario', action='store', nargs=1, required=True,
+parser.add_argument('-sc', '--scenario', action='store', nargs=1, default=[None],
                     help='Determines which transformation scenario will be applied' +
                          '(tkb|limb|finereader|pdfalto)')
 parser.add_argument('-o', '--destination', action='store', nargs=1, default=[False],
@@ -29,11 +38,97 @@ parser.add_argument('-t', '--talktome', action='store_true',
 parser.add_argument('-vp', '--vpadding', action='store', nargs=1, type=int, default=[0],
                     help='[PDFALTO, LIMB] adjust vertical coordinates' +
                          '(value will be added to textline and string VPOS attr)')
+parser.add_argument('-e', '--engine', action='store', nargs=1, default=['soup'],
+                    help='Representation of the pages during the transformation (soup|model): ' +
+                         '"model" is lighter and faster but only keeps the elements eScriptorium needs')
+parser.add_argument('-r', '--report', action='store', nargs=1, default=[None],
+                    help='Location of a JSON file where the run report (metrics) will be written')
+parser.add_argument('-pm', '--prometheus', action='store', nargs=1, default=[None],
+                    help='Location of a Prometheus textfile (.prom) where the run metrics will be written' +
+                         '(ex: in the directory read by node exporter\'s textfile collector)')
+parser.add_argument('-p', '--profile', action='store', nargs=1, default=[None],
+                    help='Location of a directory where per-stage cProfile stats and a summary of the hotspots' +
+                         'will be written')
+parser.add_argument('-pmem', '--profile-memory', action='store_true',
+                    help='[with --profile] also record peak allocation per page and per stage (tracemalloc)')
+parser.add_argument('-sp', '--shard-pages', action='store', nargs=1, type=int, default=[None],
+                    help='Split the output archive in several archives (written concurrently) of at most ' +
+                         'this many pages, with an index file mapping pages to archives')
+parser.add_argument('-sb', '--shard-bytes', action='store', nargs=1, type=int, default=[None],
+                    help='Split the output archive in several archives (written concurrently) of at most ' +
+                         'this many bytes of XML, with an index file mapping pages to archives')
+parser.add_argument('-w', '--workers', action='store', nargs=1, type=workers_count, default=[None],
+                    help='Convert the pages in this many isolated worker processes, or "auto" to choose it ' +
+                         'from the cores and memory available (default with --timeout or --max-memory)')
+parser.add_argument('-to', '--timeout', action='store', nargs=1, type=float, default=[None],
+                    help='Maximum time (in seconds) spent on a page: past this limit, the worker is killed ' +
+                         'and the page is recorded as failed')
+parser.add_argument('-mm', '--max-memory', action='store', nargs=1, type=int, default=[None],
+                    help='Maximum memory (in MiB) a worker can add to what it uses once started, ' +
+                         'to convert a page: past this limit, the page is recorded as failed')
+parser.add_argument('-lf', '--log-file', action='store', nargs=1, default=[None],
+                    help='Location of a file where every message will be written (JSON lines)')
+parser.add_argument('-ll', '--log-level', action='store', nargs=1, default=['info'],
+                    help='Minimum level of the messages displayed in the console (debug|info|warning|error)')
+parser.add_argument('-c', '--check', action='store_true',
+                    help='Only check that the source archive is ready to be converted (nothing is unpacked nor ' +
+                         'converted) and write a per-page readiness report')
+parser.add_argument('-ii', '--include-images', action='store_true',
+                    help='Also put the images paired with the transformed files in the output archive ' +
+                         '(copied from a zip source without being recompressed)')
+parser.add_argument('-ua', '--update-archive', action='store_true',
+                    help='If the output archive already exists, only add the files which are new or changed ' +
+                         '(appended in place, the archive is compacted once too much of it is dead entries)')
+parser.add_argument('-d', '--distributed', action='store', nargs=1, default=[None],
+                    choices=['coordinate', 'work', 'merge'],
+                    help='Run one step of a distributed job: coordinate (write the manifest of work units), ' +
+                         'work (convert units until none is left) or merge (assemble the output). ' +
+                         'Source and scenario are only required to coordinate')
+parser.add_argument('-sh', '--shared', action='store', nargs=1, default=[None],
+                    help='Location of the directory shared by the steps of a distributed job')
+parser.add_argument('-up', '--unit-pages', action='store', nargs=1, type=int, default=[500],
+                    help='Number of pages per work unit of a distributed job')
+parser.add_argument('-ls', '--lease', action='store', nargs=1, type=float, default=[300],
+                    help="Duration of a worker's lease on a work unit, in seconds")
+parser.add_argument('-sr', '--scratch', action='store', nargs=1, default=[None],
+                    help='Directory where intermediate files (unpacked source) are written, removed at the end ' +
+                         'of the job (ex: /dev/shm), by default the system\'s temporary directory')
+parser.add_argument('-j', '--job-name', action='store', nargs=1, default=[None],
+                    help='Name added to the outputs (alto_escriptorium_<name>, aspyre_<source>_<name>.zip) so ' +
+                         'conversions of the same source can run side by side')
+parser.add_argument('-sd', '--sidecars', action='store', nargs='+', default=[], choices=['text', 'geometry'],
+                    help='Also write the text (JSON lines) and/or the geometry (NumPy .npz) of the lines next to ' +
+                         'each transformed file')
+parser.add_argument('-st', '--store-root', action='store', nargs=1, default=[None],
+                    help='Directory holding the buckets of the object store, for sources and destinations given ' +
+                         'as store://<bucket>/<key> (default: $ASPYRE_STORE_ROOT)')
+parser.add_argument('-va', '--validate', action='store_true',
+                    help='Validate each transformed file against the ALTO schema right after it is converted ' +
+                         '(invalid pages are listed in the run report)')
+parser.add_argument('-xs', '--schema', action='store', nargs=1, default=[None],
+                    help='[with --validate] Location of the XSD file to validate against ' +
+                         '(default: the bundled ALTO 4 schema)')
+parser.add_argument('-f', '--filter', action='store_true',
+                    help='Read one ALTO XML document from stdin and write the converted document to stdout ' +
+                         '(messages go to stderr)')
+parser.add_argument('-in', '--image-name', action='store', nargs=1, default=[None],
+                    help='Name of the image of the document (filter mode)')
+parser.add_argument('-is', '--image-size', action='store', nargs=1, default=[None],
+                    help='Size of the image of the document, WIDTHxHEIGHT (filter mode, pdfalto and limb)')
 parser.add_argument('-m', '--mode', action='store', nargs=1, default='default',
                     help="default|test")
 args = vars(parser.parse_args())
 
 # basic controls:
+if args['filter']:
+    # stdout carries the converted document
+    logger.get_logger().configure(console=sys.stderr)
+    if not (args['scenario'][0] and args['image_name'][0]):
+        parser.error('the following arguments are required in filter mode: -sc/--scenario, -in/--image-name')
+elif args['distributed'][0] not in ['work', 'merge'] and not (args['source'][0] and args['scenario'][0]):
+    parser.error('the following arguments are required: -i/--source, -sc/--scenario')
+if args['distributed'][0] and not args['shared'][0]:
+    parser.error('-d/--distributed requires -sh/--shared')
 if int(args['vpadding'][0]) != 0 and not args['scenario'][0] in ['pdfalto', 'limb']:
     utils.report('vpadding option is only valid for PDFALTO and LIMB scenarios\n---', 'W')
 
@@ -41,12 +136,48 @@ if int(args['vpadding'][0]) != 0 and not args['scenario'][0] in ['pdfalto', 'lim
 # start main task
 if args['mode'].lower() == 'test':
     pass
+elif args['filter']:
+    scenario = args['scenario'][0].lower()
+    try:
+        if scenario not in SUPPORTED_SCENARIOS:
+            raise ValueError(f"{scenario} is not a valid scenario")
+        image_size = pipe.parse_image_size(args['image_size'][0]) if args['image_size'][0] else None
+        pipe.filter_document(sys.stdin.buffer, sys.stdout.buffer, scenario, args['image_name'][0],
+                             image_size=image_size, vpadding=int(args['vpadding'][0]))
+    except BrokenPipeError:
+        # the reader went away (ex: | head): nothing more to write
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    except Exception as e:
+        utils.report(f"Failed to convert the document: {e}", "E")
+        logger.get_logger().flush()
+        sys.exit(1)
 elif args['mode'].lower() == 'default':
     aspyre_args = AspyreArgs(scenario=args['scenario'][0], source=args['source'][0],
                              destination=args['destination'][0], talkative=args['talktome'],
-                             vpadding=args['vpadding'][0])
+                             vpadding=args['vpadding'][0], report=args['report'][0],
+                             prometheus=args['prometheus'][0], profile=args['profile'][0],
+                             profile_memory=args['profile_memory'], engine=args['engine'][0],
+                             shard_pages=args['shard_pages'][0], shard_bytes=args['shard_bytes'][0],
+                             check=args['check'], workers=args['workers'][0], timeout=args['timeout'][0],
+                             max_memory=args['max_memory'][0], log_file=args['log_file'][0],
+                             log_level=args['log_level'][0], include_images=args['include_images'],
+                             distributed_role=args['distributed'][0], shared=args['shared'][0],
+                             unit_pages=args['unit_pages'][0], lease=args['lease'][0],
+                             scratch=args['scratch'][0], job_name=args['job_name'][0],
+                             sidecars=args['sidecars'], update_archive=args['update_archive'],
+                             store_root=args['store_root'][0], validate=args['validate'],
+                             schema=args['schema'][0])
     if aspyre_args.proceed():
-        if aspyre_args.scenario == 'tkb':
+        if aspyre_args.check:
+            transfo = CheckArchive(aspyre_args)
+        elif aspyre_args.distributed_role == 'coordinate':
+            transfo = Coordinator(aspyre_args)
+        elif aspyre_args.distributed_role == 'work':
+            transfo = DistributedWorker(aspyre_args)
+        elif aspyre_args.distributed_role == 'merge':
+            transfo = Merger(aspyre_args)
+        elif aspyre_args.scenario == 'tkb':
             transfo = TkbToEs(aspyre_args)
         elif aspyre_args.scenario == "pdfalto":
             transfo = PdfaltoToEs(aspyre_args)
@@ -55,7 +186,7 @@ elif args['mode'].lower() == 'default':
     if args['talktome']:
         utils.report(f"Displaying execution log (status: {aspyre_args.execution_status}):", "I")
         for entry in aspyre_args.log:
-            utils.report(entry, "I")
+            logger.get_logger().report(entry, "I", limit=False)
 else:
     utils.report(f"{args['mode']} is not a valid mode", "E")
 
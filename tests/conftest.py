@@ -0,0 +1,100 @@
+import io
+import os
+import sys
+import tarfile
+import zipfile
+
+import pytest
+from PIL import Image
+
+# aspyrelib is imported from the aspyre/ directory, as run.py does
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "aspyre"))
+
+EXAMPLE = os.path.join(ROOT, "data", "example")
+ALTO_V3 = "http://www.loc.gov/standards/alto/ns-v3#"
+
+
+def image(width, height, image_format):
+    data = io.BytesIO()
+    Image.new("L", (width, height)).save(data, image_format)
+    return data.getvalue()
+
+
+def alto_page(page_attributes, print_space_attributes="", namespace=ALTO_V3):
+    """A small ALTO page: an illustration and a block of 3 lines of 3 words each"""
+    lines = []
+    for line in range(3):
+        strings = "".join(f'<String ID="s{line}_{word}" CONTENT="mot{word}" HPOS="{10 + word * 5}.5" '
+                          f'VPOS="{10 + line * 6}" WIDTH="4" HEIGHT="5"/><SP WIDTH="1"/>' for word in range(3))
+        lines.append(f'<TextLine ID="l{line}" HPOS="10" VPOS="{10 + line * 6}" WIDTH="30" HEIGHT="5">'
+                     f'<Shape><Polygon POINTS="10 {10 + line * 6} 40 {10 + line * 6} 40 {15 + line * 6}"/></Shape>'
+                     f'{strings}</TextLine>')
+    return (f'<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<alto xmlns="{namespace}" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+            f'<Description><MeasurementUnit>pixel</MeasurementUnit>'
+            f'<sourceImageInformation><fileName>source</fileName></sourceImageInformation></Description>'
+            f'<Layout><Page ID="Page1" {page_attributes}><PrintSpace {print_space_attributes}>'
+            f'<Illustration ID="i1" TYPE="image" HPOS="0" VPOS="0" WIDTH="20" HEIGHT="20" FILEID="x"/>'
+            f'<TextBlock ID="b1" HPOS="10" VPOS="10" WIDTH="30" HEIGHT="20">{"".join(lines)}</TextBlock>'
+            f'</PrintSpace></Page></Layout></alto>')
+
+
+def source_members(scenario, pages=2, alto=None, documents=None):
+    """Members (name -> bytes) of a source archive of a scenario
+
+    :param alto: content of every ALTO XML file (default: alto_page(), tkb: the example page)
+    :param documents: tkb only, directories of a multi-document export (default: a single document at the root)
+    """
+    members = {}
+    if scenario == "tkb":
+        with open(os.path.join(EXAMPLE, "mets.xml"), "rb") as fh:
+            mets = fh.read()
+        if alto is None:
+            with open(os.path.join(EXAMPLE, "alto", "PH 1858-520.xml"), "rb") as fh:
+                alto = fh.read()
+        for document in documents or [""]:
+            prefix = f"{document}/" if document else ""
+            members[f"{prefix}mets.xml"] = mets
+            members[f"{prefix}alto/PH 1858-520.xml"] = alto
+    elif scenario == "pdfalto":
+        alto = alto or alto_page('PHYSICAL_IMG_NR="1" WIDTH="60.0" HEIGHT="90.0"')
+        for index in range(pages):
+            members[f"doc/out/doc{index}.xml"] = alto
+            members[f"doc/out/doc{index}.xml_data/image-1.png"] = image(600, 900, "PNG")
+    else:
+        alto = alto or alto_page('WIDTH="100" HEIGHT="150"', 'HPOS="0" VPOS="0" WIDTH="100" HEIGHT="150"')
+        for index in range(pages):
+            members[f"limb/AD_PER_{index:04d}.xml"] = alto
+            members[f"limb/AD_PER_X_{index:04d}.jpg"] = image(300, 450, "JPEG")
+    return {name: data.encode("utf-8") if isinstance(data, str) else data for name, data in members.items()}
+
+
+@pytest.fixture
+def make_source(tmp_path):
+    """Write the source archive of a scenario: make_source(scenario, pages=2, alto=None, documents=None, kind="zip")
+
+    kind is "zip" or "tar.gz"; returns the path to the archive.
+    """
+    def make(scenario, pages=2, alto=None, documents=None, kind="zip"):
+        members = source_members(scenario, pages, alto, documents)
+        source = str(tmp_path / f"{scenario}.{kind}")
+        if kind == "zip":
+            with zipfile.ZipFile(source, "w") as ziph:
+                for name, data in members.items():
+                    ziph.writestr(name, data)
+        else:
+            with tarfile.open(source, "w:gz") as tar:
+                for name, data in members.items():
+                    info = tarfile.TarInfo(name)
+                    info.size = len(data)
+                    tar.addfile(info, io.BytesIO(data))
+        return source
+    return make
+
+
+@pytest.fixture
+def alto_v4():
+    """An ALTO 4 page, only told apart from other versions by its xsi:schemaLocation"""
+    with open(os.path.join(ROOT, "data", "altos", "alto_escriptorium.xml"), "rb") as fh:
+        return fh.read()
@@ -0,0 +1,62 @@
+import json
+import zipfile
+
+import pytest
+
+from aspyrelib.aspyre import AspyreArgs, CheckArchive
+from aspyrelib.manage import check
+
+
+@pytest.mark.parametrize("scenario", ["tkb", "pdfalto", "limb"])
+def test_ready_source(scenario, make_source):
+    report = check.check_archive(make_source(scenario), scenario)
+    assert report["archive"]["problems"] == []
+    assert report["summary"]["not_ready"] == 0 and report["summary"]["pages"] > 0
+    for record in report["pages"]:
+        assert record["ready"] and record["image"]
+
+
+def test_alto_4_declared_by_its_schema_location_is_ready(make_source, alto_v4):
+    # the converters detect the version from the same declarations (see test_engines.py)
+    report = check.check_archive(make_source("limb", pages=1, alto=alto_v4), "limb")
+    assert report["pages"][0]["problems"] == []
+    assert report["pages"][0]["alto_version"] == 4
+
+
+def test_page_problems_are_reported(make_source, tmp_path):
+    source = make_source("limb", pages=2)
+    broken = str(tmp_path / "broken.zip")
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(broken, "w") as dst:
+        for member in src.infolist():
+            data = src.read(member)
+            if member.filename == "limb/AD_PER_0000.xml":
+                data = data[:100]
+            if member.filename == "limb/AD_PER_X_0001.jpg":
+                continue
+            dst.writestr(member, data)
+    report = check.check_archive(broken, "limb")
+    records = {record["file"]: record for record in report["pages"]}
+    assert report["summary"] == {"pages": 2, "ready": 0, "not_ready": 2}
+    assert records["limb/AD_PER_0000.xml"]["problems"][0].startswith("Not well-formed XML")
+    assert records["limb/AD_PER_0001.xml"]["problems"]
+
+
+def test_missing_mets_fails_every_page(make_source, tmp_path):
+    source = make_source("tkb")
+    without_mets = str(tmp_path / "without_mets.zip")
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(without_mets, "w") as dst:
+        for member in src.infolist():
+            if member.filename != "mets.xml":
+                dst.writestr(member, src.read(member))
+    report = check.check_archive(without_mets, "tkb")
+    assert report["archive"]["problems"]
+    assert report["summary"]["ready"] == 0
+
+
+def test_check_mode_writes_the_readiness_report(make_source):
+    source = make_source("pdfalto")
+    args = AspyreArgs(scenario="pdfalto", source=source, check=True)
+    checked = CheckArchive(args)
+    assert args.execution_status == "Finished"
+    with open(checked.report_path, encoding="utf-8") as fh:
+        assert json.load(fh)["summary"] == {"pages": 2, "ready": 2, "not_ready": 0}
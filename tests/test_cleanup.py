@@ -0,0 +1,59 @@
+import json
+import os
+
+import pytest
+
+from aspyrelib import aspyre
+from aspyrelib.aspyre import AspyreArgs, LimbToEs, iter_convert
+
+
+def run_args(make_source, tmp_path):
+    return AspyreArgs(scenario="limb", source=make_source("limb"), destination=str(tmp_path / "out"),
+                      report=str(tmp_path / "report.json"), scratch=str(tmp_path / "scratch"))
+
+
+def finished_run(args, tmp_path):
+    """Control that the scratch space is gone and the report was written; return the status it records"""
+    assert args.scratch is not None and not os.path.exists(args.scratch.path)
+    with open(tmp_path / "report.json", encoding="utf-8") as fh:
+        return json.load(fh)["status"]
+
+
+def test_scenario_interrupted_by_an_error(make_source, tmp_path, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(aspyre, "convert_files", broken)
+    args = run_args(make_source, tmp_path)
+    with pytest.raises(RuntimeError):
+        LimbToEs(args)
+    assert finished_run(args, tmp_path) == "Failed"
+
+
+def test_reports_are_written_when_the_scratch_space_cannot_be_released(make_source, tmp_path, monkeypatch):
+    def broken(self):
+        raise OSError("busy")
+    monkeypatch.setattr(AspyreArgs, "release_scratch", broken)
+    args = run_args(make_source, tmp_path)
+    with pytest.raises(OSError):
+        LimbToEs(args)
+    with open(tmp_path / "report.json", encoding="utf-8") as fh:
+        assert json.load(fh)["status"] == "Finished"
+
+
+def test_iter_convert_stopped_early(make_source, tmp_path):
+    args = run_args(make_source, tmp_path)
+    pages = iter_convert(args, pack=False)
+    next(pages)
+    pages.close()
+    assert finished_run(args, tmp_path) == "Failed"
+    assert any("stopped iterating" in line for line in args.log)
+
+
+def test_iter_convert_interrupted_by_an_error(make_source, tmp_path, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(aspyre, "publish_page", broken)
+    args = run_args(make_source, tmp_path)
+    with pytest.raises(RuntimeError):
+        list(iter_convert(args))
+    assert finished_run(args, tmp_path) == "Failed"
@@ -0,0 +1,173 @@
+import json
+import multiprocessing
+import os
+import time
+
+from aspyrelib import aspyre
+from aspyrelib.aspyre import AspyreArgs, Coordinator, DistributedWorker, Merger
+from aspyrelib.utils import distributed
+
+
+def write_lease(shared, unit_id, owner, expires):
+    with open(distributed._lock_path(shared, unit_id), "w", encoding="utf-8") as fh:
+        json.dump({"owner": owner, "claimed": time.time(), "expires": expires}, fh)
+
+
+def read_lease(shared, unit_id):
+    with open(distributed._lock_path(shared, unit_id), "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def claim_after(barrier, shared, unit_id, results):
+    barrier.wait()
+    results.put(distributed.claim(shared, unit_id, 60))
+
+
+def claim_concurrently(shared, unit_id, workers=8):
+    context = multiprocessing.get_context("fork")
+    barrier, results = context.Barrier(workers), context.Queue()
+    processes = [context.Process(target=claim_after, args=(barrier, shared, unit_id, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    outcomes = [results.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join()
+    return outcomes
+
+
+def test_claim_free_unit(tmp_path):
+    shared = str(tmp_path)
+    distributed.prepare_shared(shared)
+    assert distributed.claim(shared, "unit-0", 60)
+    assert read_lease(shared, "unit-0")["owner"] == distributed.owner_id()
+    # the lease is held: claiming it again fails, even from the same process
+    assert not distributed.claim(shared, "unit-0", 60)
+
+
+def test_claim_race_has_one_winner(tmp_path):
+    shared = str(tmp_path)
+    distributed.prepare_shared(shared)
+    assert sorted(claim_concurrently(shared, "unit-0")) == [False] * 7 + [True]
+
+
+def test_expired_lease_race_has_one_winner(tmp_path):
+    shared = str(tmp_path)
+    distributed.prepare_shared(shared)
+    write_lease(shared, "unit-0", "dead-host:1", time.time() - 1)
+    assert sorted(claim_concurrently(shared, "unit-0")) == [False] * 7 + [True]
+    assert read_lease(shared, "unit-0")["expires"] > time.time()
+    assert not [name for name in os.listdir(os.path.join(shared, distributed.LOCKS_DIR)) if name != "unit-0.lock"]
+
+
+def test_live_lease_is_kept(tmp_path):
+    shared = str(tmp_path)
+    distributed.prepare_shared(shared)
+    write_lease(shared, "unit-0", "other-host:1", time.time() + 60)
+    assert not distributed.claim(shared, "unit-0", 60)
+    assert read_lease(shared, "unit-0")["owner"] == "other-host:1"
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    shared = str(tmp_path)
+    distributed.prepare_shared(shared)
+    write_lease(shared, "unit-0", "dead-host:1", time.time() - 1)
+    assert distributed.claim(shared, "unit-0", 60)
+    assert read_lease(shared, "unit-0")["owner"] == distributed.owner_id()
+
+
+def test_lease_renewed_during_takeover_is_put_back(tmp_path, monkeypatch):
+    shared = str(tmp_path)
+    distributed.prepare_shared(shared)
+    write_lease(shared, "unit-0", "slow-host:1", time.time() - 1)
+    rename = os.rename
+
+    def renew_then_rename(src, dst):
+        # the owner renews its lease between the expiry check and the rename
+        write_lease(shared, "unit-0", "slow-host:1", time.time() + 60)
+        rename(src, dst)
+
+    monkeypatch.setattr(distributed.os, "rename", renew_then_rename)
+    assert not distributed.claim(shared, "unit-0", 60)
+    assert read_lease(shared, "unit-0")["owner"] == "slow-host:1"
+    assert os.listdir(os.path.join(shared, distributed.LOCKS_DIR)) == ["unit-0.lock"]
+
+
+def test_renew(tmp_path):
+    shared = str(tmp_path)
+    distributed.prepare_shared(shared)
+    assert distributed.claim(shared, "unit-0", 1)
+    expires = read_lease(shared, "unit-0")["expires"]
+    assert distributed.renew(shared, "unit-0", 60)
+    assert read_lease(shared, "unit-0")["expires"] > expires + 30
+
+
+def test_renew_lost_lease(tmp_path):
+    shared = str(tmp_path)
+    distributed.prepare_shared(shared)
+    assert distributed.claim(shared, "unit-0", 60)
+    # the lease expired and another worker took the unit over
+    write_lease(shared, "unit-0", "other-host:1", time.time() + 60)
+    assert not distributed.renew(shared, "unit-0", 60)
+    assert read_lease(shared, "unit-0")["owner"] == "other-host:1"
+    os.remove(distributed._lock_path(shared, "unit-0"))
+    assert not distributed.renew(shared, "unit-0", 60)
+
+
+def test_lease_keeper_renews_on_a_timer(tmp_path):
+    shared = str(tmp_path)
+    distributed.prepare_shared(shared)
+    assert distributed.claim(shared, "unit-0", 60)
+    with distributed.LeaseKeeper(shared, "unit-0", 60, interval=0.05) as lease:
+        time.sleep(0.3)
+    assert lease.renewals >= 2 and not lease.lost
+    assert not lease.thread.is_alive()
+
+
+def test_lease_keeper_notices_a_lost_lease(tmp_path):
+    shared = str(tmp_path)
+    distributed.prepare_shared(shared)
+    assert distributed.claim(shared, "unit-0", 60)
+    write_lease(shared, "unit-0", "other-host:1", time.time() + 60)
+    with distributed.LeaseKeeper(shared, "unit-0", 60, interval=0.05) as lease:
+        time.sleep(0.2)
+    assert lease.lost and lease.renewals == 0
+
+
+def test_lease_is_kept_during_a_slow_page(make_source, tmp_path, monkeypatch):
+    shared = str(tmp_path / "shared")
+    args = AspyreArgs(scenario="limb", source=make_source("limb", pages=1), distributed_role="coordinate",
+                      shared=shared, lease=0.6)
+    Coordinator(args)
+    handle_a_file = aspyre.HANDLERS["limb"]
+    remaining = []
+
+    def slow(file, scenario_obj):
+        # longer than the lease, without any progress in the meantime
+        time.sleep(1.0)
+        remaining.append(read_lease(shared, "unit_000001")["expires"] - time.time())
+        return handle_a_file(file, scenario_obj)
+
+    monkeypatch.setitem(aspyre.HANDLERS, "limb", slow)
+    worker = DistributedWorker(AspyreArgs(distributed_role="work", shared=shared, lease=0.6), poll_interval=0.1)
+    assert remaining and remaining[0] > 0
+    assert worker.units_done == ["unit_000001"]
+
+
+def test_shared_directory_mounted_elsewhere(make_source, tmp_path):
+    shared = tmp_path / "mnt" / "shared"
+    Coordinator(AspyreArgs(scenario="limb", source=make_source("limb", pages=3), distributed_role="coordinate",
+                           shared=str(shared), unit_pages=2))
+    with open(shared / distributed.MANIFEST_NAME, encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    paths = [manifest["unzipped_source"]] + manifest["image_files"] \
+        + [page for unit in manifest["units"] for page in unit["pages"]]
+    assert not any(os.path.isabs(path) for path in paths)
+    # another host mounts the shared directory somewhere else
+    moved = tmp_path / "elsewhere"
+    os.rename(shared, moved)
+    worker = DistributedWorker(AspyreArgs(distributed_role="work", shared=str(moved)), poll_interval=0.1)
+    assert worker.args.execution_status == "Finished" and len(worker.units_done) == 2
+    merger = Merger(AspyreArgs(distributed_role="merge", shared=str(moved), destination=str(tmp_path / "out")))
+    assert merger.args.execution_status == "Finished"
+    assert merger.args.metrics.pages_processed == 3
@@ -0,0 +1,52 @@
+import os
+
+from aspyrelib.aspyre import AspyreArgs, Coordinator, TkbToEs, iter_convert
+from aspyrelib.manage import check
+
+DOCUMENTS = ["export/docA", "export/docB"]
+
+
+def test_batch_converts_every_document(make_source, tmp_path):
+    args = AspyreArgs(scenario="tkb", source=make_source("tkb", documents=DOCUMENTS), destination=str(tmp_path / "out"))
+    TkbToEs(args)
+    assert args.execution_status == "Finished"
+    for name in ("docA", "docB"):
+        assert os.listdir(tmp_path / "out" / name) == ["PH 1858-520.xml"]
+
+
+def test_iter_convert_converts_every_document(make_source, tmp_path):
+    source = make_source("tkb", documents=DOCUMENTS)
+    args = AspyreArgs(scenario="tkb", source=source, destination=str(tmp_path / "out"))
+    pages = list(iter_convert(args, read_output=True))
+    assert args.execution_status == "Finished"
+    assert [page.status for page in pages] == ["processed", "processed"]
+    assert sorted(os.path.relpath(page.output, tmp_path / "out") for page in pages) == \
+        [os.path.join("docA", "PH 1858-520.xml"), os.path.join("docB", "PH 1858-520.xml")]
+    assert all(page.image == "PH 1858-520.jpg" and page.data for page in pages)
+    # one archive per document, as with TkbToEs
+    assert sorted(name for name in os.listdir(tmp_path) if name.startswith("aspyre_")) == \
+        ["aspyre_tkb_docA.zip", "aspyre_tkb_docB.zip"]
+
+
+def test_single_document_in_a_directory(make_source, tmp_path):
+    args = AspyreArgs(scenario="tkb", source=make_source("tkb", documents=["export/docA"]),
+                      destination=str(tmp_path / "out"))
+    pages = list(iter_convert(args, pack=False))
+    assert [page.status for page in pages] == ["processed"]
+    assert os.listdir(tmp_path / "out") == ["PH 1858-520.xml"]
+
+
+def test_check_pairs_the_pages_of_each_document(make_source):
+    report = check.check_archive(make_source("tkb", documents=DOCUMENTS), "tkb")
+    assert report["archive"]["problems"] == [] and report["archive"]["documents"] == 2
+    assert [record["file"] for record in report["pages"]] == [f"{document}/alto/PH 1858-520.xml"
+                                                               for document in DOCUMENTS]
+    assert all(record["ready"] and record["image"] == "PH 1858-520.jpg" for record in report["pages"])
+
+
+def test_distributed_job_rejects_several_documents(make_source, tmp_path):
+    args = AspyreArgs(scenario="tkb", source=make_source("tkb", documents=DOCUMENTS),
+                      distributed_role="coordinate", shared=str(tmp_path / "shared"))
+    coordinator = Coordinator(args)
+    assert args.execution_status == "Failed" and coordinator.manifest_path is None
+    assert any("multi-document" in line for line in args.log)
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+from lxml import etree
+
+from aspyrelib.aspyre import AspyreArgs, iter_convert
+
+# what the model engine keeps: the elements and attributes eScriptorium imports
+# (Tags, OCRProcessing, margins, SP and HYP are dropped, see manage/model.py)
+ELEMENTS = {"alto", "Description", "MeasurementUnit", "sourceImageInformation", "fileName", "Layout", "Page",
+            "PrintSpace", "TextBlock", "Illustration", "TextLine", "String", "Shape", "Polygon"}
+ATTRIBUTES = {"ID", "TYPE", "CONTENT", "PHYSICAL_IMG_NR", "HPOS", "VPOS", "WIDTH", "HEIGHT", "BASELINE", "POINTS"}
+
+
+def value(name, text):
+    try:
+        numbers = tuple(float(number) for number in text.split())
+    except ValueError:
+        return text
+    return numbers if name in ("BASELINE", "POINTS") else numbers[0]
+
+
+def normalize(element):
+    """Reduce a transformed page to the elements and attributes the model engine keeps"""
+    name = etree.QName(element).localname
+    attributes = {key: value(key, text) for key, text in element.attrib.items() if key in ATTRIBUTES}
+    children = [normalize(child) for child in element
+                if isinstance(child.tag, str) and etree.QName(child).localname in ELEMENTS]
+    return name, attributes, (element.text or "").strip(), children
+
+
+def convert(scenario, source, destination, engine):
+    args = AspyreArgs(scenario=scenario, source=source, destination=destination, engine=engine)
+    pages = {os.path.basename(page.file): page for page in iter_convert(args, read_output=True, pack=False)}
+    assert pages and all(page.status == "processed" for page in pages.values())
+    return {name: normalize(etree.fromstring(page.data)) for name, page in pages.items()}
+
+
+@pytest.mark.parametrize("scenario", ["tkb", "pdfalto", "limb"])
+def test_engines_produce_the_same_pages(scenario, make_source, tmp_path):
+    source = make_source(scenario)
+    soup = convert(scenario, source, str(tmp_path / "soup"), "soup")
+    model = convert(scenario, source, str(tmp_path / "model"), "model")
+    assert soup.keys() == model.keys()
+    for name in soup:
+        assert soup[name] == model[name], name
+
+
+@pytest.mark.parametrize("engine", ["soup", "model"])
+def test_alto_4_is_detected_from_the_schema_location(engine, make_source, alto_v4, tmp_path):
+    source = make_source("limb", pages=1, alto=alto_v4)
+    pages = convert("limb", source, str(tmp_path / engine), engine)
+    assert list(pages) == ["AD_PER_0000.xml"]
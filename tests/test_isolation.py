@@ -0,0 +1,39 @@
+import os
+import time
+
+import pytest
+
+from aspyrelib import aspyre
+from aspyrelib.aspyre import AspyreArgs, iter_convert
+from aspyrelib.utils import isolation
+
+pytestmark = pytest.mark.skipif(not isolation.isolation_available(), reason="isolated workers need fork")
+
+
+@pytest.fixture
+def misbehaving(monkeypatch):
+    """limb handler: the first page hangs, the second one allocates 512 MiB, the others convert normally"""
+    handle_a_file = aspyre.HANDLERS["limb"]
+
+    def handler(file, scenario_obj):
+        if file.endswith("0000.xml"):
+            time.sleep(60)
+        elif file.endswith("0001.xml"):
+            bytearray(512 * 1024 * 1024)
+        return handle_a_file(file, scenario_obj)
+
+    monkeypatch.setitem(aspyre.HANDLERS, "limb", handler)
+
+
+@pytest.mark.parametrize("kind", ["zip", "tar.gz"])
+def test_failing_pages_dont_stop_the_run(kind, make_source, tmp_path, misbehaving):
+    args = AspyreArgs(scenario="limb", source=make_source("limb", pages=4, kind=kind),
+                      destination=str(tmp_path / "out"), workers=1, timeout=1, max_memory=128)
+    start = time.monotonic()
+    pages = {os.path.basename(page.file): page for page in iter_convert(args, pack=False)}
+    assert time.monotonic() - start < 30
+    assert [pages[name].status for name in sorted(pages)] == ["failed", "failed", "processed", "processed"]
+    assert pages["AD_PER_0000.xml"].reason == "timed out after 1s"
+    assert "MemoryError" in pages["AD_PER_0001.xml"].reason
+    assert args.metrics.pages_failed == 2 and args.metrics.pages_processed == 2
+    assert sorted(os.listdir(args.destination)) == ["AD_PER_0002.xml", "AD_PER_0003.xml"]
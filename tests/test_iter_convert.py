@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from aspyrelib import aspyre
+from aspyrelib.aspyre import AspyreArgs, iter_convert
+
+
+@pytest.fixture
+def reversed_completion(monkeypatch):
+    """Pages complete in the reverse order of the source"""
+    iter_files = aspyre.iter_files
+
+    def reversed_files(*args, **kwargs):
+        yield from reversed(list(iter_files(*args, **kwargs)))
+
+    monkeypatch.setattr(aspyre, "iter_files", reversed_files)
+
+
+@pytest.mark.parametrize("ordered, indexes", [(True, [0, 1, 2]), (False, [2, 1, 0])])
+def test_pages_are_yielded_in_order_or_as_they_complete(ordered, indexes, make_source, tmp_path,
+                                                        reversed_completion):
+    args = AspyreArgs(scenario="limb", source=make_source("limb", pages=3), destination=str(tmp_path / "out"))
+    pages = list(iter_convert(args, ordered=ordered, pack=False))
+    # index: position of the page among the ALTO XML files of the source
+    assert [page.index for page in pages] == indexes
+    assert len({page.file for page in pages}) == 3
+    assert all(os.path.isfile(page.output) for page in pages)
+
+
+@pytest.mark.parametrize("kind", ["zip", "tar.gz"])
+def test_each_page_is_published_when_yielded(kind, make_source, tmp_path):
+    args = AspyreArgs(scenario="limb", source=make_source("limb", kind=kind), destination=str(tmp_path / "out"))
+    for page in iter_convert(args, read_output=True, pack=False):
+        assert page.status == "processed" and page.reason is None
+        assert os.path.dirname(page.output) == str(tmp_path / "out")
+        with open(page.output, "rb") as fh:
+            assert page.data == fh.read()
+        assert page.image == os.path.basename(page.file).replace("AD_PER_", "AD_PER_X_").replace(".xml", ".jpg")
+        assert page.image.encode() in page.data
+
+
+def test_output_is_not_read_by_default(make_source, tmp_path):
+    args = AspyreArgs(scenario="limb", source=make_source("limb"), destination=str(tmp_path / "out"))
+    assert [page.data for page in iter_convert(args, pack=False)] == [None, None]
+
+
+@pytest.mark.parametrize("pack", [True, False])
+def test_archive_is_only_created_with_pack(pack, make_source, tmp_path):
+    args = AspyreArgs(scenario="limb", source=make_source("limb"), destination=str(tmp_path / "out" / "alto"))
+    assert len(list(iter_convert(args, pack=pack))) == 2
+    assert args.execution_status == "Finished"
+    assert os.path.isfile(tmp_path / "out" / "aspyre_limb.zip") == pack
+    assert sorted(os.listdir(tmp_path / "out" / "alto")) == ["AD_PER_0000.xml", "AD_PER_0001.xml"]
+
+
+def test_failed_page_is_yielded(make_source, tmp_path, monkeypatch):
+    handle_a_file = aspyre.HANDLERS["limb"]
+
+    def handler(file, scenario_obj):
+        if file.endswith("0001.xml"):
+            raise ValueError("no PrintSpace")
+        return handle_a_file(file, scenario_obj)
+
+    monkeypatch.setitem(aspyre.HANDLERS, "limb", handler)
+    args = AspyreArgs(scenario="limb", source=make_source("limb"), destination=str(tmp_path / "out"))
+    first, second = iter_convert(args, read_output=True, pack=False)
+    assert first.status == "processed"
+    assert (second.status, second.reason, second.output, second.data) == \
+        ("failed", "ValueError: no PrintSpace", None, None)
+
+
+def test_invalid_arguments_yield_nothing(tmp_path):
+    args = AspyreArgs(scenario="limb", source=None, destination=str(tmp_path / "out"))
+    assert list(iter_convert(args)) == []
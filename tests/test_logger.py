@@ -0,0 +1,54 @@
+import io
+import os
+
+from aspyrelib.manage import zip
+from aspyrelib.utils import logger
+
+
+def console_logger(**kwargs):
+    console = io.StringIO()
+    log = logger.Logger(**kwargs)
+    log.configure(console=console)
+    return log, console
+
+
+def test_repeated_info_is_displayed_once():
+    log, console = console_logger()
+    for _ in range(3):
+        log.report("Unpacking the source", "I")
+    log.flush()
+    assert console.getvalue().splitlines() == ["[I] Unpacking the source",
+                                               "[I] Unpacking the source (repeated 2 more time(s))"]
+
+
+def test_repeated_errors_are_all_displayed():
+    log, console = console_logger()
+    for _ in range(3):
+        log.report("No image paired with page.xml", "E")
+    log.flush()
+    assert console.getvalue().count("No image paired with page.xml") == 3
+    assert "repeated" not in console.getvalue()
+
+
+def test_rate_limit_only_applies_to_info_and_warnings():
+    log, console = console_logger(rate_limit=2, rate_period=60.0)
+    for page in range(5):
+        log.report(f"page{page}.xml: missing baseline", "W")
+        log.report(f"page{page}.xml: can't be read", "E")
+    log.flush()
+    lines = console.getvalue().splitlines()
+    assert sum("missing baseline" in line for line in lines) == 2
+    assert sum("can't be read" in line for line in lines) == 5
+    assert any("3 more message(s) not displayed" in line for line in lines)
+
+
+def test_zip_errors_are_reported(tmp_path, capsys):
+    (tmp_path / "out").mkdir()
+    (tmp_path / "out" / "page.xml").write_text("<alto/>")
+    (tmp_path / "blocked").write_text("a file where the archive's directory should be")
+    mark = logger.get_logger().mark()
+    assert zip.zip_dir(str(tmp_path / "out"), "source", output_dir=str(tmp_path / "blocked")) is None
+    logger.get_logger().flush()
+    errors = [record for record in logger.get_logger().records_since(mark) if record["code"] == "E"]
+    assert errors and "blocked" in errors[0]["message"]
+    assert f"[E] {errors[0]['message'].splitlines()[0]}" in capsys.readouterr().out
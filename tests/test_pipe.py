@@ -0,0 +1,76 @@
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+from lxml import etree
+
+from aspyrelib.aspyre import AspyreArgs, iter_convert
+from aspyrelib.manage import pipe
+from conftest import ROOT, source_members
+
+ALTO = "{http://www.loc.gov/standards/alto/ns-v4#}"
+
+
+def filter_page(scenario, document, image_size=None, vpadding=0):
+    output = io.BytesIO()
+    pipe.filter_document(io.BytesIO(document), output, scenario, "page.jpg", image_size=image_size,
+                         vpadding=vpadding)
+    return etree.fromstring(output.getvalue())
+
+
+def page_of(scenario):
+    return next(data for name, data in source_members(scenario).items() if name.endswith(".xml")
+                and name != "mets.xml")
+
+
+def test_limb_page_is_scaled_to_the_image():
+    root = filter_page("limb", page_of("limb"), image_size=(300, 450), vpadding=2)
+    assert root.findtext(f".//{ALTO}fileName") == "page.jpg"
+    line = root.find(f".//{ALTO}TextLine")
+    assert (float(line.get("HPOS")), float(line.get("WIDTH"))) == (30, 90)  # page of 100 x 150
+    assert float(root.find(f".//{ALTO}String").get("VPOS")) == 32
+    assert len(root.findall(f".//{ALTO}String")) == 9
+
+
+@pytest.mark.parametrize("scenario, image_size", [("tkb", None), ("pdfalto", (600, 900)), ("limb", (300, 450))])
+def test_same_output_as_the_model_engine(scenario, image_size, make_source, tmp_path):
+    args = AspyreArgs(scenario=scenario, source=make_source(scenario, pages=1), destination=str(tmp_path / "out"),
+                      engine="model")
+    page = next(iter_convert(args, read_output=True, pack=False))
+    root = filter_page(scenario, page_of(scenario), image_size=image_size)
+    root.find(f".//{ALTO}fileName").text = page.image
+    assert etree.tostring(root) == etree.tostring(etree.fromstring(page.data))
+
+
+def test_tkb_baselines_are_extrapolated():
+    root = filter_page("tkb", page_of("tkb"))
+    baselines = [line.get("BASELINE") for line in root.iter(f"{ALTO}TextLine")]
+    assert baselines and all(baselines)
+
+
+def test_alto_4_declared_by_its_schema_location_is_converted(alto_v4):
+    # same detection as the converters and check mode (see test_engines.py and test_check.py)
+    root = filter_page("limb", alto_v4, image_size=(1000, 1000))
+    assert root.find(f".//{ALTO}TextLine") is not None
+
+
+def test_errors():
+    with pytest.raises(ValueError, match="image size is required"):
+        filter_page("limb", page_of("limb"))
+    with pytest.raises(ValueError, match="Unsupported ALTO version"):
+        filter_page("pdfalto", page_of("limb").replace(b"ns-v3#", b"ns-v9#"), image_size=(10, 10))
+    with pytest.raises(ValueError):
+        pipe.parse_image_size("300")
+
+
+def test_filter_mode_reads_stdin_and_writes_stdout():
+    completed = subprocess.run([sys.executable, os.path.join(ROOT, "aspyre", "run.py"), "-f", "-sc", "limb",
+                                "-in", "page.jpg", "-is", "300x450"], input=page_of("limb"), capture_output=True)
+    assert completed.returncode == 0, completed.stderr
+    root = etree.fromstring(completed.stdout)
+    assert root.findtext(f".//{ALTO}fileName") == "page.jpg"
+    completed = subprocess.run([sys.executable, os.path.join(ROOT, "aspyre", "run.py"), "-f", "-sc", "limb",
+                                "-in", "page.jpg"], input=page_of("limb"), capture_output=True)
+    assert completed.returncode == 1 and completed.stdout == b""
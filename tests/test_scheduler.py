@@ -0,0 +1,34 @@
+from aspyrelib.utils import scheduler
+
+MIB = 1024 * 1024
+
+
+def test_small_pages_are_shared_between_the_workers():
+    files = [f"page{i}.xml" for i in range(40)]
+    sizes = {file: 1000 for file in files}
+    tasks = scheduler.plan_tasks(files, sizes, workers=8)
+    assert len(tasks) == 8 and all(len(task) == 5 for task in tasks)
+    assert sorted(file for task in tasks for file in task) == sorted(files)
+
+
+def test_batches_keep_their_upper_bounds():
+    files = [f"page{i}.xml" for i in range(100)]
+    assert len(scheduler.plan_tasks(files, {file: 1000 for file in files}, workers=1)) == 4  # 32 pages at most
+    assert len(scheduler.plan_tasks(files, {file: 60000 for file in files}, workers=1)) == 6  # 1 MiB (17 pages) at most
+
+
+def test_large_pages_come_first_on_their_own():
+    sizes = {"small.xml": 1000, "large.xml": 10 * MIB, "medium.xml": MIB}
+    assert scheduler.plan_tasks(list(sizes), sizes, workers=2) == ["large.xml", "medium.xml", "small.xml"]
+
+
+def test_workers_fit_the_expected_memory():
+    sizes = [10 * MIB] * 16
+    per_page = scheduler.page_memory(10 * MIB)
+    workers, per_worker = scheduler.choose_workers(sizes, cores=16, memory=4 * per_page / scheduler.MEMORY_SHARE)
+    assert (workers, per_worker) == (4, per_page)
+    # the memory limit caps the estimate instead of replacing it
+    workers, per_worker = scheduler.choose_workers(sizes, max_memory=MIB, cores=16, memory=per_page)
+    assert per_worker == scheduler.WORKER_BASELINE + MIB
+    workers, per_worker = scheduler.choose_workers([1000], max_memory=1024 * MIB, cores=16, memory=per_page)
+    assert per_worker == scheduler.page_memory(1000)
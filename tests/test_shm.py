@@ -0,0 +1,133 @@
+import io
+import multiprocessing
+import os
+
+import pytest
+
+from aspyrelib import aspyre
+from aspyrelib.aspyre import AspyreArgs, iter_convert
+from aspyrelib.utils import shm
+
+
+def exists(name):
+    try:
+        segment = shm.shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return False
+    segment.close()
+    return True
+
+
+@pytest.fixture
+def pool():
+    segments = shm.SegmentPool(idle=1)
+    yield segments
+    segments.close()
+
+
+def test_segment_capacity():
+    assert shm.segment_capacity(1) == shm.MIN_SEGMENT
+    assert shm.segment_capacity(shm.MIN_SEGMENT + 1) == 2 * shm.MIN_SEGMENT
+
+
+def test_segments_are_recycled(pool):
+    first = pool.load(io.BytesIO(b"page one"), 8)
+    pool.release(first)
+    second = pool.load(io.BytesIO(b"page 2"), 6)
+    assert second[0] == first[0] and (pool.created, pool.reused) == (1, 1)
+    with shm.serve_page("page.xml", second):
+        assert shm.page_reader("page.xml").readall() == b"page 2"
+        assert shm.page_size("page.xml") == 6
+    assert shm.page_reader("page.xml") is None
+
+
+def test_larger_page_gets_a_larger_segment(pool):
+    pool.release(pool.load(io.BytesIO(b"x"), 1))
+    size = shm.MIN_SEGMENT + 1
+    handle = pool.load(io.BytesIO(b"y" * size), size)
+    assert pool.created == 2 and pool.reused == 0
+    assert pool.segments[handle[0]].size >= size
+
+
+def test_pool_exhausted(pool):
+    handles = [pool.load(io.BytesIO(b"page"), 4) for _ in range(3)]
+    assert pool.created == 3  # no idle segment: one more is created for each page in flight
+    for handle in handles:
+        pool.release(handle)
+    # only idle=1 segment is kept, the others are destroyed
+    assert [exists(name) for name, _ in handles] == [True, False, False]
+    pool.close()
+    assert not exists(handles[0][0])
+
+
+def test_short_read_gives_the_segment_back(pool):
+    with pytest.raises(EOFError):
+        pool.load(io.BytesIO(b"abc"), 10)
+    assert len(pool.idle) == 1
+
+
+def test_segments_survive_a_dead_worker_and_are_destroyed_by_the_pool(pool):
+    handle = pool.load(io.BytesIO(b"page"), 4)
+
+    def worker():
+        with shm.serve_page("page.xml", handle):
+            os._exit(1)
+
+    process = multiprocessing.get_context("fork").Process(target=worker)
+    process.start()
+    process.join()
+    assert process.exitcode == 1 and exists(handle[0])
+    pool.release(handle)
+    pool.close()
+    assert not exists(handle[0])
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    """Every SegmentPool created by aspyre during the test"""
+    created = []
+
+    class RecordedPool(shm.SegmentPool):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            created.append(self)
+            self.names = []
+
+        def acquire(self, size):
+            segment = super().acquire(size)
+            self.names.append(segment.name)
+            return segment
+
+    monkeypatch.setattr(shm, "SegmentPool", RecordedPool)
+    return created
+
+
+def test_run_continues_when_a_worker_dies(make_source, tmp_path, monkeypatch, pools):
+    handle_a_file = aspyre.HANDLERS["limb"]
+
+    def dying(file, scenario_obj):
+        if file.endswith("0001.xml"):
+            os._exit(1)
+        return handle_a_file(file, scenario_obj)
+
+    monkeypatch.setitem(aspyre.HANDLERS, "limb", dying)
+    args = AspyreArgs(scenario="limb", source=make_source("limb", pages=3, kind="tar.gz"),
+                      destination=str(tmp_path / "out"), workers=1)
+    statuses = {os.path.basename(page.file): page.status for page in iter_convert(args, pack=False)}
+    assert statuses == {"AD_PER_0000.xml": "processed", "AD_PER_0001.xml": "failed",
+                        "AD_PER_0002.xml": "processed"}
+    assert pools and pools[0].names
+    assert not any(exists(name) for name in pools[0].names)
+
+
+def test_pages_are_unpacked_when_shared_memory_is_full(make_source, tmp_path, monkeypatch, pools):
+    def full(*args, create=False, **kwargs):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(shm.shared_memory, "SharedMemory", full)
+    args = AspyreArgs(scenario="limb", source=make_source("limb", kind="tar.gz"),
+                      destination=str(tmp_path / "out"), workers=1)
+    pages = list(iter_convert(args, pack=False))
+    assert [page.status for page in pages] == ["processed", "processed"]
+    assert args.execution_status == "Finished"
+    assert any("Couldn't hand" in line for line in args.log)
@@ -0,0 +1,74 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from lxml import etree
+
+from aspyrelib.aspyre import AspyreArgs, iter_convert
+from aspyrelib.manage import sidecar
+from conftest import alto_page
+
+# the first line of each page has a baseline
+ALTO = alto_page('WIDTH="100" HEIGHT="150"', 'HPOS="0" VPOS="0" WIDTH="100" HEIGHT="150"').replace(
+    '<TextLine ID="l0" ', '<TextLine ID="l0" BASELINE="10 14 40 14" ')
+
+
+def lines_of(output):
+    """id, text, box, baseline and polygon of each TextLine of a transformed file"""
+    lines = []
+    for line in etree.parse(output).iter("{*}TextLine"):
+        polygon = line.find("{*}Shape/{*}Polygon")
+        lines.append((line.get("ID"), " ".join(s.get("CONTENT") for s in line.iter("{*}String")),
+                      [float(line.get(name)) for name in ("HPOS", "VPOS", "WIDTH", "HEIGHT")],
+                      [float(v) for v in line.get("BASELINE", "").split()],
+                      [float(v) for v in polygon.get("POINTS").split()]))
+    return lines
+
+
+def ragged(data, name, index):
+    offsets = data[f"{name}_offsets"]
+    return data[f"{name}_coords"][offsets[index]:offsets[index + 1]].tolist()
+
+
+@pytest.mark.parametrize("engine", ["soup", "model"])
+@pytest.mark.parametrize("kind, workers", [("zip", None), ("tar.gz", 1)])
+def test_sidecars_describe_the_transformed_lines(engine, kind, workers, make_source, tmp_path):
+    args = AspyreArgs(scenario="limb", source=make_source("limb", alto=ALTO, kind=kind),
+                      destination=str(tmp_path / "out"), engine=engine, sidecars=["text", "geometry"],
+                      workers=workers)
+    pages = list(iter_convert(args, pack=False))
+    assert len(pages) == 2
+    for page in pages:
+        paths = sidecar.sidecar_paths(page.output)
+        expected = lines_of(page.output)
+        name = os.path.basename(page.output)
+        with open(paths["text"], encoding="utf-8") as fh:
+            records = [json.loads(line) for line in fh]
+        assert [(r["line"], r["id"], r["text"]) for r in records] == \
+            [(number, line[0], line[1]) for number, line in enumerate(expected)]
+        assert {(r["page"], r["image"]) for r in records} == {(name, page.image)}
+        with np.load(paths["geometry"]) as data:
+            assert str(data["page"]) == name and str(data["image"]) == page.image
+            assert data["ids"].tolist() == [line[0] for line in expected]
+            assert data["boxes"].tolist() == [line[2] for line in expected]
+            for index, line in enumerate(expected):
+                assert ragged(data, "baseline", index) == line[3]
+                assert ragged(data, "polygon", index) == line[4]
+        # coordinates are those of the transformed page (x3 from the source)
+        assert expected[0][3] == [30.0, 42.0, 120.0, 42.0]
+
+
+def test_only_the_requested_sidecars_are_written(make_source, tmp_path):
+    args = AspyreArgs(scenario="limb", source=make_source("limb", pages=1), destination=str(tmp_path / "out"),
+                      sidecars=["text"])
+    page, = iter_convert(args, pack=False)
+    paths = sidecar.sidecar_paths(page.output)
+    assert os.path.isfile(paths["text"]) and not os.path.exists(paths["geometry"])
+
+
+def test_unknown_sidecar(make_source, tmp_path):
+    args = AspyreArgs(scenario="limb", source=make_source("limb"), destination=str(tmp_path / "out"),
+                      sidecars=["text", "pdf"])
+    assert args.execution_status == "Failed"
+    assert any("pdf: not valid sidecar" in line for line in args.log)
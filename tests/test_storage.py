@@ -0,0 +1,121 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from aspyrelib.aspyre import AspyreArgs, LimbToEs
+from aspyrelib.utils import storage
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """An empty object store with a 'bucket' bucket, configured for the test only"""
+    monkeypatch.setattr(storage, "_store_root", None)
+    monkeypatch.setattr(storage, "_stores", {})
+    monkeypatch.setattr(storage, "_released", dict.fromkeys(storage._released, 0))
+    root = tmp_path / "store"
+    (root / "bucket").mkdir(parents=True)
+    storage.configure(str(root))
+    return root
+
+
+@pytest.mark.parametrize("path, bucket, key", [
+    ("store://bucket/a/b.zip", "bucket", "a/b.zip"),
+    ("store://bucket/", "bucket", ""),
+    ("store://bucket", "bucket", ""),
+])
+def test_split_url(path, bucket, key):
+    assert storage.split_url(path) == (bucket, key)
+
+
+def test_url_without_bucket():
+    with pytest.raises(ValueError):
+        storage.split_url("store:///key")
+
+
+def test_join_and_parent():
+    assert storage.join("store://bucket/out/", "doc", "page.xml") == "store://bucket/out/doc/page.xml"
+    assert storage.parent("store://bucket/out/page.xml") == "store://bucket/out"
+    assert storage.parent("store://bucket") == "store://bucket"
+    assert storage.join("out", "page.xml") == os.path.join("out", "page.xml")
+
+
+def test_no_store_configured(monkeypatch):
+    monkeypatch.setattr(storage, "_store_root", None)
+    with pytest.raises(ValueError):
+        storage.open_read("store://bucket/key")
+    assert not storage.is_dir("store://bucket")
+
+
+@pytest.mark.parametrize("remote", [False, True])
+def test_write_then_read(remote, store, tmp_path):
+    path = "store://bucket/out/data.bin" if remote else str(tmp_path / "out" / "data.bin")
+    data = bytes(range(256)) * (storage.BLOCK_SIZE // 100)
+    with storage.open_write(path) as fh:
+        fh.write(data)
+    assert storage.size(path) == len(data)
+    with storage.open_read(path) as fh:
+        fh.seek(storage.BLOCK_SIZE - 10)
+        assert fh.read(20) == data[storage.BLOCK_SIZE - 10:storage.BLOCK_SIZE + 10]
+        fh.seek(-5, os.SEEK_END)
+        assert fh.read() == data[-5:]
+
+
+@pytest.mark.parametrize("remote", [False, True])
+def test_aborted_write_keeps_the_previous_version(remote, store, tmp_path):
+    path = "store://bucket/page.xml" if remote else str(tmp_path / "page.xml")
+    with storage.open_write(path) as fh:
+        fh.write(b"first")
+    with pytest.raises(RuntimeError):
+        with storage.open_write(path) as fh:
+            fh.write(b"second")
+            raise RuntimeError("upload interrupted")
+    with storage.open_read(path) as fh:
+        assert fh.read() == b"first"
+    # no partial upload is left behind
+    uploads = store / "bucket" / storage.UPLOADS_DIR if remote else tmp_path
+    assert not [name for name in os.listdir(uploads) if name.endswith(".tmp") or remote]
+
+
+def test_neighbouring_ranges_are_read_in_one_request():
+    requests = []
+
+    data = bytes(i % 256 for i in range(300_000))
+
+    def read_range(start, length):
+        requests.append((start, length))
+        return data[start:start + length]
+
+    ranges = [(0, 4), (100, 4), (10, 2), (200_000, 3)]
+    results = storage.read_ranges_from(read_range, ranges, gap=1000)
+    assert results == [data[start:start + length] for start, length in ranges]
+    assert requests == [(0, 104), (200_000, 3)]
+
+
+def test_usage_since_a_snapshot(store):
+    storage.put_file(__file__, "store://bucket")
+    before = storage.usage()
+    assert before["requests"] == 1 and before["bytes_written"] == os.path.getsize(__file__)
+    storage.size(f"store://bucket/{os.path.basename(__file__)}")
+    assert storage.usage(since=before) == {"requests": 1, "bytes_read": 0, "bytes_written": 0}
+    # reconfiguring the store doesn't lose the requests already made
+    storage.configure(str(store))
+    assert storage.usage(since=before)["requests"] == 1
+
+
+def test_each_run_reports_its_own_usage(store, make_source, tmp_path):
+    shutil.copy(make_source("limb"), store / "bucket" / "limb.zip")
+    usages = []
+    for run in range(2):
+        report = str(tmp_path / f"report{run}.json")
+        args = AspyreArgs(scenario="limb", source="store://bucket/limb.zip", destination="store://bucket/out",
+                          report=report)
+        LimbToEs(args)
+        assert args.execution_status == "Finished"
+        with open(report, encoding="utf-8") as fh:
+            usages.append(json.load(fh)["storage"])
+    assert usages[0] == usages[1]
+    assert usages[0]["bytes_read"] >= os.path.getsize(store / "bucket" / "limb.zip")
+    assert sorted(os.listdir(store / "bucket")) == [".uploads", "aspyre_limb.zip", "limb.zip",
+                                                     "out%2FAD_PER_0000.xml", "out%2FAD_PER_0001.xml"]
@@ -0,0 +1,59 @@
+import tarfile
+
+import pytest
+
+from aspyrelib.manage import stream
+
+
+def member(name, kind=tarfile.REGTYPE):
+    info = tarfile.TarInfo(name)
+    info.type = kind
+    if kind == tarfile.SYMTYPE:
+        info.linkname = "/etc/passwd"
+    return info
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("doc/alto/page.xml", "doc/alto/page.xml"),
+    ("./doc//alto/page.xml", "doc/alto/page.xml"),
+    ("doc\\alto\\page.xml", "doc/alto/page.xml"),
+    ("doc/../page.xml", "page.xml"),
+])
+def test_regular_files_are_kept(name, expected):
+    assert stream.safe_member_name(member(name)) == expected
+
+
+@pytest.mark.parametrize("name", [
+    "/etc/passwd",
+    "\\etc\\passwd",
+    "..",
+    "../page.xml",
+    "doc/../../page.xml",
+    "..\\page.xml",
+    ".",
+    "./",
+])
+def test_paths_out_of_the_destination_are_refused(name):
+    assert stream.safe_member_name(member(name)) is None
+
+
+@pytest.mark.parametrize("kind", [tarfile.SYMTYPE, tarfile.LNKTYPE, tarfile.DIRTYPE, tarfile.CHRTYPE,
+                                  tarfile.BLKTYPE, tarfile.FIFOTYPE])
+def test_other_members_are_refused(kind):
+    assert stream.safe_member_name(member("doc/alto/page.xml", kind)) is None
+
+
+@pytest.mark.parametrize("name, kind, document", [
+    ("mets.xml", "mets", ""),
+    ("alto/page.xml", "alto", ""),
+    ("export/doc 1/mets.xml", "mets", "export/doc 1"),
+    ("export/doc 1/alto/page.xml", "alto", "export/doc 1"),
+])
+def test_transkribus_documents(name, kind, document):
+    assert stream.classify(name, "tkb") == kind
+    assert stream.document_of(name) == document
+
+
+def test_transkribus_members_not_used():
+    assert stream.classify("page/page.xml", "tkb") is None
+    assert stream.classify("alto/page.jpg", "tkb") is None
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from aspyrelib.aspyre import AspyreArgs, LimbToEs, iter_convert
+from aspyrelib.manage import validation
+from conftest import alto_page
+
+ALTO_V4 = "http://www.loc.gov/standards/alto/ns-v4#"
+PRINT_SPACE = 'HPOS="0" VPOS="0" WIDTH="100" HEIGHT="150"'
+# ALTO 4 requires PHYSICAL_IMG_NR on Page: the transformed file of a page without it is invalid
+VALID = alto_page('WIDTH="100" HEIGHT="150" PHYSICAL_IMG_NR="1"', PRINT_SPACE)
+INVALID = alto_page('WIDTH="100" HEIGHT="150"', PRINT_SPACE)
+
+
+def run_report(make_source, tmp_path, alto, **kwargs):
+    report = tmp_path / "report.json"
+    args = AspyreArgs(scenario="limb", source=make_source("limb", alto=alto), destination=str(tmp_path / "out"),
+                      report=str(report), validate=True, **kwargs)
+    LimbToEs(args)
+    assert args.execution_status == "Finished"
+    with open(report, encoding="utf-8") as fh:
+        return json.load(fh)["validation"]
+
+
+@pytest.mark.parametrize("engine", ["soup", "model"])
+def test_valid_pages(engine, make_source, tmp_path):
+    assert run_report(make_source, tmp_path, VALID, engine=engine) == {"validated": 2, "invalid": 0, "failures": []}
+
+
+@pytest.mark.parametrize("engine", ["soup", "model"])
+def test_invalid_pages_are_reported(engine, make_source, tmp_path):
+    report = run_report(make_source, tmp_path, INVALID, engine=engine)
+    assert report["validated"] == 2 and report["invalid"] == 2
+    assert [failure["output"] for failure in report["failures"]] == ["AD_PER_0000.xml", "AD_PER_0001.xml"]
+    assert all("PHYSICAL_IMG_NR" in failure["errors"][0] for failure in report["failures"])
+
+
+def test_pages_validated_in_workers(make_source, tmp_path):
+    args = AspyreArgs(scenario="limb", source=make_source("limb", alto=INVALID, kind="tar.gz"),
+                      destination=str(tmp_path / "out"), validate=True, workers=1)
+    assert [page.status for page in iter_convert(args, pack=False)] == ["processed", "processed"]
+    assert args.metrics.pages_validated == 2 and len(args.metrics.invalid) == 2
+
+
+def test_malformed_file(tmp_path):
+    path = tmp_path / "page.xml"
+    path.write_text("<alto><Layout></alto>")
+    errors = validation.validate_file(str(path))
+    assert len(errors) == 1 and errors[0].startswith("line 1:")
+
+
+def test_errors_are_capped(tmp_path):
+    path = tmp_path / "page.xml"
+    # every String, TextLine and TextBlock has an invalid HPOS
+    path.write_text(alto_page('WIDTH="100" HEIGHT="150" PHYSICAL_IMG_NR="1"', PRINT_SPACE, namespace=ALTO_V4)
+                    .replace('HPOS="1', 'HPOS="x'))
+    assert len(validation.validate_file(str(path), max_errors=3)) == 3
+
+
+def test_schema_that_does_not_compile(make_source, tmp_path):
+    schema = tmp_path / "broken.xsd"
+    schema.write_text("<schema/>")
+    args = AspyreArgs(scenario="limb", source=make_source("limb"), destination=str(tmp_path / "out"),
+                      validate=True, schema=str(schema))
+    assert args.execution_status == "Failed"
+    assert any("Couldn't compile the ALTO schema" in line for line in args.log)
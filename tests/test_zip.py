@@ -0,0 +1,194 @@
+import json
+import os
+import zipfile
+
+import pytest
+
+from aspyrelib.aspyre import AspyreArgs, LimbToEs
+from aspyrelib.manage import zip
+from conftest import image
+
+
+def write_pages(source, pages):
+    for name, text in pages.items():
+        with open(os.path.join(source, name), "w", encoding="utf-8") as fh:
+            fh.write(text)
+
+
+def read_archive(path):
+    with zipfile.ZipFile(path) as ziph:
+        assert ziph.testzip() is None
+        return {member.filename: ziph.read(member) for member in ziph.infolist()}
+
+
+def read_bytes(path):
+    with open(path, "rb") as fh:
+        return fh.read()
+
+
+@pytest.fixture
+def archive(tmp_path):
+    source = tmp_path / "alto_escriptorium"
+    source.mkdir()
+    pages = {f"page{i}.xml": f"<alto>{i}</alto>" * 50 for i in range(4)}
+    write_pages(str(source), pages)
+    destination = str(tmp_path / "out.zip")
+    assert zip.update_zip(destination, str(source), sorted(pages)) == (4, 0, False)
+    return destination, str(source), sorted(pages)
+
+
+def test_unchanged_files_are_left_as_they_are(archive):
+    destination, source, files = archive
+    before = read_bytes(destination)
+    assert zip.update_zip(destination, source, files) == (0, 4, False)
+    assert read_bytes(destination) == before
+
+
+def test_changed_file_is_appended(archive):
+    destination, source, files = archive
+    size = os.path.getsize(destination)
+    write_pages(source, {"page1.xml": "<alto>changed</alto>"})
+    assert zip.update_zip(destination, source, files, max_waste=1) == (1, 3, False)
+    members = read_archive(destination)
+    assert len(members) == 4
+    assert members[f"{zip.ARCHIVE_ROOT}/page1.xml"] == b"<alto>changed</alto>"
+    assert members[f"{zip.ARCHIVE_ROOT}/page0.xml"] == b"<alto>0</alto>" * 50
+    # the former page1.xml and central directory are still in the file
+    with zipfile.ZipFile(destination) as ziph:
+        dead, _ = zip.waste(ziph)
+    assert dead > 0 and os.path.getsize(destination) > size
+
+
+def test_archive_is_compacted_above_max_waste(archive):
+    destination, source, files = archive
+    write_pages(source, {"page1.xml": "<alto>changed</alto>"})
+    assert zip.update_zip(destination, source, files, max_waste=0.01) == (1, 3, True)
+    with zipfile.ZipFile(destination) as ziph:
+        assert zip.waste(ziph)[0] == 0
+    members = read_archive(destination)
+    assert members[f"{zip.ARCHIVE_ROOT}/page1.xml"] == b"<alto>changed</alto>"
+    assert sorted(members) == [f"{zip.ARCHIVE_ROOT}/{file}" for file in files]
+    # a second update finds the compacted members unchanged
+    assert zip.update_zip(destination, source, files) == (0, 4, False)
+
+
+def test_failed_update_restores_the_archive(archive, monkeypatch):
+    destination, source, files = archive
+    before = read_bytes(destination)
+    write_pages(source, {"page1.xml": "<alto>changed</alto>", "page2.xml": "<alto>changed</alto>"})
+    write = zipfile.ZipFile.write
+    calls = []
+
+    def fail_on_second_file(self, *args, **kwargs):
+        calls.append(args)
+        if len(calls) == 2:
+            raise OSError("disk full")
+        return write(self, *args, **kwargs)
+
+    monkeypatch.setattr(zipfile.ZipFile, "write", fail_on_second_file)
+    with pytest.raises(OSError):
+        zip.update_zip(destination, source, files)
+    # the first changed file was appended before the failure: it is cut off again
+    assert len(calls) == 2
+    assert read_bytes(destination) == before
+
+
+def write_sized_pages(source, sizes):
+    write_pages(str(source), {name: "x" * size for name, size in sizes.items()})
+    return sorted(sizes)
+
+
+@pytest.mark.parametrize("max_pages, max_bytes, expected", [
+    (2, None, [["a.xml", "b.xml"], ["c.xml", "d.xml"], ["e.xml"]]),
+    (None, 250, [["a.xml", "b.xml"], ["c.xml"], ["d.xml", "e.xml"]]),
+    (1, 10000, [["a.xml"], ["b.xml"], ["c.xml"], ["d.xml"], ["e.xml"]]),
+    (None, None, [["a.xml", "b.xml", "c.xml", "d.xml", "e.xml"]]),
+])
+def test_plan_shards(max_pages, max_bytes, expected, tmp_path):
+    # c.xml is bigger than max_bytes on its own: it gets a shard of its own
+    files = write_sized_pages(tmp_path, {"a.xml": 100, "b.xml": 100, "c.xml": 300, "d.xml": 100, "e.xml": 100})
+    assert zip.plan_shards(str(tmp_path), files, max_pages=max_pages, max_bytes=max_bytes) == expected
+
+
+def test_shards_and_index(tmp_path):
+    source = tmp_path / "alto_escriptorium"
+    source.mkdir()
+    files = write_sized_pages(source, {f"page{i}.xml": 100 for i in range(5)})
+    index_path = zip.zip_dir_in_shards(str(source), str(tmp_path), "doc", max_pages=2)
+    assert index_path == str(tmp_path / "aspyre_doc_index.json")
+    with open(index_path, encoding="utf-8") as fh:
+        index = json.load(fh)
+    names = ["aspyre_doc_0001.zip", "aspyre_doc_0002.zip", "aspyre_doc_0003.zip"]
+    assert [(shard["file"], shard["pages"], shard["status"]) for shard in index["shards"]] == \
+        [(names[0], 2, "ready"), (names[1], 2, "ready"), (names[2], 1, "ready")]
+    assert index["root"] == zip.ARCHIVE_ROOT and index["max_pages"] == 2 and index["max_bytes"] is None
+    assert index["pages"] == {file: names[number // 2] for number, file in enumerate(files)}
+    for shard in index["shards"]:
+        assert shard["size"] == os.path.getsize(tmp_path / shard["file"])
+        members = read_archive(str(tmp_path / shard["file"]))
+        assert sorted(members) == sorted(f"{zip.ARCHIVE_ROOT}/{file}" for file, name in index["pages"].items()
+                                         if name == shard["file"])
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+@pytest.fixture
+def image_source(tmp_path):
+    """A source zip file with a stored JPEG and a deflated PNG"""
+    path = str(tmp_path / "source.zip")
+    with zipfile.ZipFile(path, "w") as ziph:
+        ziph.writestr("limb/a.jpg", image(30, 45, "JPEG"), compress_type=zipfile.ZIP_STORED)
+        ziph.writestr("limb/b.png", image(30, 45, "PNG"), compress_type=zipfile.ZIP_DEFLATED)
+    return path
+
+
+def test_images_are_copied_without_recompression(tmp_path, image_source):
+    source = tmp_path / "alto_escriptorium"
+    source.mkdir()
+    files = write_sized_pages(source, {"a.xml": 100, "b.xml": 100, "c.xml": 100})
+    images = {"a.xml": ("limb/a.jpg", "a.jpg"), "b.xml": ("limb/b.png", "b.png"),
+              "c.xml": ("limb/missing.jpg", "missing.jpg")}
+    destination = str(tmp_path / "out.zip")
+    zip.write_zip(destination, str(source), files, images=images, image_source=image_source)
+    with zipfile.ZipFile(image_source) as src, zipfile.ZipFile(destination) as dst:
+        assert dst.testzip() is None
+        for name in ("a.jpg", "b.png"):
+            original, copy = src.getinfo(f"limb/{name}"), dst.getinfo(f"{zip.ARCHIVE_ROOT}/{name}")
+            assert (copy.compress_type, copy.compress_size, copy.CRC) == \
+                (original.compress_type, original.compress_size, original.CRC)
+            assert dst.read(copy) == src.read(original)
+        # the missing image is skipped, the page is kept
+        assert f"{zip.ARCHIVE_ROOT}/missing.jpg" not in dst.namelist()
+        assert f"{zip.ARCHIVE_ROOT}/c.xml" in dst.namelist()
+
+
+def test_image_files_are_stored(tmp_path):
+    source = tmp_path / "alto_escriptorium"
+    source.mkdir()
+    files = write_sized_pages(source, {"a.xml": 100})
+    (tmp_path / "a.jpg").write_bytes(image(30, 45, "JPEG"))
+    destination = str(tmp_path / "out.zip")
+    zip.write_zip(destination, str(source), files, images={"a.xml": (str(tmp_path / "a.jpg"), "a.jpg")})
+    with zipfile.ZipFile(destination) as dst:
+        assert dst.getinfo(f"{zip.ARCHIVE_ROOT}/a.jpg").compress_type == zipfile.ZIP_STORED
+        assert dst.read(f"{zip.ARCHIVE_ROOT}/a.jpg") == (tmp_path / "a.jpg").read_bytes()
+
+
+def test_scenario_packs_the_source_images(make_source, tmp_path):
+    source = make_source("limb", pages=3)
+    args = AspyreArgs(scenario="limb", source=source, destination=str(tmp_path / "out" / "alto"),
+                      include_images=True, shard_pages=2)
+    LimbToEs(args)
+    assert args.execution_status == "Finished"
+    with open(tmp_path / "out" / "aspyre_limb_index.json", encoding="utf-8") as fh:
+        index = json.load(fh)
+    assert [shard["pages"] for shard in index["shards"]] == [2, 1]
+    with zipfile.ZipFile(source) as src:
+        for shard in index["shards"]:
+            with zipfile.ZipFile(tmp_path / "out" / shard["file"]) as dst:
+                pages = [name for name, file in index["pages"].items() if file == shard["file"]]
+                for page in pages:
+                    number = page[-8:-4]
+                    original = src.getinfo(f"limb/AD_PER_X_{number}.jpg")
+                    copy = dst.getinfo(f"{zip.ARCHIVE_ROOT}/AD_PER_X_{number}.jpg")
+                    assert (copy.compress_type, copy.CRC) == (original.compress_type, original.CRC)
+                assert len(dst.namelist()) == 2 * len(pages)